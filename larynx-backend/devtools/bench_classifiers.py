@@ -0,0 +1,313 @@
+"""
+Check and benchmark the email classifiers (services/email_classifiers.py).
+
+Builds a deterministic synthetic corpus (senders, subjects, headers and bodies made
+from the classifiers' own phrases, near misses, filler text and links), then:
+  - checks every verdict against devtools/classifier_corpus.json, recorded from
+    the classifiers as they were before they were compiled - any difference is a
+    regression
+  - runs a few whole Gmail messages through body extraction and the bot
+    detector (MESSAGE_CASES), for what depends on the MIME structure
+  - times the per-pattern re.search loops the classifiers used to run against the
+    compiled classifiers, per email (the bot detector and the customer detector)
+
+    python devtools/bench_classifiers.py
+    python devtools/bench_classifiers.py --size 5000 --repeat 5
+
+Only after an intended change in what gets classified how, re-record with --record.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import base64
+import email.utils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import email_classifiers as ec  # noqa: E402
+from services.mime_body import extract_body_and_html  # noqa: E402
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classifier_corpus.json")
+DEFAULT_SEED = 2024
+DEFAULT_SIZE = 3000
+
+FILLER = (
+    "the a we our your you it this that and or but so if then when with for to of in on at by "
+    "about order team help api info service support bot robot update alert receipt notes week "
+    "tomorrow friday chairs tables tent lights linens pedestals event venue party guests "
+    "photos budget invoice schedule plan quick question morning afternoon thanks hi hello "
+    "interested price cost rent rental delivery pickup fees wedding family vacation"
+).split()
+
+HUMAN_NAMES = ["Maria Lopez", "James Carter", "Aisha Khan", "Tom O'Neil", "Wei Chen", "Sam Patel"]
+HUMAN_LOCAL_PARTS = ["maria", "jcarter", "aisha.k", "tom.oneil", "weichen88", "sam", "steam", "robotics.lab"]
+DOMAINS = ["gmail.com", "yahoo.com", "acme.co", "eventsbyjo.com", "nvidia.com", "mailgun.org",
+           "sendgrid.net", "outlook.com", "zendesk.com", "example.org"]
+HUMAN_SUBJECTS = ["Quick question", "Re: chairs for Saturday", "Rental for June 14", "Following up",
+                  "Hello!", "Pickup time", "Wedding in October", "Invoice question", ""]
+BOT_HEADERS = [
+    ("Auto-Submitted", "auto-generated"), ("Auto-Submitted", "no"), ("Precedence", "bulk"),
+    ("Precedence", "first-class"), ("List-Id", "<news.example.org>"), ("List-Unsubscribe", "<mailto:x@y>"),
+    ("X-Campaign", "spring"), ("X-Mailgun-Sid", "abc"), ("X-SG-EID", "1"), ("X-Mailer", "Outlook"),
+]
+
+
+def example_text(pattern: str, rng: random.Random) -> str:
+    """
+    Some text the pattern matches (or nearly does, when an optional piece is dropped)
+    """
+    pattern = pattern.replace(ec.GAP, ".*")
+
+    def words(_):
+        return " " + " ".join(rng.choice(FILLER) for _ in range(rng.randint(0, 4))) + " "
+
+    def group(match):
+        if match.group(2) and rng.random() < 0.3:
+            return ""
+        return example_text(rng.choice(match.group(1).split("|")), rng)
+
+    def char_class(match):
+        options = list(match.group(1).replace("\\", ""))
+        if match.group(2):
+            options.append("")
+        return rng.choice(options)
+
+    text = pattern.replace("^", "").replace("$", "").replace("\\b", "")
+    text = re.sub(r"\.\*(\\s\+)?", words, text)
+    text = re.sub(r"\(([^()]*)\)(\?)?", group, text)
+    text = re.sub(r"\[([^\]]*)\](\?)?", char_class, text)
+    text = re.sub(r"\\s[+*]", lambda m: rng.choice([" ", "  ", "\n"]), text)
+    text = re.sub(r"#\?\\d\+|\\d\+", lambda m: rng.choice(["#", ""]) + str(rng.randint(1, 99999)), text)
+    text = re.sub(r"(\\?.)\?", lambda m: m.group(1) if rng.random() < 0.5 else "", text)
+    return text.replace("\\", "")
+
+
+def phrase_sources():
+    """
+    Pattern lists the corpus draws phrases from
+    """
+    return [ec.BOT_BODY_PATTERNS, ec.BOT_SUBJECT_PATTERNS, ec.HUMAN_REPLY_PATTERNS, ec.HUMAN_REPLY_PATTERNS,
+            ec.CUSTOMER_PATTERNS, ec.EXISTING_RELATIONSHIP_PATTERNS, ec.PROSPECT_PATTERNS, ec.PROSPECT_PATTERNS,
+            ec.PERSONAL_PATTERNS]
+
+
+def make_sender(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.35:
+        local = example_text(rng.choice(ec.BOT_SENDER_PATTERNS), rng).rstrip("@")
+    else:
+        local = rng.choice(HUMAN_LOCAL_PARTS)
+    address = f"{local}@{rng.choice(DOMAINS)}"
+    if rng.random() < 0.6:
+        return email.utils.formataddr((rng.choice(HUMAN_NAMES), address))
+    return address
+
+
+def make_body(rng: random.Random) -> str:
+    if rng.random() < 0.08:
+        return rng.choice(["ok", "Thanks!", "sounds good", "Yes", "got it", "See attached."])
+    sentences = []
+    for _ in range(rng.randint(1, 10)):
+        parts = [rng.choice(FILLER) for _ in range(rng.randint(2, 14))]
+        if rng.random() < 0.45:
+            source = rng.choice(phrase_sources())
+            parts.insert(rng.randint(0, len(parts)), example_text(rng.choice(source), rng))
+        sentence = " ".join(parts)
+        sentences.append(sentence[0].upper() + sentence[1:] + rng.choice([".", "!", "?"]))
+    body = " ".join(sentences)
+    for _ in range(rng.choice([0, 0, 0, 1, 2, 4, 6])):
+        body += f"\nhttps://example.com/{rng.randint(1, 1000)}"
+    if rng.random() < 0.05:
+        # Long bodies (newsletters, quoted threads)
+        body = "\n\n".join([body] * rng.randint(20, 80))
+    return body
+
+
+def build_corpus(size: int = DEFAULT_SIZE, seed: int = DEFAULT_SEED) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        if rng.random() < 0.3:
+            subject = example_text(rng.choice(ec.BOT_SUBJECT_PATTERNS), rng).title()
+        else:
+            subject = rng.choice(HUMAN_SUBJECTS)
+        headers = [{"name": "From", "value": make_sender(rng)}, {"name": "Subject", "value": subject}]
+        if rng.random() < 0.3:
+            name, value = rng.choice(BOT_HEADERS)
+            headers.append({"name": name, "value": value})
+        corpus.append({"sender": headers[0]["value"], "subject": subject, "body": make_body(rng), "headers": headers})
+    return corpus
+
+
+# ─── The per-pattern evaluation the classifiers used to do ───────────────
+
+def loop_is_bot_email(sender: str, subject: str, body: str, headers_list: list) -> bool:
+    detector = ec.BotEmailDetector.__new__(ec.BotEmailDetector)  # used to be built per email
+    score = 0
+    sender_email = email.utils.parseaddr(sender)[1].lower()
+    if any(re.search(p, sender_email) for p in ec.BOT_SENDER_PATTERNS) \
+            or any(sender_email.endswith(d) for d in ec.BOT_SENDER_DOMAINS):
+        score += 3
+    if any(re.search(p, subject.lower()) for p in ec.BOT_SUBJECT_PATTERNS):
+        score += 2
+    if detector.check_bot_headers(headers_list):
+        score += 2
+    if any(re.search(p, body.lower()) for p in ec.BOT_BODY_PATTERNS):
+        score += 2
+    if sum(1 for p in ec.HUMAN_REPLY_PATTERNS if re.search(p, body.lower())) >= 2:
+        score -= 2
+    if len(body.strip()) < 50:
+        score += 1
+    if len(re.findall(r'https?://', body)) > 3:
+        score += 1
+    return score >= ec.BOT_SCORE_THRESHOLD
+
+
+def compiled_is_bot_email(sender: str, subject: str, body: str, headers_list: list) -> bool:
+    return ec.bot_detector.is_bot_email(sender, subject, body, headers_list)
+
+
+def loop_customer_status(sender: str, subject: str, body: str, headers_list: list) -> str:
+    if not body or len(body.strip()) < 2:
+        return 'unknown'
+    body_lower = body.lower().strip()
+
+    def score(patterns):
+        # The phrases used to have unbounded ".*" gaps
+        return sum(1 for p in patterns if re.search(p.replace(ec.GAP, ".*"), body_lower))
+
+    customer = score(ec.CUSTOMER_PATTERNS) + score(ec.EXISTING_RELATIONSHIP_PATTERNS)
+    prospect = score(ec.PROSPECT_PATTERNS)
+    personal = score(ec.PERSONAL_PATTERNS)
+    if customer > 0 and customer >= prospect:
+        return 'customer'
+    elif prospect > 0 and prospect > personal:
+        return 'prospect'
+    return 'unknown'
+
+
+def compiled_customer_status(sender: str, subject: str, body: str, headers_list: list) -> str:
+    return ec.customer_detector.analyze_customer_status(body)
+
+
+CLASSIFIERS = {
+    "bot": (loop_is_bot_email, compiled_is_bot_email, lambda v: "1" if v else "0"),
+    # c(ustomer), p(rospect), u(nknown)
+    "customer": (loop_customer_status, compiled_customer_status, lambda v: v[0]),
+}
+
+
+# ─── Whole Gmail messages, through body extraction ───────────────
+
+def gmail_message(subject: str, sender: str, parts: list) -> dict:
+    """
+    A format=full message with the given (mime type, content) parts in a multipart/alternative
+    """
+    return {
+        "id": "case",
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [{"name": "From", "value": sender}, {"name": "Subject", "value": subject}],
+            "parts": [
+                {"mimeType": mime_type, "headers": [],
+                 "body": {"data": base64.urlsafe_b64encode(content.encode()).decode().rstrip("=")}}
+                for mime_type, content in parts
+            ],
+        },
+    }
+
+
+NEWSLETTER_HTML = (
+    "<html><body><p>Fresh picks for your next event, straight from our catalog.</p>"
+    + "".join(f'<p><a href="https://shop.example.com/item/{i}">Item {i}</a></p>' for i in range(5))
+    + "</body></html>"
+)
+
+# (what, message, expected is_bot)
+MESSAGE_CASES = [
+    # Links only exist as hrefs - they must still count towards many_links
+    ("html-only newsletter", gmail_message("Weekly digest", "Maria <maria@gmail.com>", [("text/html", NEWSLETTER_HTML)]), True),
+    # The text/plain part is what's read, and it has no links
+    ("plain+html newsletter", gmail_message("Weekly digest", "Maria <maria@gmail.com>", [
+        ("text/plain", "Fresh picks for your next event, straight from our catalog. Item 0 Item 1 Item 2"),
+        ("text/html", NEWSLETTER_HTML),
+    ]), False),
+]
+
+
+def check_message_cases() -> bool:
+    ok = True
+    for what, message, expected in MESSAGE_CASES:
+        headers_list = message["payload"]["headers"]
+        body, body_html = extract_body_and_html(message)
+        verdict = ec.bot_detector.evaluate(headers_list[0]["value"], headers_list[1]["value"], headers_list, body, body_html)
+        if verdict["is_bot"] != expected:
+            print(f"  message case {what!r}: expected is_bot={expected}, got {verdict}")
+            ok = False
+    print(f"messages: {'all' if ok else 'NOT all'} {len(MESSAGE_CASES)} cases as expected")
+    return ok
+
+
+def classify(corpus: list, fn) -> list:
+    return [fn(e["sender"], e["subject"], e["body"], e["headers"]) for e in corpus]
+
+
+def timed(corpus: list, fn, repeat: int) -> float:
+    """
+    Best-of-repeat microseconds per email
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        classify(corpus, fn)
+        best = min(best, time.perf_counter() - started)
+    return best / len(corpus) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the email classifiers")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--record", action="store_true", help="Re-record the expected verdicts")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.seed)
+    if args.record:
+        recorded = {"seed": args.seed, "size": args.size}
+        for name, (_, compiled, encode) in CLASSIFIERS.items():
+            recorded[name] = "".join(encode(v) for v in classify(corpus, compiled))
+        with open(CORPUS_FILE, "w") as f:
+            json.dump(recorded, f, indent=1)
+        print(f"Recorded {args.size} verdicts per classifier to {CORPUS_FILE}")
+        return
+
+    with open(CORPUS_FILE) as f:
+        recorded = json.load(f)
+    if (recorded["seed"], recorded["size"]) != (args.seed, args.size):
+        sys.exit(f"{CORPUS_FILE} was recorded with --seed {recorded['seed']} --size {recorded['size']}")
+
+    failed = not check_message_cases()
+    for name, (loop, compiled, encode) in CLASSIFIERS.items():
+        verdicts = [encode(v) for v in classify(corpus, compiled)]
+        mismatches = [i for i, v in enumerate(verdicts) if v != recorded[name][i]]
+        counts = {v: verdicts.count(v) for v in sorted(set(verdicts))}
+        print(f"{name}: {len(corpus) - len(mismatches)}/{len(corpus)} match the recorded corpus {counts}")
+        for i in mismatches[:5]:
+            print(f"  #{i} expected {recorded[name][i]} got {verdicts[i]}: "
+                  f"{corpus[i]['sender']!r} {corpus[i]['subject']!r} {corpus[i]['body'][:80]!r}")
+        failed = failed or bool(mismatches)
+
+        before = timed(corpus, loop, args.repeat)
+        after = timed(corpus, compiled, args.repeat)
+        print(f"{name}: {before:.1f} µs/email per-pattern loops, {after:.1f} µs/email compiled ({before / after:.1f}x)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
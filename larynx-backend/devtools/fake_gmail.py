@@ -0,0 +1,656 @@
+"""
+Fake Gmail API (plus Google OAuth token endpoint) for local load and throughput tests.
+
+Serves the parts of the Gmail API the backend uses - profile, messages.list,
+messages.get (full / metadata / minimal / raw), history.list, labels.list/create,
+messages.batchModify, drafts.create, watch and /batch/gmail/v1 - over synthetic mailboxes, with configurable latency and
+injected 429/500 errors:
+
+    python devtools/fake_gmail.py --port 8025
+    python devtools/fake_gmail.py --port 8025 --latency-ms 120 --error-rate-429 0.02 --arrival-rate 2
+
+Then point the backend at it:
+
+    GMAIL_API_BASE_URL=http://localhost:8025
+    GOOGLE_OAUTH_BASE_URL=http://localhost:8025
+    OPENAI_BASE_URL=http://localhost:8025/v1      (canned draft replies, no OpenAI bill)
+
+Any bearer token is accepted and maps to its own mailbox: "fake-access-<name>"
+(what POST /token returns for refresh token <name>) is mailbox <name>, so 1,000
+users just need 1,000 different tokens. Mailboxes are generated on first use from
+a seed, and new mail arrives at --arrival-rate messages per mailbox per minute.
+
+It can also run in-process: httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app())).
+
+Inspection endpoints: GET /_fake/stats, POST /_fake/deliver?mailbox=&count=, POST /_fake/reset
+"""
+import os
+import re
+import json
+import time
+import uuid
+import random
+import base64
+import asyncio
+import argparse
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+
+class FakeGmailConfig:
+    def __init__(self, **overrides):
+        self.latency_ms = float(os.getenv("FAKE_GMAIL_LATENCY_MS", "80"))
+        self.latency_jitter_ms = float(os.getenv("FAKE_GMAIL_LATENCY_JITTER_MS", "40"))
+        self.error_rate_429 = float(os.getenv("FAKE_GMAIL_ERROR_RATE_429", "0"))
+        self.error_rate_500 = float(os.getenv("FAKE_GMAIL_ERROR_RATE_500", "0"))
+        # Initial inbox and sent messages per mailbox
+        self.initial_messages = int(os.getenv("FAKE_GMAIL_INITIAL_MESSAGES", "40"))
+        self.sent_messages = int(os.getenv("FAKE_GMAIL_SENT_MESSAGES", "30"))
+        # New inbox messages per mailbox per minute
+        self.arrival_rate = float(os.getenv("FAKE_GMAIL_ARRIVAL_RATE", "0.5"))
+        # Share of new mail that is automated (newsletters, notifications)
+        self.bot_ratio = float(os.getenv("FAKE_GMAIL_BOT_RATIO", "0.4"))
+        # History records kept per mailbox; older startHistoryIds get a 404
+        self.history_retention = int(os.getenv("FAKE_GMAIL_HISTORY_RETENTION", "5000"))
+        self.openai_latency_ms = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "800"))
+        self.seed = int(os.getenv("FAKE_GMAIL_SEED", "7"))
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(self, key, value)
+
+
+# ─── Synthetic mail ──────────────────────────────────────────────────
+
+FIRST_NAMES = ["Ava", "Liam", "Maya", "Noah", "Zoe", "Ethan", "Chloe", "Omar", "Priya", "Lucas", "Ines", "Kofi"]
+LAST_NAMES = ["Smith", "Okafor", "Garcia", "Chen", "Patel", "Nguyen", "Müller", "Rossi", "Kim", "Silva"]
+PRODUCTS = ["marble pedestal", "oak table", "linen tablecloth", "gold chair", "arch backdrop", "string lights"]
+
+CUSTOMER_TEMPLATES = [
+    ("Question about my order #{num}", "Hi,\n\nI placed my order #{num} last week for the {product}. "
+     "When will my delivery arrive? I need it before Saturday.\n\nThanks,\n{name}"),
+    ("Refund for {product}", "Hello,\n\nI bought a {product} from you and it arrived damaged. "
+     "Can I get a refund or an exchange?\n\nBest,\n{name}"),
+    ("Quote request", "Hi there,\n\nI found your website and I am interested in renting {count} of the {product}. "
+     "Could you send a quote and your price list?\n\nRegards,\n{name}"),
+    ("Following up", "Hi,\n\nFollowing up on our conversation yesterday - we'd like the same as last time, "
+     "{count} {product}s for the weekend. Is pickup on Friday possible?\n\n{name}"),
+]
+BOT_TEMPLATES = [
+    ("no-reply@shop-updates.example", "Your weekly deals are here", "Save 20% this week only. Unsubscribe at any time."),
+    ("notifications@social.example", "You have 3 new notifications", "See what your friends are up to."),
+    ("newsletter@industry-news.example", "Industry digest #{num}", "Top stories this week. View in browser. Unsubscribe."),
+]
+SENT_TEMPLATES = [
+    "Hi {name},\n\nThanks for reaching out! The {product} is available for your date. "
+    "I've attached the quote.\n\nBest regards,\n{owner}\nLarynx Rentals\n(555) 010-2000",
+    "Hey {name},\n\nHappy to help - we can deliver {count} {product}s on Friday morning. "
+    "Let me know if that works.\n\nBest regards,\n{owner}\nLarynx Rentals\n(555) 010-2000",
+]
+
+
+def b64url(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def gmail_error(status: int, reason: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}}
+    )
+
+
+class FakeMailbox:
+    def __init__(self, name: str, number: int, config: FakeGmailConfig):
+        self.name = name
+        self.number = number
+        self.address = f"{re.sub(r'[^a-z0-9]+', '.', name.lower()).strip('.') or 'user'}@fake-gmail.local"
+        self.config = config
+        self.rng = random.Random(f"{config.seed}:{name}")
+        self.messages: Dict[str, Dict] = {}
+        self.order: List[str] = []  # oldest first
+        self.history: List[Tuple[int, str]] = []  # (history id, message id)
+        self.history_id = 1000 + self.rng.randint(0, 1000)
+        self.history_floor = self.history_id
+        self.sequence = 0
+        self.drafts = 0
+        self.watch_calls = 0
+        # User label name -> id
+        self.labels: Dict[str, str] = {}
+
+        now = datetime.now(timezone.utc)
+        for i in reversed(range(config.sent_messages)):
+            self.add_message("sent", now - timedelta(days=30, hours=i), record_history=False)
+        for i in reversed(range(config.initial_messages)):
+            kind = "bot" if self.rng.random() < config.bot_ratio else "customer"
+            self.add_message(kind, now - timedelta(days=10, hours=i), record_history=False)
+
+    def _person(self) -> Tuple[str, str]:
+        first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        return f"{first} {last}", f"{first.lower()}.{last.lower()}@customer.example"
+
+    def add_message(self, kind: str, sent_at: Optional[datetime] = None, record_history: bool = True) -> Dict:
+        rng = self.rng
+        sent_at = sent_at or datetime.now(timezone.utc)
+        self.sequence += 1
+        msg_id = f"{self.number:06x}{self.sequence:010x}"
+        values = {"num": rng.randint(1000, 9999), "product": rng.choice(PRODUCTS), "count": rng.randint(2, 40)}
+        extra_headers = []
+
+        if kind == "sent":
+            name, address = self._person()
+            subject = f"Re: {rng.choice(CUSTOMER_TEMPLATES)[0]}".format(**values)
+            body = rng.choice(SENT_TEMPLATES).format(name=name.split()[0], owner=self.name, **values)
+            sender, to, labels = f"{self.name} <{self.address}>", f"{name} <{address}>", ["SENT"]
+        elif kind == "bot":
+            address, subject, body = rng.choice(BOT_TEMPLATES)
+            subject, body = subject.format(**values), body.format(**values)
+            sender, to = f"Updates <{address}>", self.address
+            labels = ["INBOX", "UNREAD", rng.choice(["CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_PERSONAL"])]
+            extra_headers = [
+                {"name": "List-Unsubscribe", "value": f"<mailto:unsubscribe@{address.split('@')[1]}>"},
+                {"name": "Precedence", "value": "bulk"},
+            ]
+        else:
+            name, address = self._person()
+            subject_template, body_template = rng.choice(CUSTOMER_TEMPLATES)
+            subject = subject_template.format(**values)
+            body = body_template.format(name=name.split()[0], **values)
+            sender, to, labels = f"{name} <{address}>", self.address, ["INBOX", "UNREAD", "CATEGORY_PERSONAL"]
+
+        rfc_message_id = f"<{msg_id}.{self.number}@fake-gmail.local>"
+        headers = [
+            {"name": "From", "value": sender},
+            {"name": "To", "value": to},
+            {"name": "Subject", "value": subject},
+            {"name": "Date", "value": format_datetime(sent_at)},
+            {"name": "Message-ID", "value": rfc_message_id},
+            {"name": "MIME-Version", "value": "1.0"},
+            *extra_headers,
+            {"name": "Content-Type", "value": 'multipart/alternative; boundary="fakeboundary"'},
+        ]
+        html = "<div>" + body.replace("\n", "<br>") + "</div>"
+        self.history_id += 1
+        message = {
+            "id": msg_id,
+            "threadId": msg_id,
+            "labelIds": labels,
+            "snippet": body[:100].replace("\n", " "),
+            "historyId": str(self.history_id),
+            "internalDate": str(int(sent_at.timestamp() * 1000)),
+            "sizeEstimate": len(body) + len(html) + 600,
+            "payload": {
+                "partId": "",
+                "mimeType": "multipart/alternative",
+                "filename": "",
+                "headers": headers,
+                "body": {"size": 0},
+                "parts": [
+                    {"partId": "0", "mimeType": "text/plain", "filename": "",
+                     "headers": [{"name": "Content-Type", "value": "text/plain; charset=UTF-8"}],
+                     "body": {"size": len(body), "data": b64url(body)}},
+                    {"partId": "1", "mimeType": "text/html", "filename": "",
+                     "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}],
+                     "body": {"size": len(html), "data": b64url(html)}},
+                ],
+            },
+        }
+        self.messages[msg_id] = message
+        self.order.append(msg_id)
+        if record_history:
+            self.history.append((self.history_id, msg_id))
+            if len(self.history) > self.config.history_retention:
+                dropped = self.history[:len(self.history) - self.config.history_retention]
+                self.history = self.history[len(dropped):]
+                self.history_floor = dropped[-1][0]
+        else:
+            self.history_floor = self.history_id
+        return message
+
+    def raw_message(self, message: Dict) -> str:
+        headers = message["payload"]["headers"]
+        lines = [f"{h['name']}: {h['value']}" for h in headers]
+        parts = message["payload"]["parts"]
+        body = ""
+        for part in parts:
+            content = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8")
+            body += f"--fakeboundary\r\nContent-Type: {part['mimeType']}; charset=UTF-8\r\n\r\n{content}\r\n"
+        return "\r\n".join(lines) + "\r\n\r\n" + body + "--fakeboundary--\r\n"
+
+
+# ─── Gmail API operations ──────────────────────────────────────────────────
+
+def _first(params: Dict[str, List[str]], key: str, default: Optional[str] = None) -> Optional[str]:
+    values = params.get(key)
+    return values[0] if values else default
+
+
+SYSTEM_LABELS = ["INBOX", "SENT", "DRAFT", "SPAM", "TRASH", "UNREAD", "STARRED", "IMPORTANT",
+                 "CATEGORY_PERSONAL", "CATEGORY_SOCIAL", "CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_FORUMS"]
+
+
+def _search_label_ids(mailbox: FakeMailbox, name: str) -> set:
+    # Gmail search matches "larynx-processed" for the label "Larynx/Processed"
+    wanted = name.lower()
+    ids = {label_id for label_name, label_id in mailbox.labels.items()
+           if label_name.lower().replace("/", "-").replace(" ", "-") == wanted}
+    return ids or {name.upper()}
+
+
+def _matches_query(mailbox: FakeMailbox, message: Dict, query: str) -> bool:
+    # Only the query terms the backend sends are understood
+    labels = set(message["labelIds"])
+    for term in query.split():
+        if term == "category:primary":
+            if labels & {"CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_SOCIAL", "CATEGORY_FORUMS"}:
+                return False
+        elif term.startswith("after:"):
+            try:
+                after = datetime.strptime(term[6:], "%Y/%m/%d").replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            if int(message["internalDate"]) < after.timestamp() * 1000:
+                return False
+        elif term.startswith("-label:") and labels & _search_label_ids(mailbox, term[7:]):
+            return False
+    return True
+
+
+def _format_message(mailbox: FakeMailbox, message: Dict, params: Dict[str, List[str]]) -> Dict:
+    fmt = _first(params, "format", "full")
+    if fmt == "full":
+        return message
+    base = {k: message[k] for k in ("id", "threadId", "labelIds", "snippet", "historyId", "internalDate", "sizeEstimate")}
+    if fmt == "minimal":
+        return base
+    if fmt == "raw":
+        return {**base, "raw": b64url(mailbox.raw_message(message))}
+    # metadata
+    wanted = {name.lower() for name in params.get("metadataHeaders", [])}
+    headers = [h for h in message["payload"]["headers"] if not wanted or h["name"].lower() in wanted]
+    return {**base, "payload": {"mimeType": message["payload"]["mimeType"], "headers": headers}}
+
+
+def gmail_operation(mailbox: FakeMailbox, method: str, path: str, params: Dict[str, List[str]],
+                    body: Optional[Dict], stats: Counter) -> Tuple[int, Dict]:
+    """
+    Handle one Gmail API call; path is relative to /gmail/v1/users/me
+    """
+    path = "/" + path.strip("/")
+
+    if method == "GET" and path == "/profile":
+        stats["getProfile"] += 1
+        return 200, {"emailAddress": mailbox.address, "messagesTotal": len(mailbox.messages),
+                     "threadsTotal": len(mailbox.messages), "historyId": str(mailbox.history_id)}
+
+    if method == "GET" and path == "/messages":
+        stats["messages.list"] += 1
+        label_ids = [label for value in params.get("labelIds", []) for label in value.split(",")]
+        query = _first(params, "q", "")
+        max_results = min(500, int(_first(params, "maxResults", "100")))
+        offset = int(_first(params, "pageToken", "0"))
+        matching = [
+            msg_id for msg_id in reversed(mailbox.order)
+            if all(label in mailbox.messages[msg_id]["labelIds"] for label in label_ids)
+            and _matches_query(mailbox, mailbox.messages[msg_id], query)
+        ]
+        page = matching[offset:offset + max_results]
+        result = {"messages": [{"id": msg_id, "threadId": mailbox.messages[msg_id]["threadId"]} for msg_id in page],
+                  "resultSizeEstimate": len(matching)}
+        if offset + max_results < len(matching):
+            result["nextPageToken"] = str(offset + max_results)
+        if not page:
+            result.pop("messages")
+        return 200, result
+
+    match = re.fullmatch(r"/messages/([^/]+)", path)
+    if method == "GET" and match:
+        stats["messages.get"] += 1
+        message = mailbox.messages.get(match.group(1))
+        if message is None:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found.",
+                                   "errors": [{"reason": "notFound"}]}}
+        return 200, _format_message(mailbox, message, params)
+
+    if method == "GET" and path == "/history":
+        stats["history.list"] += 1
+        start = int(_first(params, "startHistoryId", "0"))
+        if start < mailbox.history_floor:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found.",
+                                   "errors": [{"reason": "notFound"}]}}
+        label_id = _first(params, "labelId")
+        max_results = min(500, int(_first(params, "maxResults", "100")))
+        offset = int(_first(params, "pageToken", "0"))
+        records = [
+            (history_id, msg_id) for history_id, msg_id in mailbox.history
+            if history_id > start and (not label_id or label_id in mailbox.messages[msg_id]["labelIds"])
+        ]
+        page = records[offset:offset + max_results]
+        result = {"historyId": str(mailbox.history_id)}
+        if page:
+            result["history"] = [
+                {"id": str(history_id), "messages": [{"id": msg_id, "threadId": msg_id}],
+                 "messagesAdded": [{"message": {"id": msg_id, "threadId": msg_id,
+                                                "labelIds": mailbox.messages[msg_id]["labelIds"]}}]}
+                for history_id, msg_id in page
+            ]
+        if offset + max_results < len(records):
+            result["nextPageToken"] = str(offset + max_results)
+        return 200, result
+
+    if method == "GET" and path == "/labels":
+        stats["labels.list"] += 1
+        labels = [{"id": label, "name": label, "type": "system"} for label in SYSTEM_LABELS]
+        labels += [{"id": label_id, "name": name, "type": "user"} for name, label_id in mailbox.labels.items()]
+        return 200, {"labels": labels}
+
+    if method == "POST" and path == "/labels":
+        stats["labels.create"] += 1
+        name = (body or {}).get("name", "")
+        if not name:
+            return 400, {"error": {"code": 400, "message": "Invalid label name", "errors": [{"reason": "invalidArgument"}]}}
+        if name in mailbox.labels:
+            return 409, {"error": {"code": 409, "message": "Label name exists or conflicts", "errors": [{"reason": "alreadyExists"}]}}
+        label_id = mailbox.labels[name] = f"Label_{len(mailbox.labels) + 1}"
+        return 200, {"id": label_id, "name": name, "type": "user",
+                     "labelListVisibility": body.get("labelListVisibility"),
+                     "messageListVisibility": body.get("messageListVisibility")}
+
+    if method == "POST" and path == "/messages/batchModify":
+        stats["messages.batchModify"] += 1
+        ids = (body or {}).get("ids", [])
+        add = (body or {}).get("addLabelIds", [])
+        remove = set((body or {}).get("removeLabelIds", []))
+        known = set(mailbox.labels.values()) | set(SYSTEM_LABELS)
+        if len(ids) > 1000 or any(label not in known for label in add):
+            return 400, {"error": {"code": 400, "message": "Invalid label or too many ids", "errors": [{"reason": "invalidArgument"}]}}
+        for msg_id in ids:
+            message = mailbox.messages.get(msg_id)
+            if message is not None:
+                message["labelIds"] = [label for label in message["labelIds"] if label not in remove]
+                message["labelIds"] += [label for label in add if label not in message["labelIds"]]
+        return 204, None
+
+    if method == "POST" and path == "/drafts":
+        stats["drafts.create"] += 1
+        message = (body or {}).get("message", {})
+        if not message.get("raw"):
+            return 400, {"error": {"code": 400, "message": "Missing draft message", "errors": [{"reason": "invalidArgument"}]}}
+        mailbox.drafts += 1
+        draft_id = f"r-{mailbox.number}-{mailbox.drafts}"
+        return 200, {"id": draft_id, "message": {"id": uuid.uuid4().hex[:16],
+                                                 "threadId": message.get("threadId") or uuid.uuid4().hex[:16],
+                                                 "labelIds": ["DRAFT"]}}
+
+    if method == "POST" and path == "/watch":
+        stats["watch"] += 1
+        mailbox.watch_calls += 1
+        expiration = datetime.now(timezone.utc) + timedelta(days=7)
+        return 200, {"historyId": str(mailbox.history_id), "expiration": str(int(expiration.timestamp() * 1000))}
+
+    stats["unsupported"] += 1
+    return 404, {"error": {"code": 404, "message": f"fake_gmail does not implement {method} {path}",
+                           "errors": [{"reason": "notFound"}]}}
+
+
+# ─── Batch requests ──────────────────────────────────────────────────
+
+def parse_batch_request(content_type: str, body: bytes) -> List[Tuple[str, str, str]]:
+    """
+    (content id, method, path with query) of each part of a multipart/mixed batch
+    """
+    boundary = None
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            boundary = value.strip('"')
+    if not boundary:
+        raise ValueError("missing boundary")
+
+    parts = []
+    for part in body.decode("utf-8").split(f"--{boundary}"):
+        part = part.strip("\r\n")
+        if not part or part == "--":
+            continue
+        part_headers, _, http_request = part.replace("\r\n", "\n").partition("\n\n")
+        content_id = ""
+        for line in part_headers.split("\n"):
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-id":
+                content_id = value.strip().strip("<>")
+        request_line = http_request.strip().split("\n", 1)[0]
+        method, _, path = request_line.partition(" ")
+        parts.append((content_id, method.upper(), path.split(" HTTP/")[0].strip()))
+    return parts
+
+
+def build_batch_response(results: List[Tuple[str, int, Dict]], boundary: str) -> str:
+    chunks = []
+    for content_id, status, payload in results:
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}.get(status, "Error")
+        chunks.append(
+            f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+            f"{json.dumps(payload)}\r\n"
+        )
+    return "".join(chunks) + f"--{boundary}--\r\n"
+
+
+# ─── App ──────────────────────────────────────────────────
+
+class FakeGmail:
+    def __init__(self, config: FakeGmailConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.mailboxes: Dict[str, FakeMailbox] = {}
+        self.stats = Counter()
+        self.injected = Counter()
+        self.started_at = time.time()
+
+    def mailbox_for_token(self, token: str) -> FakeMailbox:
+        name = token[len("fake-access-"):] if token.startswith("fake-access-") else token
+        mailbox = self.mailboxes.get(name)
+        if mailbox is None:
+            mailbox = self.mailboxes[name] = FakeMailbox(name, len(self.mailboxes) + 1, self.config)
+        return mailbox
+
+    def injected_error(self) -> Optional[Tuple[int, Dict]]:
+        roll = self.rng.random()
+        if roll < self.config.error_rate_429:
+            self.injected[429] += 1
+            return 429, {"error": {"code": 429, "message": "User-rate limit exceeded",
+                                   "errors": [{"reason": "userRateLimitExceeded"}]}}
+        if roll < self.config.error_rate_429 + self.config.error_rate_500:
+            self.injected[500] += 1
+            return 500, {"error": {"code": 500, "message": "Backend Error", "errors": [{"reason": "backendError"}]}}
+        return None
+
+    async def latency(self, base_ms: Optional[float] = None):
+        base_ms = self.config.latency_ms if base_ms is None else base_ms
+        delay = max(0.0, self.rng.gauss(base_ms, self.config.latency_jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+
+    def deliver(self, mailbox: FakeMailbox, count: int = 1) -> List[str]:
+        ids = []
+        for _ in range(count):
+            kind = "bot" if mailbox.rng.random() < self.config.bot_ratio else "customer"
+            ids.append(mailbox.add_message(kind)["id"])
+            self.stats["messages_delivered"] += 1
+        return ids
+
+    async def arrival_loop(self):
+        # New mail for every mailbox at arrival_rate per minute
+        while True:
+            await asyncio.sleep(1)
+            probability = self.config.arrival_rate / 60
+            for mailbox in list(self.mailboxes.values()):
+                if mailbox.rng.random() < probability:
+                    self.deliver(mailbox)
+
+
+def create_app(config: Optional[FakeGmailConfig] = None) -> FastAPI:
+    fake = FakeGmail(config or FakeGmailConfig())
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        task = asyncio.create_task(fake.arrival_loop()) if fake.config.arrival_rate > 0 else None
+        yield
+        if task:
+            task.cancel()
+
+    app = FastAPI(title="Fake Gmail", lifespan=lifespan)
+    app.state.fake = fake
+
+    def bearer_mailbox(request: Request) -> Optional[FakeMailbox]:
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or not auth[7:].strip():
+            return None
+        return fake.mailbox_for_token(auth[7:].strip())
+
+    @app.api_route("/gmail/v1/users/me/{path:path}", methods=["GET", "POST"])
+    async def gmail_api(path: str, request: Request):
+        mailbox = bearer_mailbox(request)
+        if mailbox is None:
+            return gmail_error(401, "authError", "Invalid Credentials")
+        await fake.latency()
+        error = fake.injected_error()
+        if error:
+            return JSONResponse(status_code=error[0], content=error[1])
+        params = parse_qs(request.url.query)
+        body = await request.json() if request.method == "POST" and await request.body() else None
+        status, payload = gmail_operation(mailbox, request.method, path, params, body, fake.stats)
+        if payload is None:
+            return Response(status_code=status)
+        return JSONResponse(status_code=status, content=payload)
+
+    @app.post("/batch/gmail/v1")
+    async def gmail_batch(request: Request):
+        mailbox = bearer_mailbox(request)
+        if mailbox is None:
+            return gmail_error(401, "authError", "Invalid Credentials")
+        await fake.latency()
+        error = fake.injected_error()
+        if error:
+            return JSONResponse(status_code=error[0], content=error[1])
+        try:
+            parts = parse_batch_request(request.headers.get("Content-Type", ""), await request.body())
+        except ValueError as e:
+            return gmail_error(400, "badRequest", f"Bad batch request: {str(e)}")
+        if len(parts) > 100:
+            return gmail_error(400, "badRequest", "A batch can hold at most 100 requests")
+
+        fake.stats["batch"] += 1
+        fake.stats["batch_parts"] += len(parts)
+        results = []
+        for content_id, method, target in parts:
+            url = urlsplit(target)
+            prefix = "/gmail/v1/users/me"
+            part_error = fake.injected_error()
+            if part_error:
+                status, payload = part_error
+            elif not url.path.startswith(prefix):
+                status, payload = 404, {"error": {"code": 404, "message": "Unknown path", "errors": [{"reason": "notFound"}]}}
+            else:
+                status, payload = gmail_operation(mailbox, method, url.path[len(prefix):],
+                                                  parse_qs(url.query), None, fake.stats)
+            results.append((content_id, status, payload))
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        return Response(content=build_batch_response(results, boundary),
+                        media_type=f"multipart/mixed; boundary={boundary}")
+
+    @app.post("/token")
+    async def oauth_token(request: Request):
+        await fake.latency()
+        form = parse_qs((await request.body()).decode("utf-8"))
+        refresh_token = _first(form, "refresh_token")
+        if _first(form, "grant_type") != "refresh_token" or not refresh_token:
+            return JSONResponse(status_code=400, content={"error": "invalid_grant"})
+        fake.stats["token.refresh"] += 1
+        return {"access_token": f"fake-access-{refresh_token}", "expires_in": 3599, "token_type": "Bearer",
+                "scope": "https://www.googleapis.com/auth/gmail.modify https://www.googleapis.com/auth/gmail.compose"}
+
+    @app.post("/revoke")
+    async def oauth_revoke():
+        fake.stats["token.revoke"] += 1
+        return {}
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat_completion(request: Request):
+        # Stand-in for OpenAI so load tests don't depend on (or pay for) it
+        await fake.latency(fake.config.openai_latency_ms)
+        fake.stats["openai.chat"] += 1
+        payload = await request.json()
+        content = "Hi,\n\nThanks for getting in touch! We have that available and will confirm the details shortly."
+        return {
+            "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.get("/_fake/stats")
+    async def fake_stats():
+        uptime = time.time() - fake.started_at
+        total = sum(count for key, count in fake.stats.items() if key not in ("batch_parts", "messages_delivered"))
+        return {
+            "uptime_seconds": round(uptime, 1),
+            "mailboxes": len(fake.mailboxes),
+            "requests": dict(fake.stats),
+            "operations_per_second": round(total / uptime, 2) if uptime else 0.0,
+            "injected_errors": {str(code): count for code, count in fake.injected.items()},
+            "drafts_created": sum(mailbox.drafts for mailbox in fake.mailboxes.values()),
+        }
+
+    @app.post("/_fake/deliver")
+    async def fake_deliver(mailbox: Optional[str] = None, count: int = 1):
+        targets = [fake.mailbox_for_token(mailbox)] if mailbox else list(fake.mailboxes.values())
+        delivered = {target.name: fake.deliver(target, count) for target in targets}
+        return {"delivered": sum(len(ids) for ids in delivered.values()), "mailboxes": len(delivered)}
+
+    @app.post("/_fake/reset")
+    async def fake_reset():
+        fake.mailboxes.clear()
+        fake.stats.clear()
+        fake.injected.clear()
+        fake.started_at = time.time()
+        return {"reset": True}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Gmail API for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--latency-jitter-ms", type=float)
+    parser.add_argument("--error-rate-429", type=float)
+    parser.add_argument("--error-rate-500", type=float)
+    parser.add_argument("--initial-messages", type=int)
+    parser.add_argument("--sent-messages", type=int)
+    parser.add_argument("--arrival-rate", type=float, help="New messages per mailbox per minute")
+    parser.add_argument("--bot-ratio", type=float)
+    parser.add_argument("--openai-latency-ms", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeGmailConfig(**{key: value for key, value in vars(args).items() if key not in ("host", "port")})
+    print(f"Fake Gmail on http://{args.host}:{args.port} "
+          f"(latency {config.latency_ms}ms, 429 rate {config.error_rate_429}, 500 rate {config.error_rate_500})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Fake Pub/Sub publisher for local testing of Gmail push ingestion.
+
+Sends Gmail watch style notifications to the /gmail/push endpoint, exactly
+like a Pub/Sub push subscription would:
+
+    python devtools/fake_pubsub_publisher.py --email owner@example.com --token $GMAIL_PUSH_VERIFICATION_TOKEN
+    python devtools/fake_pubsub_publisher.py --email owner@example.com --token $GMAIL_PUSH_VERIFICATION_TOKEN --count 20 --interval 0.5
+"""
+import json
+import time
+import base64
+import argparse
+from datetime import datetime, timezone
+
+import httpx
+
+
+def build_envelope(email_address: str, history_id: int, message_number: int) -> dict:
+    """
+    Build a Pub/Sub push envelope carrying a Gmail notification
+    """
+    payload = json.dumps({"emailAddress": email_address, "historyId": history_id})
+    return {
+        "message": {
+            "data": base64.b64encode(payload.encode("utf-8")).decode("ascii"),
+            "messageId": f"fake-{message_number}",
+            "publishTime": datetime.now(timezone.utc).isoformat()
+        },
+        "subscription": "projects/local/subscriptions/gmail-push-fake"
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST fake Gmail push notifications")
+    parser.add_argument("--url", default="http://localhost:8000/gmail/push")
+    parser.add_argument("--email", required=True, help="Mailbox address of a monitored user")
+    parser.add_argument("--history-id", type=int, default=int(time.time()))
+    parser.add_argument("--token", required=True, help="The server's GMAIL_PUSH_VERIFICATION_TOKEN")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between notifications")
+    args = parser.parse_args()
+
+    params = {"token": args.token}
+
+    with httpx.Client(timeout=10) as client:
+        for i in range(args.count):
+            envelope = build_envelope(args.email, args.history_id + i, i)
+            started = time.perf_counter()
+            r = client.post(args.url, params=params, json=envelope)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"[{i + 1}/{args.count}] {r.status_code} in {elapsed_ms:.0f}ms: {r.text}")
+            if i + 1 < args.count:
+                time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Load test the email monitor against the fake Gmail API (devtools/fake_gmail.py).
+
+Runs the real monitor scheduler and email pipeline in this process for N simulated
+users whose Gmail, token refresh and OpenAI calls all go to the fake server:
+
+    python devtools/fake_gmail.py --port 8025 --arrival-rate 1 &
+    python devtools/load_test_monitor.py --users 1000 --duration 300
+    python devtools/load_test_monitor.py --cleanup
+
+Users (emails @loadtest.larynx.local) and their tokens are written to the Supabase
+project in SUPABASE_URL - use a local or scratch project, never production.
+--backfill makes the users a month old so their existing fake inbox is processed
+too, not only mail that arrives during the run.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+LOADTEST_DOMAIN = "loadtest.larynx.local"
+
+
+def point_backend_at(fake_url: str):
+    """
+    Must run before any backend module is imported (they read these at import)
+    """
+    os.environ["GMAIL_API_BASE_URL"] = fake_url
+    os.environ["GOOGLE_OAUTH_BASE_URL"] = fake_url
+    os.environ["OPENAI_BASE_URL"] = f"{fake_url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    # Monitor users in this process only
+    os.environ["MONITOR_LEASES_ENABLED"] = "false"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed_users(supabase, count: int, backfill: bool) -> list:
+    """
+    Create (or reuse) count load-test users with tokens for the fake server
+    """
+    created_at = datetime.now(timezone.utc) - (timedelta(days=30) if backfill else timedelta(0))
+    emails = [f"user{i:05d}@{LOADTEST_DOMAIN}" for i in range(count)]
+    existing = {
+        row["email"]: row["id"]
+        for row in supabase.table("users").select("id, email").like("email", f"%@{LOADTEST_DOMAIN}").execute().data
+    }
+
+    rows = [
+        {"id": existing.get(email) or str(uuid.uuid4()), "email": email, "name": f"Load Test {i}",
+         "has_onboarded": True, "is_monitoring": True, "created_at": created_at.isoformat(),
+         "monitoring_started_at": datetime.now(timezone.utc).isoformat(), "gmail_history_id": None}
+        for i, email in enumerate(emails)
+    ]
+    for start in range(0, len(rows), 500):
+        supabase.table("users").upsert(rows[start:start + 500], on_conflict="id").execute()
+
+    tokens = [
+        {"user_id": row["id"], "access_token": f"fake-access-{row['email']}", "refresh_token": row["email"],
+         "scope": "gmail.modify gmail.compose",
+         # Some tokens start expired so the refresh path is exercised too
+         "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=random.choice([-5, 55]))).isoformat()}
+        for row in rows
+    ]
+    for start in range(0, len(tokens), 500):
+        supabase.table("tokens").upsert(tokens[start:start + 500], on_conflict="user_id").execute()
+    return [row["id"] for row in rows]
+
+
+def cleanup_users(supabase):
+    user_ids = [
+        row["id"]
+        for row in supabase.table("users").select("id").like("email", f"%@{LOADTEST_DOMAIN}").execute().data
+    ]
+    for start in range(0, len(user_ids), 200):
+        chunk = user_ids[start:start + 200]
+        for table in ("drafts", "filtered_emails", "tokens"):
+            supabase.table(table).delete().in_("user_id", chunk).execute()
+        supabase.table("users").delete().in_("id", chunk).execute()
+    print(f"Removed {len(user_ids)} load-test users")
+
+
+def fake_stats(fake_url: str) -> dict:
+    try:
+        return httpx.get(f"{fake_url}/_fake/stats", timeout=5).json()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def run(args):
+    from config import supabase
+    from routes import inbox_routes as inbox
+
+    user_ids = seed_users(supabase, args.users, args.backfill)
+    print(f"Seeded {len(user_ids)} users, ramping up over {args.ramp:.0f}s")
+
+    inbox.monitor_scheduler.start()
+    heartbeat = asyncio.create_task(inbox.user_states.heartbeat_loop())
+    watchdog = asyncio.create_task(inbox.monitor_watchdog.run())
+    for state in inbox.user_states.load_monitoring_users():
+        if state.user_id in user_ids:
+            inbox.monitor_scheduler.add_user(state.user_id, delay=random.uniform(0, args.ramp))
+
+    started = time.monotonic()
+    last_cycles, last_drafts = 0, 0
+    try:
+        while time.monotonic() - started < args.duration:
+            await asyncio.sleep(args.report_every)
+            scheduler = inbox.monitor_scheduler.stats()
+            pipeline = inbox.email_pipeline.stats()
+            quota = inbox.gmail_rate_limiter.stats()
+            fake = fake_stats(args.fake_url)
+            drafts = fake.get("drafts_created", 0)
+            elapsed = time.monotonic() - started
+            print(
+                f"[{elapsed:6.0f}s] cycles {scheduler['cycles_run']} (+{(scheduler['cycles_run'] - last_cycles) / args.report_every:.1f}/s)"
+                f" | running {scheduler['running_cycles']} queued {scheduler['ready_queue_depth']}"
+                f" overdue {scheduler['overdue_users']} (max {scheduler['max_overdue_seconds']:.1f}s)"
+                f" lag avg {scheduler['avg_start_lag_seconds']:.2f}s"
+                f" | pipeline {pipeline['outcomes']}"
+                f" | drafts {drafts} (+{(drafts - last_drafts) / args.report_every:.1f}/s)"
+                f" | gmail retries {quota['retries']} throttled {quota['throttled_seconds']:.1f}s"
+                f" | fake {fake.get('operations_per_second', '?')} ops/s"
+            )
+            last_cycles, last_drafts = scheduler["cycles_run"], drafts
+    finally:
+        print("Draining...")
+        await inbox.monitor_scheduler.drain()
+        await inbox.monitor_scheduler.stop()
+        await inbox.email_pipeline.stop()
+        inbox.user_states.flush()
+        heartbeat.cancel()
+        watchdog.cancel()
+        from services.http_clients import http_clients
+        await http_clients.aclose()
+
+    print("\nFinal:")
+    print(f"  scheduler: {inbox.monitor_scheduler.stats()}")
+    print(f"  pipeline:  {inbox.email_pipeline.stats()}")
+    print(f"  gmail:     {inbox.gmail_rate_limiter.stats()}")
+    print(f"  fake:      {fake_stats(args.fake_url)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the monitor against devtools/fake_gmail.py")
+    parser.add_argument("--fake-url", default="http://127.0.0.1:8025")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=120, help="Seconds to run")
+    parser.add_argument("--ramp", type=float, default=30, help="Spread first checks over this many seconds")
+    parser.add_argument("--report-every", type=float, default=10)
+    parser.add_argument("--backfill", action="store_true", help="Also process the existing fake inbox")
+    parser.add_argument("--cleanup", action="store_true", help="Delete the load-test users and exit")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    point_backend_at(args.fake_url.rstrip("/"))
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    if args.cleanup:
+        from config import supabase
+        cleanup_users(supabase)
+        return
+
+    if "error" in fake_stats(args.fake_url):
+        sys.exit(f"Fake Gmail is not reachable at {args.fake_url} - start devtools/fake_gmail.py first")
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ import json
 from collections import Counter
 import pprint
 from config import supabase
+from services.http_clients import http_clients
 import httpx
 from bs4 import BeautifulSoup
 from openai import OpenAI
@@ -26,6 +27,11 @@ from urllib.parse import urljoin
 
 openai_client = OpenAI()          
 
+# Google's OAuth endpoints (overridable to point at devtools/fake_gmail.py)
+GOOGLE_OAUTH_BASE_URL = os.getenv("GOOGLE_OAUTH_BASE_URL", "https://oauth2.googleapis.com").rstrip("/")
+GOOGLE_TOKEN_URL = f"{GOOGLE_OAUTH_BASE_URL}/token"
+GOOGLE_REVOKE_URL = f"{GOOGLE_OAUTH_BASE_URL}/revoke"
+
 
 #HELPER FUNCTIONS
 async def refresh_access_token_if_needed(user_id: str, supabase):
@@ -54,8 +60,8 @@ async def refresh_access_token_if_needed(user_id: str, supabase):
         "grant_type": "refresh_token"
     }
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post("https://oauth2.googleapis.com/token", data=refresh_payload)
+    async with http_clients.borrow("oauth") as client:
+        resp = await client.post(GOOGLE_TOKEN_URL, data=refresh_payload)
         if resp.status_code != 200:
             raise Exception(f"Failed to refresh token: {resp.text}")
         new_token = resp.json()
@@ -246,7 +252,7 @@ def analyze_communication_patterns(emails):
 
 async def scrape_brand_context(url: str) -> dict:
     try:
-        async with httpx.AsyncClient(timeout=20, follow_redirects=True) as http:
+        async with http_clients.borrow("web") as http:
             # Get main page
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
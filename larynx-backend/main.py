@@ -4,7 +4,8 @@ from datetime import datetime, timedelta, timezone
 import asyncio
 import logging
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from starlette.middleware.sessions import SessionMiddleware
 
 from routes.auth_routes import router as auth_router
@@ -14,10 +15,11 @@ from routes.brand_scrape import router as brand_scrape
 from routes.inventory_routes import router as inventory_routes
 from routes.inbox_routes import router as inbox_router
 from routes.analytics_routes import router as analytics_router
+from routes.gmail_push_routes import router as gmail_push_router
+from services.gmail_rate_limiter import GmailRateLimitError
 
 
 
-from config import supabase
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -50,6 +52,17 @@ app.add_middleware(
 def root():
     return {"message": "Welcome to EmailAI 🔐"}
 
+@app.exception_handler(GmailRateLimitError)
+async def gmail_rate_limit_handler(request: Request, exc: GmailRateLimitError):
+    """
+    Gmail quota exhausted even after backing off - ask the client to retry later
+    """
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Gmail is rate limiting requests, try again shortly"},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
+
 app.include_router(auth_router)
 app.include_router(email_router)
 app.include_router(draft_router)
@@ -57,6 +70,7 @@ app.include_router(brand_scrape)
 app.include_router(inventory_routes)
 app.include_router(inbox_router)
 app.include_router(analytics_router)
+app.include_router(gmail_push_router)
 
 
 @app.on_event("startup")
@@ -65,12 +79,15 @@ async def startup_event():
     Restore monitoring for users who were being monitored before server restart
     """
     from routes.inbox_routes import restore_monitoring_and_start_cleanup, periodic_cleanup
+    from services.gmail_push import check_push_config
 
     try:
+        check_push_config()
+
         # Restore monitoring only for users who were actively being monitored
         await restore_monitoring_and_start_cleanup()
 
-        # Start periodic cleanup task
+        # Start the monitoring watchdog (restarts dead or hung monitor cycles)
         asyncio.create_task(periodic_cleanup())
 
         logging.info("Email monitoring startup completed")
@@ -83,21 +100,26 @@ async def shutdown_event():
     """
     Stop all monitoring tasks when the app shuts down
     """
-    from routes.inbox_routes import stop_monitoring_task_only, active_monitoring_tasks
+    from routes.inbox_routes import monitor_scheduler, lease_manager, email_pipeline, user_states
+    from services.message_ledger import message_ledger
+    from services.http_clients import http_clients
+    from services.monitor_leases import MONITOR_LEASES_ENABLED
 
     try:
-        # Get all users currently being monitored from database
-        result = supabase.table("users").select("id").eq("is_monitoring", True).execute()
-
-        for user_id in list(active_monitoring_tasks):
-            try:
-                await stop_monitoring_task_only(user_id)
-                logging.info(f"[shutdown] Cleared monitoring for user {user_id}")
-            except Exception as e:
-                logging.error(f"[shutdown] Error clearing monitoring for user {user_id}: {str(e)}")
-
-        logging.info("✅ All monitoring users cleared from active_monitoring_tasks.")
-
+        # Let in-flight emails finish (no new cycles start), then stop everything
+        await monitor_scheduler.drain()
+
+        scheduled = len(monitor_scheduler.scheduled_users())
+        await monitor_scheduler.stop()
+        await email_pipeline.stop()
+        user_states.flush()
+        message_ledger.flush(force=True)
+        await http_clients.aclose()
+        logging.info(f"✅ Monitor scheduler stopped ({scheduled} users cleared).")
+
+        if MONITOR_LEASES_ENABLED:
+            # Hand our users to the other workers right away instead of waiting for expiry
+            lease_manager.release_all()
 
     except Exception as e:
         logging.error(f"Error during shutdown: {str(e)}")
\ No newline at end of file
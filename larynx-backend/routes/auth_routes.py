@@ -4,9 +4,10 @@ from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Request, HTTPException
 from starlette.middleware.sessions import SessionMiddleware
-import httpx
 
 from config import supabase, oauth  # Shared objects from your config
+from services.http_clients import http_clients
+from functions import GOOGLE_REVOKE_URL
 
 from pydantic import BaseModel
 import os
@@ -122,9 +123,9 @@ async def delete_user_account(request: Request):
         refresh_token = token_response.data[0]["refresh_token"] if token_response.data else None
 
         if refresh_token:
-            async with httpx.AsyncClient() as client:
+            async with http_clients.borrow("oauth") as client:
                 revoke_response = await client.post(
-                    "https://oauth2.googleapis.com/revoke",
+                    GOOGLE_REVOKE_URL,
                     data={"token": refresh_token},
                     headers={"Content-Type": "application/x-www-form-urlencoded"}
                 )
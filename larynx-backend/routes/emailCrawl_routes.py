@@ -1,157 +1,77 @@
 import os
 import json
-import base64
 import logging
 from datetime import datetime, timedelta, timezone
-from collections import Counter
 
 
-import httpx
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from starlette.middleware.sessions import SessionMiddleware
 
 from config import supabase
-from functions import clean_email_body, analyze_email_batch, store_tone_profile, refresh_access_token_if_needed
+from functions import store_tone_profile, refresh_access_token_if_needed
+from services.crawl_engine import crawl_sent_emails
+from services.draft_composer import signature_cache
 
 
 router = APIRouter()
 
-@router.get("/crawl-emails")
-async def crawl_emails(request: Request):
+def crawl_user_from_session(request: Request) -> str:
     email = request.session.get("user_email")
     if not email:
         raise HTTPException(status_code=401, detail="User not authenticated -- lacking Email")    
     user_id = request.session.get("user_id")
     if not user_id:
         raise HTTPException(status_code=401, detail="User not authenticated -- lacking User ID")    
-    
-    token_response = supabase.table("tokens").select("access_token").eq("user_id", user_id).execute()
+    return user_id
+
+@router.get("/crawl-emails")
+async def crawl_emails(request: Request):
+    user_id = crawl_user_from_session(request)
     access_token = await refresh_access_token_if_needed(user_id, supabase)
 
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
 
-    async with httpx.AsyncClient() as client:
-        # Fetch list of message IDs
-        r = await client.get(
-            "https://gmail.googleapis.com/gmail/v1/users/me/messages",
-            headers=headers,
-            params={"maxResults": 100, "labelIds": "SENT"} # change to 100 once testing over! TODO
-        )
-        messages = r.json().get("messages", [])
-        signature_counter = Counter()
-        email_data = []
-
-        for msg in messages:
-            msg_id = msg["id"]
-            r = await client.get(
-                f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{msg_id}",
-                headers=headers
-            )
-            full_msg = r.json()
-            
-            headers_list = full_msg["payload"].get("headers", [])
-            subject = next((h["value"] for h in headers_list if h["name"] == "Subject"), "(No Subject)")
-            sender = next((h["value"] for h in headers_list if h["name"] == "From"), "(Unknown Sender)")
-            
-            # Skip if sender looks like a bot or system
-            bot_senders = ["no-reply", "noreply", "notifications@", "calendar@", "automated@", "do-not-reply"]
-            if any(bot_id in sender.lower() for bot_id in bot_senders):
-                continue
+    result = None
+    async for event in crawl_sent_emails(user_id, headers):
+        if event["event"] == "complete":
+            result = event
+    
+    return {
+        "emails_processed": result["emails_processed"],
+        "signature_extracted": result["signature_extracted"],
+        "tone_profile": result["tone_profile"]
+    }
 
-            # Initialize variables
-            raw_body = ""
-            
-            # Decode the body
-            try:
-                if "data" in full_msg["payload"].get("body", {}):
-                    raw_body = base64.urlsafe_b64decode(full_msg["payload"]["body"]["data"]).decode("utf-8", errors="ignore")
-                elif "parts" in full_msg["payload"]:
-                    for part in full_msg["payload"]["parts"]:
-                        if part["mimeType"] == "text/plain" and "data" in part["body"]:
-                            raw_body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
-                            break
-            except Exception as e:
-                print(f"Error decoding email body for message {msg_id}: {e}")
-                raw_body = ""
+@router.get("/crawl-emails/stream")
+async def crawl_emails_stream(request: Request):
+    """
+    Same crawl as /crawl-emails, streamed as Server-Sent Events:
+    progress counts while fetching and cleaning, then the tone profile and signature
+    """
+    user_id = crawl_user_from_session(request)
+    access_token = await refresh_access_token_if_needed(user_id, supabase)
 
-            # Clean with Talon + custom logic
-            body, sig = clean_email_body(raw_body)
-            if sig:
-                normalized_sig = "\n".join([line.strip() for line in sig.strip().splitlines() if line.strip()])
-                signature_counter[normalized_sig] += 1
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
 
-            # Only add emails with meaningful content
-            if body and body.strip():
-                email_data.append({
-                    "message_id": msg_id,
-                    "subject": subject,
-                    "from": sender,
-                    "body": body
-                })
-            
-        # Check if we have enough usable emails for analysis
-        if len(email_data) >= 5:  # Require at least 5 emails for meaningful analysis
-            tone_profile = analyze_email_batch(email_data)
-            store_tone_profile(user_id, tone_profile)
-            profile_type = "analyzed"
-        else:
-            # Fall back to generic tone profile
-            tone_profile = {
-                "avg_sentences_per_email": 3.5,
-                "top_words": [
-                    ["please", 15], ["thank", 12], ["regards", 10], ["best", 10],
-                    ["hope", 8], ["you", 8], ["well", 7], ["let", 6], ["know", 6],
-                    ["time", 5], ["appreciate", 5], ["looking", 4], ["forward", 4],
-                    ["hearing", 4], ["questions", 4]
-                ],
-                "top_nouns": [
-                    ["regards", 12], ["time", 8], ["questions", 6], ["information", 5],
-                    ["assistance", 5], ["opportunity", 4], ["response", 4],
-                    ["consideration", 4], ["support", 3], ["help", 3]
-                ],
-                "top_verbs": [
-                    ["please", 15], ["thank", 12], ["hope", 8], ["let", 6],
-                    ["know", 6], ["appreciate", 5], ["looking", 4], ["hearing", 4],
-                    ["reach", 3], ["contact", 3]
-                ],
-                "top_adjectives": [
-                    ["best", 10], ["available", 5], ["additional", 4], ["necessary", 3],
-                    ["important", 3], ["specific", 3], ["further", 3], ["relevant", 2],
-                    ["appropriate", 2], ["professional", 2]
-                ],
-                "formality_score": 0.65,
-                "politeness_analysis": {
-                    "politeness_level": 2.1,
-                    "directness_level": 0.4,
-                    "communication_style": "polite"
-                },
-                "emotional_tone": {
-                    "enthusiasm": 0.6, "concern": 0.1, "gratitude": 1.2,
-                    "apologetic": 0.2, "exclamation_frequency": 0.3,
-                    "question_frequency": 0.4, "dominant_emotion": "gratitude"
-                },
-                "communication_patterns": {
-                    "preferred_opening": "professional_greeting",
-                    "avg_paragraphs": 2.5, "avg_sentence_length": 15.8
-                }
-            }
-            store_tone_profile(user_id, tone_profile)
-            profile_type = "generic_fallback"
-        
-        if signature_counter:
-            signature, _ = signature_counter.most_common(1)[0]
-            supabase.table("users").update({"signature": signature}).eq("id", user_id).execute()
-            safe_signature = signature.strip()
-        else:
-            safe_signature = None
+    async def event_stream():
+        try:
+            async for event in crawl_sent_emails(user_id, headers):
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logging.error(f"Error crawling emails for user {user_id}: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'event': 'error', 'detail': 'Email crawl failed'})}\n\n"
 
-        return {
-            "emails_processed": len(email_data),
-            "signature_extracted": safe_signature,
-            "tone_profile": tone_profile
-        }
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Don't let proxies buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/set-generic-tone")
@@ -265,6 +185,7 @@ async def set_generic_tone(request: Request):
                 generic_signature = f"Best regards,\n{formatted_name}"
             
             supabase.table("users").update({"signature": generic_signature}).eq("id", user_id).execute()
+            signature_cache.invalidate(user_id)
         else:
             generic_signature = current_signature
 
@@ -346,6 +267,9 @@ async def update_signature(request: Request, signature_data: SignatureUpdateRequ
         if not result.data:
             raise HTTPException(status_code=404, detail="User not found")
         
+        # Drafts created from now on use the new signature
+        signature_cache.invalidate(user_id)
+        
         return {
             "status": "success",
             "message": "Signature updated successfully",
@@ -0,0 +1,67 @@
+import hmac
+import logging
+
+from fastapi import APIRouter, Request, HTTPException
+
+from config import supabase
+from services.gmail_push import GMAIL_PUSH_VERIFICATION_TOKEN, decode_push_notification
+from services.monitor_leases import MONITOR_LEASES_ENABLED
+from routes.inbox_routes import monitor_scheduler
+
+router = APIRouter()
+
+
+def ilike_literal(value: str) -> str:
+    """
+    Escape LIKE wildcards so ilike matches value exactly, ignoring case
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.post("/gmail/push")
+async def gmail_push_notification(request: Request, token: str = ""):
+    """
+    Pub/Sub push endpoint for Gmail watch notifications.
+    Triggers a sync for only the mailbox that changed.
+    """
+    # Without a configured token every request is refused, not trusted
+    if not GMAIL_PUSH_VERIFICATION_TOKEN or not hmac.compare_digest(token, GMAIL_PUSH_VERIFICATION_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid push token")
+
+    try:
+        envelope = await request.json()
+    except Exception:
+        envelope = None
+
+    notification = decode_push_notification(envelope) if isinstance(envelope, dict) else None
+    if not notification:
+        # Acknowledge anyway - Pub/Sub would otherwise redeliver it forever
+        return {"status": "ignored", "reason": "not_a_gmail_notification"}
+
+    try:
+        # Addresses are stored as the user typed them at signup, Gmail sends them lowercased
+        result = supabase.table("users").select("id", "is_monitoring").ilike(
+            "email", ilike_literal(notification["email_address"])
+        ).execute()
+    except Exception as e:
+        logging.error(f"Error looking up user for push notification: {str(e)}")
+        # Non-2xx makes Pub/Sub retry later
+        raise HTTPException(status_code=503, detail="User lookup failed")
+
+    user = next((row for row in result.data if row.get("is_monitoring")), None)
+    if user is None:
+        return {"status": "ignored", "reason": "not_monitoring"}
+
+    user_id = user["id"]
+    if monitor_scheduler.trigger(user_id):
+        logging.info(f"📨 Push notification for user {user_id} (historyId {notification['history_id']}), sync queued")
+        return {"status": "queued", "user_id": user_id}
+
+    if MONITOR_LEASES_ENABLED:
+        # Another worker holds the user's lease - non-2xx makes Pub/Sub redeliver,
+        # and the retry may land on the owner
+        logging.info(f"Push notification for user {user_id} arrived at a worker that doesn't own it, asking for redelivery")
+        raise HTTPException(status_code=503, detail="User is monitored by another worker")
+
+    # Monitoring is on but not scheduled in this process - the safety-net poll will catch up
+    return {"status": "ignored", "reason": "no_active_monitor"}
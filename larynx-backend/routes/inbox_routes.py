@@ -4,7 +4,7 @@ import base64
 import logging
 import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional, Set
+from typing import List, Dict, Optional, Set, Tuple
 import threading
 import time
 import re
@@ -14,16 +14,58 @@ from typing import Optional, Dict, List
 from email.utils import parsedate_to_datetime
 import httpx
 from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from config import supabase
 from functions import clean_email_body, refresh_access_token_if_needed, fetch_tone_profile
 from routes.draft_routes import InventoryMatcher, create_draft_with_gpt
+from services.gmail_sync import GMAIL_API_URL, sync_new_message_ids, save_history_cursor
+from services.gmail_push import is_push_enabled, ensure_gmail_watch, forget_user
+from services.monitor_scheduler import MonitorScheduler
+from services.monitor_watchdog import MonitorWatchdog
+from services.poll_interval import AdaptivePollInterval, MONITOR_MAX_INTERVAL_SECONDS
+from services.monitor_leases import MonitorLeaseManager, MONITOR_LEASES_ENABLED, LEASE_HEARTBEAT_SECONDS
+from services.email_pipeline import EmailPipeline, PipelineStage, PipelineItem, FAILED, ABANDONED
+from services.user_state import UserStateRegistry
+from services.gmail_rate_limiter import gmail_request, gmail_rate_limiter, GmailRateLimitError
+from services.gmail_batch import batch_get_messages
+from services.http_clients import http_clients
+from services.mime_body import extract_body_and_html
+from services.email_classifiers import bot_detector, customer_detector
+from services.filter_decisions import filter_decisions
+from services.seen_filter import seen_filter
+from services.message_ledger import message_ledger
+from services.gmail_labels import gmail_labels, PROCESSED as LABEL_PROCESSED, FILTERED as LABEL_FILTERED
+from services.draft_composer import thread_headers, has_thread_headers, signature_cache, THREAD_HEADER_NAMES
+from services.email_jobs import (
+    create_job_store, job_reached, DRAFTED, GMAIL_DRAFTED, STORED, FINAL_JOB_STATES,
+    SKIPPED as JOB_SKIPPED
+)
 
 router = APIRouter()
 
 # ─── Global state for tracking processed emails ──────────────────────────────────────
-active_monitoring_tasks: Set[str] = set()
+# Starting seconds between inbox polls, adapted per user from inbox activity.
+# With Gmail push enabled polling is only a safety net.
+POLL_INTERVAL_SECONDS = int(os.getenv("MONITOR_POLL_INTERVAL_SECONDS", "300"))
+PUSH_SAFETY_NET_INTERVAL_SECONDS = int(os.getenv("MONITOR_PUSH_SAFETY_NET_SECONDS", "1800"))
+
+# Per-user adaptive poll intervals
+poll_intervals: Dict[str, AdaptivePollInterval] = {}
+
+# Which monitored users this process owns when running several workers/pods
+lease_manager = MonitorLeaseManager()
+
+# Cached users rows (monitoring flag, created_at, last check) with batched heartbeats
+user_states = UserStateRegistry()
+
+# History cursors waiting for their cycle to finish processing before being saved
+pending_history_cursors: Dict[str, str] = {}
+
+# Durable per-email jobs, and the unfinished ones found at startup (by user)
+job_store = create_job_store()
+resumable_jobs: Dict[str, List[Dict]] = {}
 
 
 # ─── Response Models ──────────────────────────────────────────────────
@@ -44,6 +86,7 @@ class MonitoringStatus(BaseModel):
     emails_processed_today: int
     last_check: Optional[str]
     account_created_at: Optional[str]
+    poll_interval_seconds: Optional[float] = None
 
 class NewEmailNotification(BaseModel):
     user_id: str
@@ -57,35 +100,17 @@ async def is_email_already_seen(user_id: str, message_id: str) -> bool:
     Check if we've already evaluated this email (processed OR filtered)
     Returns True if we should skip this email
     """
-    try:
-        # Check if already processed successfully
-        processed = supabase.table("drafts").select("id").eq("user_id", user_id).eq("message_id", message_id).limit(1).execute()
-        if len(processed.data) > 0:
-            return True
-        
-        # Check if already filtered out
-        filtered = supabase.table("filtered_emails").select("id").eq("user_id", user_id).eq("message_id", message_id).limit(1).execute()
-        if len(filtered.data) > 0:
-            return True
-            
-        return False
-    except Exception as e:
-        logging.error(f"Error checking if email already seen: {str(e)}")
-        return False
+    return not seen_filter.filter_unseen(user_id, [message_id])
 
 async def mark_email_as_filtered(user_id: str, message_id: str, reason: str, sender: str = "", subject: str = ""):
     """
     Mark an email as filtered so we don't check it again
+    (queued and written in bulk with the other decisions, see message_ledger)
     """
     try:
-        supabase.table("filtered_emails").upsert({
-            "user_id": user_id,
-            "message_id": message_id,
-            "filter_reason": reason,
-            "sender": sender[:255] if sender else "",  # Limit length
-            "subject": subject[:255] if subject else "",  # Limit length
-            "created_at": datetime.utcnow().isoformat()
-        }, on_conflict="user_id,message_id").execute()
+        message_ledger.record_filtered(user_id, message_id, reason, sender, subject)
+        seen_filter.mark_seen(user_id, message_id)
+        gmail_labels.mark(user_id, message_id, LABEL_FILTERED)
         
         logging.info(f"Marked email {message_id} as filtered: {reason}")
     except Exception as e:
@@ -100,46 +125,51 @@ async def check_for_new_emails(user_id: str) -> List[Dict]:
         access_token = await refresh_access_token_if_needed(user_id, supabase)
         headers = {"Authorization": f"Bearer {access_token}"}
         
-        # Get account creation date
+        # Keep the Gmail push watch alive (no-op unless push mode is enabled)
+        await ensure_gmail_watch(user_id, headers)
+        
+        # Get account creation date (cached with the user's monitoring state)
         account_created = await get_user_account_creation_date(user_id)
         
-        # Build query to get emails after account creation
+        # Build query to get emails after account creation (used for full syncs)
         query_params = {
-            "maxResults": 50,
-            "format": "metadata"
+            "maxResults": 50
         }
         
         if account_created:
             after_date = account_created.strftime("%Y/%m/%d")
             query_params["q"] = f"category:primary -label:^auto after:{after_date}"
         
-        async with httpx.AsyncClient() as client:
-            r = await client.get(
-                "https://gmail.googleapis.com/gmail/v1/users/me/messages",
-                headers=headers,
-                params=query_params
-            )
-            
-            if r.status_code != 200:
-                logging.error(f"Gmail API error: {r.text}")
-                return []
+        # Skip mail we've already labelled as handled (GMAIL_LABELS_ENABLED)
+        label_exclusion = gmail_labels.query_exclusion()
+        if label_exclusion:
+            query_params["q"] = f"{query_params.get('q', '')} {label_exclusion}".strip()
+        
+        async with http_clients.borrow("gmail") as client:
+            # Only messages added since the last history cursor (or a full listing as fallback)
+            sync = await sync_new_message_ids(client, headers, user_id, query_params)
             
-            messages = r.json().get("messages", [])
             new_emails = []
-            checked_count = 0
-            skipped_count = 0
             
-            for msg in messages:
-                msg_id = msg["id"]
-                checked_count += 1
-                
-                # 🔥 Skip if already seen (processed OR filtered)
-                if await is_email_already_seen(user_id, msg_id):
-                    skipped_count += 1
-                    continue
-                
+            # 🔥 Skip if already seen (processed OR filtered) - answered from memory, only misses hit the database
+            unseen_ids = seen_filter.filter_unseen(user_id, sync["message_ids"])
+            checked_count = len(sync["message_ids"])
+            skipped_count = checked_count - len(unseen_ids)
+            
+            # Phase 1: headers only - reject obvious bots and old mail without downloading bodies
+            survivors = []
+            if unseen_ids:
+                metadata = await batch_get_messages(client, headers, user_id, unseen_ids, params=METADATA_FETCH_PARAMS)
+                for msg_id in unseen_ids:
+                    if await screen_email_headers(user_id, msg_id, metadata.get(msg_id), account_created):
+                        survivors.append(msg_id)
+            
+            # Phase 2: full messages for the survivors, with batch requests instead of one GET each
+            full_messages = await batch_get_messages(client, headers, user_id, survivors) if survivors else {}
+            
+            for msg_id in survivors:
                 # Fetch full email details
-                email_details = await fetch_email_details(client, headers, msg_id, user_id)
+                email_details = await fetch_email_details(client, headers, msg_id, user_id, full_messages.get(msg_id))
                 if email_details:
                     # Additional filtering based on received date
                     if account_created and email_details.get('received_at'):
@@ -158,32 +188,89 @@ async def check_for_new_emails(user_id: str) -> List[Dict]:
                     new_emails.append(email_details)
                 # If email_details is None, it was already marked as filtered in fetch_email_details
             
-            logging.info(f"📊 Email check for user {user_id}: {checked_count} total, {skipped_count} already seen, {len(new_emails)} new to process")
+            # The cycle advances the cursor once every returned email has been processed
+            if sync["history_id"] and sync["history_id"] != sync["previous_history_id"]:
+                pending_history_cursors[user_id] = sync["history_id"]
+            
+            logging.info(f"📊 Email check for user {user_id} ({sync['mode']} sync): {checked_count} total, {skipped_count} already seen, {len(new_emails)} new to process")
             return new_emails
             
+    except GmailRateLimitError:
+        # The scheduler backs off without counting it as a failure
+        raise
     except Exception as e:
         logging.error(f"Error checking for new emails for user {user_id}: {str(e)}")
         return []
+    finally:
+        # One bulk write for every email filtered this cycle (and any still queued)
+        message_ledger.flush()
+
+# Headers the bot detector and date filter look at, fetched with format=metadata
+SCREENING_HEADERS = [
+    "From", "Subject", "Date",
+    "Auto-Submitted", "Precedence", "List-Id", "List-Unsubscribe", "List-Subscribe",
+    "X-Campaign", "X-CampaignID", "X-Mailgun-Sid", "X-Mailgun-Tag", "X-SG-EID", "X-SG-ID", "X-Sendgrid-ID",
+]
+METADATA_FETCH_PARAMS = {
+    "format": "metadata",
+    "metadataHeaders": SCREENING_HEADERS,
+    "fields": "id,labelIds,payload/headers",
+}
+
+async def screen_email_headers(user_id: str, msg_id: str, metadata: Optional[Dict],
+                               account_created: Optional[datetime]) -> bool:
+    """
+    Header-only screening before the full download. Returns False (and marks the
+    email as filtered) only when the full checks would filter it anyway.
+    """
+    if not metadata:
+        return True  # let the full fetch decide (and record any API error)
+    
+    headers_list = metadata.get("payload", {}).get("headers", [])
+    subject = next((h["value"] for h in headers_list if h["name"] == "Subject"), "(No Subject)")
+    sender = next((h["value"] for h in headers_list if h["name"] == "From"), "(Unknown Sender)")
+    
+    # Undecided (the body could still swing it) unless the headers settle it
+    verdict = bot_detector.evaluate(sender, subject, headers_list)
+    if verdict["is_bot"]:
+        filter_decisions.record(user_id, msg_id, "headers", verdict)
+        await mark_email_as_filtered(user_id, msg_id, "bot_email", sender, subject)
+        return False
+    
+    date_header = next((h["value"] for h in headers_list if h["name"] == "Date"), None)
+    if account_created and date_header:
+        try:
+            received_at = parsedate_to_datetime(date_header)
+        except Exception:
+            received_at = None
+        if received_at is not None:
+            if received_at.tzinfo is None:
+                received_at = received_at.replace(tzinfo=timezone.utc)
+            if received_at <= account_created:
+                await mark_email_as_filtered(user_id, msg_id, "date_filter", sender, subject)
+                return False
+    
+    return True
 
-async def fetch_email_details(client: httpx.AsyncClient, headers: dict, msg_id: str, user_id: str) -> Optional[Dict]:
+async def fetch_email_details(client: httpx.AsyncClient, headers: dict, msg_id: str, user_id: str,
+                              full_msg: Optional[Dict] = None) -> Optional[Dict]:
     """
     Fetch detailed email information from Gmail with enhanced bot detection
     Now marks filtered emails in database
+    Pass full_msg when the message was already fetched (e.g. in a batch)
     """
-    detector = BotEmailDetector()
-    customer_detector = CustomerDetector()
-    
     try:
-        r = await client.get(
-            f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{msg_id}",
-            headers=headers
-        )
-        
-        if r.status_code != 200:
-            await mark_email_as_filtered(user_id, msg_id, "api_error", "", "")
-            return None
-        
-        full_msg = r.json()
+        if full_msg is None:
+            r = await gmail_request(
+                client, "GET", f"{GMAIL_API_URL}/messages/{msg_id}", user_id, "messages.get",
+                headers=headers
+            )
+            
+            if r.status_code != 200:
+                await mark_email_as_filtered(user_id, msg_id, "api_error", "", "")
+                return None
+            
+            full_msg = r.json()
         
         # Extract headers
         headers_list = full_msg["payload"].get("headers", [])
@@ -200,13 +287,15 @@ async def fetch_email_details(client: httpx.AsyncClient, headers: dict, msg_id:
                 pass
         
         # Extract body
-        raw_body = extract_email_body(full_msg)
+        raw_body, body_html = extract_body_and_html(full_msg)
         if not raw_body or len(raw_body.strip()) < 10:
             await mark_email_as_filtered(user_id, msg_id, "empty_body", sender, subject)
             return None
         
         # Enhanced bot detection
-        if detector.is_bot_email(sender, subject, raw_body, headers_list):
+        verdict = bot_detector.evaluate(sender, subject, headers_list, raw_body, body_html)
+        filter_decisions.record(user_id, msg_id, "full", verdict)
+        if verdict["is_bot"]:
             await mark_email_as_filtered(user_id, msg_id, "bot_email", sender, subject)
             return None
         
@@ -225,9 +314,14 @@ async def fetch_email_details(client: httpx.AsyncClient, headers: dict, msg_id:
             "subject": subject,
             "sender": sender,
             "raw_body": raw_body,
-            "received_at": received_at
+            "received_at": received_at,
+            # Carried through the pipeline so the reply draft needs no extra Gmail read
+            **thread_headers(full_msg)
         }
         
+    except GmailRateLimitError:
+        # Not the email's fault - leave it unseen so a later cycle picks it up
+        raise
     except Exception as e:
         logging.error(f"Error fetching email details for {msg_id}: {str(e)}")
         await mark_email_as_filtered(user_id, msg_id, "processing_error", "", "")
@@ -246,6 +340,10 @@ async def cleanup_old_filtered_emails():
         if result.data:
             logging.info(f"Cleaned up {len(result.data)} old filtered email records")
         
+        purged = message_ledger.purge()
+        if purged:
+            logging.info(f"Cleaned up {purged} old message ledger records")
+        
     except Exception as e:
         logging.error(f"Error cleaning up filtered emails: {str(e)}")
 
@@ -260,18 +358,23 @@ async def debug_filtered_emails(request: Request, limit: int = 20):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
-        result = supabase.table("filtered_emails").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
+        filtered = message_ledger.recent_filtered(user_id, limit)
         
         # Group by filter reason for summary
         summary = {}
-        for record in result.data:
+        for record in filtered:
             reason = record['filter_reason']
             summary[reason] = summary.get(reason, 0) + 1
+            # Which bot signals fired and what they cost (while this process still has it)
+            record['bot_decision'] = filter_decisions.for_message(user_id, record['message_id'])
         
         return {
-            "filtered_emails": result.data,
+            "filtered_emails": filtered,
             "summary": summary,
-            "total_filtered": len(result.data)
+            "total_filtered": len(filtered),
+            # Every recent bot check, including emails that passed
+            "recent_bot_decisions": filter_decisions.recent(user_id, limit),
+            "bot_signal_stats": filter_decisions.stats()
         }
         
     except Exception as e:
@@ -280,12 +383,17 @@ async def debug_filtered_emails(request: Request, limit: int = 20):
 
 async def stop_monitoring_task_only(user_id: str):
     """
-    Stops tracking background monitoring for the user.
-    Does NOT cancel actual asyncio tasks (not stored).
+    Removes the user from this process's monitor scheduler and cancels
+    a cycle that is currently running for them.
     Does NOT update DB.
     """
-    if user_id in active_monitoring_tasks:
-        active_monitoring_tasks.remove(user_id)
+    if monitor_scheduler.remove_user(user_id, cancel=True):
+        forget_user(user_id)
+        gmail_rate_limiter.forget_user(user_id)
+        seen_filter.forget(user_id)
+        gmail_labels.forget(user_id)
+        filter_decisions.forget(user_id)
+        poll_intervals.pop(user_id, None)
         logging.info(f"[shutdown] Stopped tracking monitoring for user {user_id}")
     
     
@@ -297,6 +405,8 @@ async def start_email_monitoring(user_id: str):
         # Check current status from database
         result = supabase.table("users").select("is_monitoring").eq("id", user_id).execute()
         if result.data and result.data[0].get("is_monitoring"):
+            # Make sure some process is actually running it (no-op if already scheduled)
+            claim_and_schedule_user(user_id, delay=0)
             return {"status": "already_monitoring", "user_id": user_id}
         
         # Update database to mark as monitoring
@@ -306,8 +416,11 @@ async def start_email_monitoring(user_id: str):
             "last_email_check": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
         
-        # Start background monitoring task
-        asyncio.create_task(monitor_user_emails(user_id))
+        user_states.invalidate(user_id)
+        
+        # Schedule the first check right away
+        claim_and_schedule_user(user_id, delay=0)
+        logging.info(f"🟢 STARTING email monitoring for user {user_id}")
         
         return {"status": "monitoring_started", "user_id": user_id}
         
@@ -326,85 +439,148 @@ async def stop_email_monitoring(user_id: str):
             "last_email_check": datetime.utcnow().isoformat()
         }).eq("id", user_id).execute()
         
+        user_states.invalidate(user_id)
+        
+        await stop_monitoring_task_only(user_id)
+        if MONITOR_LEASES_ENABLED:
+            lease_manager.release(user_id)
         
         return {"status": "monitoring_stopped", "user_id": user_id}
         
     except Exception as e:
         logging.error(f"Error stopping monitoring for user {user_id}: {str(e)}")
         return {"status": "error", "user_id": user_id, "error": str(e)}
-async def monitor_user_emails(user_id: str):
+async def run_monitoring_cycle(user_id: str) -> Optional[float]:
     """
-    Continuously monitor emails for a specific user with better error handling
+    Run one monitoring pass for a user. Called by the monitor scheduler.
+    Returns seconds until the next pass, or None to stop monitoring.
+    Exceptions are counted by the scheduler, which stops monitoring after repeated errors.
     """
-    if user_id in active_monitoring_tasks:
-        logging.info(f"Monitoring already active for user {user_id}")
-        return
+    if MONITOR_LEASES_ENABLED and not lease_manager.owns(user_id):
+        logging.info(f"🔀 Lease for user {user_id} is no longer held by this worker, unscheduling")
+        poll_intervals.pop(user_id, None)
+        return None
     
-    active_monitoring_tasks.add(user_id)
+    # Check if monitoring is still enabled (cached; start/stop invalidate it)
+    state = user_states.get(user_id)
+    if state is None or not state.is_monitoring:
+        logging.info(f"❌ Monitoring disabled for user {user_id}, stopping...")
+        forget_user(user_id)
+        poll_intervals.pop(user_id, None)
+        user_states.invalidate(user_id)
+        return None
+    
+    # Record the heartbeat (this prevents stale detection); flushed in bulk
+    user_states.touch(user_id)
     
-    logging.info(f"🟢 STARTING email monitoring for user {user_id}")
+    # Check for new emails (this now handles all filtering internally)
+    logging.info(f"🔍 Checking for new emails for user {user_id}...")
+    new_emails = await check_for_new_emails(user_id)
     
-    consecutive_errors = 0
-    max_consecutive_errors = 3
+    logging.info(f"📊 Found {len(new_emails)} emails ready for processing for user {user_id}")
+    
+    resumed_jobs = resumable_jobs.pop(user_id, [])
+    all_processed = True
+    if new_emails or resumed_jobs:
+        all_processed = await process_new_emails(user_id, new_emails, resumed_jobs)
+    else:
+        logging.info(f"✅ No new emails to process for user {user_id}")
     
+    # Label what this cycle handled so the next listing skips it
+    if gmail_labels.has_pending(user_id):
+        await apply_gmail_labels(user_id)
+    
+    # Keep the old cursor if anything was left unprocessed so it is retried next cycle
+    # (emails that did get processed are skipped as already seen)
+    history_id = pending_history_cursors.pop(user_id, None)
+    if history_id and all_processed:
+        save_history_cursor(user_id, history_id)
+    
+    # Adapt the interval to inbox activity; a Gmail push notification triggers the next pass early
+    poll_interval = get_poll_interval(user_id).record_cycle(len(new_emails))
+    logging.info(f"⏰ User {user_id}: Next check in {poll_interval:.0f} seconds")
+    return poll_interval
+
+
+async def apply_gmail_labels(user_id: str):
+    """
+    Apply the queued Larynx/Processed and Larynx/Filtered labels in bulk
+    """
     try:
-        while True:
-            try:
-                # Check if monitoring is still enabled in database
-                result = supabase.table("users").select("is_monitoring").eq("id", user_id).execute()
-                if not result.data or not result.data[0].get("is_monitoring"):
-                    logging.info(f"❌ Monitoring disabled for user {user_id}, stopping...")
-                    break
-                
-                # Update last check time (this prevents stale detection)
-                supabase.table("users").update({
-                    "last_email_check": datetime.utcnow().isoformat()
-                }).eq("id", user_id).execute()
-                
-                # Reset error counter on successful database update
-                consecutive_errors = 0
-                
-                # Check for new emails (this now handles all filtering internally)
-                logging.info(f"🔍 Checking for new emails for user {user_id}...")
-                new_emails = await check_for_new_emails(user_id)
-                
-                logging.info(f"📊 Found {len(new_emails)} emails ready for processing for user {user_id}")
-                
-                if new_emails:
-                    for email in new_emails:
-                        try:
-                            # 🔥 REMOVED: is_message_already_processed check
-                            # The new check_for_new_emails() function already handles this
-                            
-                            logging.info(f"✉️ Processing email: {email['subject'][:50]}...")
-                            await process_and_store_email(user_id, email)
-                            
-                        except Exception as e:
-                            logging.error(f"❌ Error processing email {email['message_id']}: {str(e)}")
-                else:
-                    logging.info(f"✅ No new emails to process for user {user_id}")
-                
-                # Wait before next check
-                logging.info(f"⏰ User {user_id}: Waiting another 2 minutes...")
-                await asyncio.sleep(300)  # CHANGE TO 30 mins -- 1800 or an hr -- 300 for testing (5mins) 
-                
-            except Exception as e:
-                consecutive_errors += 1
-                logging.error(f"❌ Error in email monitoring for user {user_id} (attempt {consecutive_errors}): {str(e)}")
-                
-                if consecutive_errors >= max_consecutive_errors:
-                    logging.error(f"🛑 Too many consecutive errors for user {user_id}, stopping monitoring")
-                    await stop_email_monitoring(user_id)
-                    break
-                
-                # Wait longer after errors
-                await asyncio.sleep(60)
-                
-    finally:
-        # This should only happen when the function exits
-        active_monitoring_tasks.discard(user_id)
-        logging.info(f"🔴 STOPPED email monitoring for user {user_id}")
+        access_token = await refresh_access_token_if_needed(user_id, supabase)
+        headers = {"Authorization": f"Bearer {access_token}"}
+        async with http_clients.borrow("gmail") as client:
+            labeled = await gmail_labels.apply(client, headers, user_id)
+        if labeled:
+            logging.info(f"🏷️ Labelled {labeled} handled emails for user {user_id}")
+    except Exception as e:
+        # Still queued; they are retried after the next cycle
+        logging.error(f"Error labelling handled emails for user {user_id}: {str(e)}")
+
+
+def get_poll_interval(user_id: str) -> AdaptivePollInterval:
+    """
+    Get (or create) the adaptive poll interval for a user
+    """
+    tracker = poll_intervals.get(user_id)
+    if tracker is None:
+        ceiling = PUSH_SAFETY_NET_INTERVAL_SECONDS if is_push_enabled() else MONITOR_MAX_INTERVAL_SECONDS
+        tracker = AdaptivePollInterval(initial=POLL_INTERVAL_SECONDS, ceiling=ceiling)
+        poll_intervals[user_id] = tracker
+    return tracker
+
+
+async def give_up_monitoring(user_id: str):
+    """
+    Called by the scheduler after too many consecutive errors
+    """
+    await stop_email_monitoring(user_id)
+
+
+# One scheduler drives every monitored user in this process
+monitor_scheduler = MonitorScheduler(
+    run_cycle=run_monitoring_cycle,
+    on_give_up=give_up_monitoring,
+    transient_errors=(GmailRateLimitError,)
+)
+
+
+def claim_and_schedule_user(user_id: str, delay: Optional[float] = None) -> bool:
+    """
+    Schedule a user in this process - only if we hold its lease when leases are enabled
+    """
+    if MONITOR_LEASES_ENABLED and not lease_manager.try_claim(user_id):
+        logging.info(f"User {user_id} is monitored by another worker")
+        return False
+    return monitor_scheduler.add_user(user_id, delay=delay)
+
+
+async def monitor_lease_heartbeat():
+    """
+    Renew our leases and keep this worker's share of monitored users in line
+    with the live worker set (picks up users of workers that died)
+    """
+    while True:
+        try:
+            # Also refreshes the cached monitoring flags (stops made on other workers)
+            states = user_states.load_monitoring_users()
+            changes = lease_manager.rebalance(state.user_id for state in states)
+            
+            for user_id in changes["released"]:
+                await stop_monitoring_task_only(user_id)
+            for user_id in changes["acquired"]:
+                monitor_scheduler.add_user(user_id)
+            
+            if changes["acquired"] or changes["released"]:
+                logging.info(
+                    f"🔀 Lease rebalance: +{len(changes['acquired'])} / -{len(changes['released'])} users, "
+                    f"{len(lease_manager.owned)} owned across {len(lease_manager.live_workers)} workers"
+                )
+        except Exception as e:
+            logging.error(f"Error in monitoring lease heartbeat: {str(e)}")
         
+        await asyncio.sleep(LEASE_HEARTBEAT_SECONDS)
+
 async def get_user_monitoring_status(user_id: str) -> Dict:
     """
     Get monitoring status from database
@@ -450,8 +626,8 @@ async def restore_monitoring_on_startup():
             user_id = user_data["id"]
             logging.info(f"Restoring monitoring for user {user_id}")
             
-            # Start monitoring task
-            asyncio.create_task(monitor_user_emails(user_id))
+            # Schedule with a jittered first check
+            monitor_scheduler.add_user(user_id)
             
     except Exception as e:
         logging.error(f"Error restoring monitoring on startup: {str(e)}")
@@ -491,6 +667,11 @@ async def cleanup_old_email_data():
                     logging.info(f"Cleaned {len(recent_activity) - len(cleaned_activity)} old activity entries for user {record['user_id']}")
         
         await cleanup_old_filtered_emails()
+        
+        # 3. Drop finished email jobs (keep last 7 days)
+        purged = job_store.purge_finished(datetime.now(timezone.utc) - timedelta(days=7))
+        logging.info(f"Deleted {purged} finished email jobs")
+        
         logging.info("Email data cleanup completed successfully")
         
     except Exception as e:
@@ -525,13 +706,26 @@ async def restore_monitoring_and_start_cleanup():
     Enhanced startup function that restores monitoring AND starts cleanup
     """
     try:
-        # Restore monitoring
-        result = supabase.table("users").select("id").eq("is_monitoring", True).execute()
-        
-        for user_data in result.data:
-            user_id = user_data["id"]
-            logging.info(f"Restoring monitoring for user {user_id}")
-            asyncio.create_task(monitor_user_emails(user_id))
+        monitor_scheduler.start()
+        # Finish emails a previous run left half-processed
+        load_resumable_jobs()
+        
+        if MONITOR_LEASES_ENABLED:
+            # Each worker claims its share of users through leases
+            asyncio.create_task(monitor_lease_heartbeat())
+            logging.info(f"Started monitoring lease heartbeat as worker {lease_manager.worker_id}")
+        else:
+            # Restore monitoring (one query that also fills the user state cache)
+            for state in user_states.load_monitoring_users():
+                user_id = state.user_id
+                logging.info(f"Restoring monitoring for user {user_id}")
+                # Jittered first check so restored users don't all hit Gmail at once
+                monitor_scheduler.add_user(user_id)
+        
+        # Write monitoring heartbeats in bulk (and without leases, pick up stops from other workers)
+        asyncio.create_task(user_states.heartbeat_loop(refresh=not MONITOR_LEASES_ENABLED))
+        # Write filter decisions that wait too long for a cycle to end
+        asyncio.create_task(message_ledger.flush_loop())
         
         # Start cleanup scheduler
         asyncio.create_task(cleanup_scheduler())
@@ -594,49 +788,26 @@ async def get_monitoring_status(request: Request):
         user_id=user_id,
         emails_processed_today=emails_today,
         last_check=status_data["last_email_check"],
-        account_created_at=status_data["account_created_at"]
+        account_created_at=status_data["account_created_at"],
+        poll_interval_seconds=poll_intervals[user_id].interval if user_id in poll_intervals else None
     )
-async def cleanup_stale_monitoring():
+def expected_monitored_users() -> List[str]:
     """
-    Restart monitoring for users whose monitoring tasks have died
+    Users this process should have scheduled, from in-memory state only
     """
-    try:
-        # Find users marked as monitoring but haven't checked in recently
-        cutoff_time = datetime.utcnow() - timedelta(minutes=720)
-        
-        result = supabase.table("users").select("id", "last_email_check").eq("is_monitoring", True).execute()
-        
-        for user_data in result.data:
-            user_id = user_data["id"]
-            last_check = user_data.get("last_email_check")
-            
-            should_restart = False
-            
-            if last_check:
-                last_check_dt = datetime.fromisoformat(last_check)
-                if last_check_dt.tzinfo is None:
-                    last_check_dt = last_check_dt.replace(tzinfo=timezone.utc)
-                
-                if last_check_dt < cutoff_time.replace(tzinfo=timezone.utc):
-                    should_restart = True
-            else:
-                should_restart = True
-            
-            if should_restart:
-                logging.info(f"Restarting failed monitoring for user {user_id}")
-                # Don't stop first - just start a new monitoring task
-                # The new task will update last_email_check immediately
-                asyncio.create_task(monitor_user_emails(user_id))
-                
-    except Exception as e:
-        logging.error(f"Error cleaning up stale monitoring: {str(e)}")
+    user_ids = user_states.monitoring_user_ids()
+    if MONITOR_LEASES_ENABLED:
+        # The lease heartbeat decides which users are ours
+        user_ids = [user_id for user_id in user_ids if lease_manager.owns(user_id)]
+    return user_ids
+
+monitor_watchdog = MonitorWatchdog(monitor_scheduler, expected_users=expected_monitored_users)
+
 async def periodic_cleanup():
     """
-    Run cleanup every 12 hours minutes
+    Run the monitoring watchdog every few seconds
     """
-    while True:
-        await asyncio.sleep(900)  # 15 minutes
-        await cleanup_stale_monitoring()
+    await monitor_watchdog.run()
 
 
 async def get_existing_message_ids(user_id: str) -> Set[str]:
@@ -648,18 +819,8 @@ async def get_user_account_creation_date(user_id: str) -> Optional[datetime]:
     Get when the user account was created to filter emails
     """
     try:
-        result = supabase.table("users").select("created_at").eq("id", user_id).execute()
-        if result.data:
-            created_at_str = result.data[0].get("created_at")
-            if created_at_str:
-                # Parse the Supabase timestamp correctly
-                # Supabase timestamps are in UTC but don't have timezone info
-                dt = datetime.fromisoformat(created_at_str)
-                if dt.tzinfo is None:
-                    # If no timezone info, assume it's UTC (which it is in Supabase)
-                    dt = dt.replace(tzinfo=timezone.utc)
-                return dt
-        return None
+        state = user_states.get(user_id)
+        return state.created_at if state else None
     except Exception as e:
         logging.error(f"Error fetching user creation date: {str(e)}")
         return None
@@ -668,32 +829,6 @@ async def get_user_account_creation_date(user_id: str) -> Optional[datetime]:
 
 
 
-def extract_email_body(full_msg: dict) -> str:
-    """
-    Extract the email body from Gmail API response
-    """
-    body = ""
-    
-    # Check if body is directly in payload
-    if "data" in full_msg["payload"].get("body", {}):
-        try:
-            body = base64.urlsafe_b64decode(full_msg["payload"]["body"]["data"]).decode("utf-8", errors="ignore")
-        except Exception as e:
-            logging.error(f"Error decoding body: {e}")
-    
-    # Check parts for text/plain content
-    elif "parts" in full_msg["payload"]:
-        for part in full_msg["payload"]["parts"]:
-            if part["mimeType"] == "text/plain" and "data" in part["body"]:
-                try:
-                    body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
-                    break
-                except Exception as e:
-                    logging.error(f"Error decoding part: {e}")
-                    continue
-    
-    return body
-
 async def generate_draft_for_email(user_id: str, subject: str, body: str, sender_name: str) -> tuple[str, Optional[List[Dict]]]:
     """
     Generate a draft response for the cleaned email
@@ -784,8 +919,8 @@ async def generate_draft_for_email(user_id: str, subject: str, body: str, sender
         Body: {body}
         """
 
-        # Generate draft
-        draft_text = create_draft_with_gpt(prompt)
+        # Generate draft (blocking OpenAI call, keep it off the event loop)
+        draft_text = await asyncio.to_thread(create_draft_with_gpt, prompt)
         
         
         # Fetch existing analytics
@@ -881,6 +1016,42 @@ async def get_all_monitoring_users(request: Request):
     except Exception as e:
         logging.error(f"Error getting monitoring users: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/monitoring/liveness")
+async def get_monitoring_liveness():
+    """
+    Aggregate health of this process's monitoring loop (for uptime checks).
+    Returns 503 when the scheduler is dead or stuck.
+    """
+    liveness = monitor_watchdog.liveness()
+    if not liveness["healthy"]:
+        return JSONResponse(status_code=503, content=liveness)
+    return liveness
+
+@router.get("/monitoring/scheduler")
+async def get_monitoring_scheduler_stats(request: Request):
+    """
+    Queue depth, lag and worker usage of this process's monitor scheduler (for debugging)
+    """
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    return {
+        **monitor_scheduler.stats(),
+        "leases": lease_manager.stats(),
+        "running": monitor_scheduler.tasks.snapshot(),
+        "pipeline": email_pipeline.stats(),
+        "gmail_quota": gmail_rate_limiter.stats(),
+        "user_states": user_states.stats(),
+        "liveness": monitor_watchdog.liveness(include_users=True),
+        "http_pools": http_clients.stats(),
+        "signature_cache": signature_cache.stats(),
+        "seen_filter": seen_filter.stats(),
+        "message_ledger": message_ledger.stats(),
+        "filter_decisions": filter_decisions.stats(),
+        "gmail_labels": gmail_labels.stats()
+    }
     
 from datetime import datetime, timezone
 
@@ -898,48 +1069,56 @@ import base64
 import json
 
 async def create_gmail_draft(user_id: str, original_message_id: str, reply_body: str, 
-                           original_subject: str, original_sender: str) -> Optional[str]:
+                           original_subject: str, original_sender: str,
+                           original_thread: Optional[Dict] = None) -> Optional[str]:
     """
     Create a draft reply in Gmail that the user can send
+    original_thread is the thread_headers() of the original message when the caller
+    already has them; otherwise they are fetched from Gmail
     """
     try:
         access_token = await refresh_access_token_if_needed(user_id, supabase)
         headers = {"Authorization": f"Bearer {access_token}"}
         
-        # Get the user's signature
-        user_row = supabase.table("users").select("signature").eq("id", user_id).execute()
-        signature_html = user_row.data[0].get("signature", "") if user_row.data else ""
+        # Get the user's signature (pre-rendered, cached per user)
+        signature = signature_cache.get(user_id)
         
-        # Get the original message to extract proper headers for reply
-        original_message = await get_original_message_headers(headers, original_message_id)
+        # Threading headers for the reply
+        if original_thread is None:
+            original_thread = thread_headers(await get_original_message_headers(headers, user_id, original_message_id))
         
         # Create the reply message WITH HTML signature support
         reply_message = create_reply_message(
             reply_body=reply_body,
             original_subject=original_subject,
             original_sender=original_sender,
-            original_message=original_message,
-            signature_html=signature_html
+            original_thread=original_thread,
+            signature=signature
         )
         
-        # Create draft via Gmail API
-        draft_id = await send_draft_to_gmail(headers, reply_message, original_message_id)
+        # Create draft via Gmail API in the original conversation
+        thread_id = original_thread.get("thread_id") or original_message_id
+        draft_id = await send_draft_to_gmail(headers, user_id, reply_message, thread_id)
         
         logging.info(f"Created Gmail draft {draft_id} for user {user_id}")
         return draft_id
         
+    except GmailRateLimitError:
+        # Fail the job so it is retried instead of being stored without a Gmail draft
+        raise
     except Exception as e:
         logging.error(f"Error creating Gmail draft: {str(e)}")
         return None
-async def get_original_message_headers(headers: dict, message_id: str) -> Optional[Dict]:
+async def get_original_message_headers(headers: dict, user_id: str, message_id: str) -> Optional[Dict]:
     """
     Get the original message headers needed for proper reply threading
+    (only used when they weren't carried over from the fetch)
     """
     try:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(
-                f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}",
-                headers=headers
+        async with http_clients.borrow("gmail") as client:
+            r = await gmail_request(
+                client, "GET", f"{GMAIL_API_URL}/messages/{message_id}", user_id, "messages.get",
+                headers=headers, params={"format": "metadata", "metadataHeaders": THREAD_HEADER_NAMES}
             )
             
             if r.status_code == 200:
@@ -948,15 +1127,18 @@ async def get_original_message_headers(headers: dict, message_id: str) -> Option
                 logging.error(f"Failed to get original message: {r.text}")
                 return None
                 
+    except GmailRateLimitError:
+        raise
     except Exception as e:
         logging.error(f"Error getting original message: {str(e)}")
         return None
 
 def create_reply_message(reply_body: str, original_subject: str, 
-                        original_sender: str, original_message: Optional[Dict] = None,
-                        signature_html: str = "") -> str:
+                        original_sender: str, original_thread: Optional[Dict] = None,
+                        signature: Tuple[str, str] = ("", "")) -> str:
     """
     Create a properly formatted reply message with HTML support for signatures
+    signature is the (plain, html) pair from signature_cache
     """
     try:
         # Create the reply message
@@ -971,33 +1153,23 @@ def create_reply_message(reply_body: str, original_subject: str,
         else:
             msg['Subject'] = f"Re: {original_subject}"
         
-        # Add threading headers if we have the original message
-        if original_message:
-            headers_list = original_message.get("payload", {}).get("headers", [])
-            
-            # Get Message-ID from original for In-Reply-To
-            original_message_id = next((h["value"] for h in headers_list if h["name"] == "Message-ID"), None)
-            if original_message_id:
-                msg['In-Reply-To'] = original_message_id
-                msg['References'] = original_message_id
+        # Add threading headers if we know the original message
+        if original_thread and original_thread.get("rfc_message_id"):
+            original_rfc_id = original_thread["rfc_message_id"]
+            msg['In-Reply-To'] = original_rfc_id
+            references = original_thread.get("references")
+            msg['References'] = f"{references} {original_rfc_id}" if references else original_rfc_id
+        
+        plain_signature, html_signature = signature
         
         # Create plain text version
         plain_text_body = reply_body
-        if signature_html:
-            # Always treat signature as plain text for email generation
-            plain_signature = signature_html
-            # Convert any HTML to plain text if it somehow got saved as HTML
-            if '<' in plain_signature and '>' in plain_signature:
-                plain_signature = clean_html_to_text(plain_signature)
+        if plain_signature:
             plain_text_body += f"\n\n{plain_signature}"
 
         # Create HTML version  
         html_body = reply_body.replace('\n', '<br>\n')  # Keep both \n and <br>
-        if signature_html:
-            html_signature = signature_html
-            # Convert plain text to HTML if needed
-            if not ('<' in html_signature and '>' in html_signature):
-                html_signature = html_signature.replace('\n', '<br>\n')
+        if html_signature:
             html_body += f"<br><br>{html_signature}"
         
         # Wrap HTML in proper structure
@@ -1023,38 +1195,7 @@ def create_reply_message(reply_body: str, original_subject: str,
         simple_msg = f"To: {original_sender}\nSubject: Re: {original_subject}\n\n{reply_body}"
         return base64.urlsafe_b64encode(simple_msg.encode()).decode()
 
-def clean_html_to_text(html: str) -> str:
-    """
-    Convert HTML to clean plain text (for email clients that don't support HTML)
-    """
-    if not html:
-        return ""
-    
-    import re
-    
-    # Handle lists
-    html = re.sub(r'<ul[^>]*>', '', html)
-    html = re.sub(r'</ul>', '', html)
-    html = re.sub(r'<li[^>]*>', '• ', html)
-    html = re.sub(r'</li>', '\n', html)
-    
-    # Handle line breaks
-    html = html.replace('<br>', '\n')
-    html = html.replace('<br/>', '\n')
-    html = html.replace('<br />', '\n')
-    html = html.replace('</p>', '\n')
-    html = html.replace('</div>', '\n')
-    
-    # Remove all other HTML tags
-    html = re.sub(r'<[^>]+>', '', html)
-    
-    # Clean up whitespace
-    lines = [line.strip() for line in html.split('\n')]
-    lines = [line for line in lines if line]
-    
-    return '\n'.join(lines)
-
-async def send_draft_to_gmail(headers: dict, raw_message: str, thread_id: str) -> Optional[str]:
+async def send_draft_to_gmail(headers: dict, user_id: str, raw_message: str, thread_id: str) -> Optional[str]:
     """
     Send the draft to Gmail API
     """
@@ -1066,9 +1207,9 @@ async def send_draft_to_gmail(headers: dict, raw_message: str, thread_id: str) -
             }
         }
         
-        async with httpx.AsyncClient() as client:
-            r = await client.post(
-                "https://gmail.googleapis.com/gmail/v1/users/me/drafts",
+        async with http_clients.borrow("gmail") as client:
+            r = await gmail_request(
+                client, "POST", f"{GMAIL_API_URL}/drafts", user_id, "drafts.create",
                 headers={**headers, "Content-Type": "application/json"},
                 json=draft_data
             )
@@ -1080,59 +1221,184 @@ async def send_draft_to_gmail(headers: dict, raw_message: str, thread_id: str) -
                 logging.error(f"Failed to create draft: {r.text}")
                 return None
                 
+    except GmailRateLimitError:
+        raise
     except Exception as e:
         logging.error(f"Error sending draft to Gmail: {str(e)}")
         return None
-async def process_and_store_email(user_id: str, email_data: Dict):
+# ─── Email processing pipeline ──────────────────────────────────────────────────
+# fetch (the monitor cycle) -> clean -> draft -> Gmail draft -> persist
+PIPELINE_CLEAN_WORKERS = int(os.getenv("PIPELINE_CLEAN_WORKERS", "4"))
+PIPELINE_DRAFT_WORKERS = int(os.getenv("PIPELINE_DRAFT_WORKERS", "8"))
+PIPELINE_GMAIL_WORKERS = int(os.getenv("PIPELINE_GMAIL_WORKERS", "8"))
+PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", "4"))
+
+async def clean_email_stage(item: PipelineItem) -> Optional[bool]:
+    """
+    Clean the email body (Talon is CPU-bound, so it runs in a thread)
+    """
+    job = item.data
+    email_data = job['payload']
+    if not monitor_scheduler.tasks.should_continue(item.user_id):
+        # Shutdown or /stop-monitoring - leave it for the next cycle
+        item.abandoned = True
+        return None
+    
+    monitor_scheduler.tasks.set_current_email(item.user_id, email_data['message_id'])
+    if job_reached(job, DRAFTED):
+        logging.info(f"♻️ Resuming email {email_data['message_id']} from state {job['state']}")
+        return None
+    
+    logging.info(f"✉️ Processing email: {email_data['subject'][:50]}...")
+    cleaned_body, extracted_signature = await asyncio.to_thread(clean_email_body, email_data['raw_body'])
+    
+    if not cleaned_body or len(cleaned_body.strip()) < 5:
+        logging.info(f"Skipping email with empty cleaned body: {email_data['message_id']}")
+        job_store.advance(job, JOB_SKIPPED)
+        return False
+    
+    email_data['cleaned_body'] = cleaned_body
+    # Extract sender name for personalization
+    email_data['sender_name'] = extract_sender_name(email_data['sender'])
+    return None
+
+async def draft_email_stage(item: PipelineItem) -> Optional[bool]:
     """
-    Process a single email: clean, generate draft, store, and create Gmail draft
+    Generate the draft reply with the LLM
     """
+    job = item.data
+    email_data = job['payload']
+    if job_reached(job, DRAFTED):
+        return None
+    if not monitor_scheduler.tasks.should_continue(item.user_id):
+        item.abandoned = True
+        return None
+    
+    email_data['draft'], email_data['matched_inventory'] = await generate_draft_for_email(
+        user_id=item.user_id,
+        subject=email_data['subject'],
+        body=email_data['cleaned_body'],
+        sender_name=email_data['sender_name']
+    )
+    job_store.advance(job, DRAFTED)
+    return None
+
+async def gmail_draft_stage(item: PipelineItem) -> Optional[bool]:
+    """
+    Create the reply draft in the user's Gmail
+    """
+    job = item.data
+    email_data = job['payload']
+    if job_reached(job, GMAIL_DRAFTED):
+        return None
+    
+    email_data['gmail_draft_id'] = await create_gmail_draft(
+        user_id=item.user_id,
+        original_message_id=email_data['message_id'],
+        reply_body=email_data['draft'],
+        original_subject=email_data['subject'],
+        original_sender=email_data['sender'],
+        original_thread=email_data if has_thread_headers(email_data) else None
+    )
+    job_store.advance(job, GMAIL_DRAFTED)
+    return None
+
+async def persist_email_stage(item: PipelineItem) -> Optional[bool]:
+    """
+    Store the processed email (including the Gmail draft ID)
+    """
+    job = item.data
+    email_data = job['payload']
+    await store_processed_email(
+        user_id=item.user_id,
+        message_id=email_data['message_id'],
+        subject=email_data['subject'],
+        sender=email_data['sender'],
+        original_body=email_data['raw_body'],
+        cleaned_body=email_data['cleaned_body'],
+        draft=email_data['draft'],
+        matched_inventory=email_data['matched_inventory'],
+        received_at=email_data.get('received_at'),
+        gmail_draft_id=email_data['gmail_draft_id']
+    )
+    job_store.advance(job, STORED)
+    logging.info(f"Successfully processed email {email_data['message_id']} and created draft {email_data['gmail_draft_id']}")
+    return None
+
+# Gmail drafts and stored rows follow each user's email order; once a Gmail
+# draft exists the email is always persisted, even on /stop-monitoring
+email_pipeline = EmailPipeline([
+    PipelineStage("clean", clean_email_stage, concurrency=PIPELINE_CLEAN_WORKERS),
+    PipelineStage("draft", draft_email_stage, concurrency=PIPELINE_DRAFT_WORKERS),
+    PipelineStage("gmail_draft", gmail_draft_stage, concurrency=PIPELINE_GMAIL_WORKERS,
+                  ordered=True, interruptible=False),
+    PipelineStage("persist", persist_email_stage, concurrency=PIPELINE_PERSIST_WORKERS,
+                  ordered=True, interruptible=False),
+])
+
+async def process_new_emails(user_id: str, new_emails: List[Dict], resumed_jobs: List[Dict] = None) -> bool:
+    """
+    Turn a cycle's emails into jobs, push them through the pipeline and wait for all of them.
+    Jobs left unfinished by an earlier run resume from their last recorded state.
+    Returns False if any email was left unprocessed and should be retried.
+    """
+    tasks = monitor_scheduler.tasks
+    
+    jobs = list(resumed_jobs or [])
+    resumed_ids = {job['message_id'] for job in jobs}
+    for email in new_emails:
+        if email['message_id'] not in resumed_ids:
+            jobs.append(job_store.discover(user_id, email['message_id'], email))
+    
+    all_processed = True
+    runnable = []
+    for job in jobs:
+        if job['state'] in FINAL_JOB_STATES:
+            continue
+        if not job_store.claim(job):
+            # Another worker holds it; it is retried here if that worker dies
+            all_processed = False
+            continue
+        runnable.append(job)
+    
+    tasks.start_batch(user_id, len(runnable))
+    futures = []
     try:
-        # Clean the email body
-        cleaned_body, extracted_signature = clean_email_body(email_data['raw_body'])
-        
-        if not cleaned_body or len(cleaned_body.strip()) < 5:
-            logging.info(f"Skipping email with empty cleaned body: {email_data['message_id']}")
-            return
-        
-        # Extract sender name for personalization
-        sender_name = extract_sender_name(email_data['sender'])
-        
-        # Generate draft response (now with sender_name)
-        draft_text, matched_inventory = await generate_draft_for_email(
-            user_id=user_id,
-            subject=email_data['subject'],
-            body=cleaned_body,
-            sender_name=sender_name  # Add this parameter
-        )
-        
-        # Create Gmail draft
-        gmail_draft_id = await create_gmail_draft(
-            user_id=user_id,
-            original_message_id=email_data['message_id'],
-            reply_body=draft_text,
-            original_subject=email_data['subject'],
-            original_sender=email_data['sender']
-        )
-        
-        # Store in database (including Gmail draft ID)
-        await store_processed_email(
-            user_id=user_id,
-            message_id=email_data['message_id'],
-            subject=email_data['subject'],
-            sender=email_data['sender'],
-            original_body=email_data['raw_body'],
-            cleaned_body=cleaned_body,
-            draft=draft_text,
-            matched_inventory=matched_inventory,
-            received_at=email_data.get('received_at'),
-            gmail_draft_id=gmail_draft_id
-        )
-        
-        logging.info(f"Successfully processed email {email_data['message_id']} and created draft {gmail_draft_id}")
-        
+        for job in runnable:
+            future = await email_pipeline.submit(user_id, job)
+            future.add_done_callback(lambda _: tasks.finish_email(user_id))
+            futures.append(future)
+        
+        # asyncio.wait leaves the futures alone if this cycle gets cancelled
+        if futures:
+            await asyncio.wait(futures)
+    except asyncio.CancelledError:
+        email_pipeline.cancel_user(user_id)
+        raise
+    
+    unprocessed = 0
+    for job, future in zip(runnable, futures):
+        outcome = future.result()
+        if outcome in (FAILED, ABANDONED):
+            unprocessed += 1
+            job_store.release(job, error=outcome if outcome == FAILED else None)
+    
+    if unprocessed:
+        logging.info(f"⏸️ {unprocessed} emails left unprocessed for user {user_id}, they are retried next cycle")
+    return all_processed and unprocessed == 0
+
+def load_resumable_jobs():
+    """
+    Pick up jobs a previous process left half-done; each user's next cycle finishes them
+    """
+    try:
+        for job in job_store.list_unfinished():
+            resumable_jobs.setdefault(job['user_id'], []).append(job)
+        if resumable_jobs:
+            total = sum(len(jobs) for jobs in resumable_jobs.values())
+            logging.info(f"♻️ Found {total} unfinished email jobs for {len(resumable_jobs)} users")
     except Exception as e:
-        logging.error(f"Error processing email {email_data['message_id']}: {str(e)}")
+        logging.error(f"Error loading unfinished email jobs: {str(e)}")
         
 # Updated store function to include Gmail draft ID
 async def store_processed_email(user_id: str, message_id: str, subject: str, sender: str,
@@ -1161,11 +1427,19 @@ async def store_processed_email(user_id: str, message_id: str, subject: str, sen
             insert_data["gmail_draft_id"] = gmail_draft_id
         
         supabase.table("drafts").insert(insert_data).execute()
+        seen_filter.mark_seen(user_id, message_id)
+        gmail_labels.mark(user_id, message_id, LABEL_PROCESSED)
+        try:
+            message_ledger.record_drafted(user_id, message_id)
+        except Exception as e:
+            # The drafts row is stored; don't fail (and later repeat) the job over the ledger
+            logging.error(f"Error recording drafted email {message_id} in the ledger: {str(e)}")
         
         logging.info(f"Stored processed email {message_id} for user {user_id}")
         
     except Exception as e:
         logging.error(f"Error storing processed email: {str(e)}")
+        raise e
 
 # Optional: Add endpoint to manually create draft for existing processed emails
 @router.post("/create-gmail-draft/{draft_id}")
@@ -1205,6 +1479,9 @@ async def create_gmail_draft_endpoint(draft_id: str, request: Request):
         else:
             return {"success": False, "error": "Failed to create Gmail draft"}
             
+    except GmailRateLimitError as e:
+        raise HTTPException(status_code=429, detail="Gmail is rate limiting requests, try again shortly",
+                            headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         logging.error(f"Error creating Gmail draft: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -1232,509 +1509,3 @@ def extract_sender_name(sender: str) -> str:
     
     # Otherwise, assume it's already just a name - take first word
     return sender.strip().split()[0] if sender.strip() else ""
-
-
-
-
-
-
-
-
-
-
-
-class BotEmailDetector:
-    def __init__(self):
-        # Expanded bot sender patterns
-        self.bot_sender_patterns = [
-            r'no-?reply',
-            r'noreply',
-            r'notifications?@',
-            r'do[-_.]?not[-_.]?reply'
-            r'calendar@',
-            r'automated?@',
-            r'do-?not-?reply',
-            r'support@',
-            r'help@',
-            r'system@',
-            r'admin@',
-            r'bounce',
-            r'mailer-?daemon',
-            r'postmaster',
-            r'marketing@',
-            r'newsletter',
-            r'campaigns?@',
-            r'alerts?@',
-            r'updates?@',
-            r'info@',
-            r'service@',
-            r'team@',
-            r'security@',
-            r'billing@',
-            r'invoices?@',
-            r'receipts?@',
-            r'orders?@',
-            r'shipping@',
-            r'delivery@',
-            r'tracking@',
-            r'api@',
-            r'bot@',
-            r'auto@',
-            r'robot@',
-            r'no[-_.]?reply',
-            r'do[-_.]?not[-_.]?reply',
-            r'auto[-_.]?reply',
-            r'donotreply',
-            r'automated?',
-            r'notifications?',
-            r'support',
-            r'help',
-            r'system',
-            r'admin',
-            r'bounce',
-            r'mailer[-_.]?daemon',
-            r'postmaster',
-            r'marketing',
-            r'newsletter',
-            r'campaigns?',
-            r'alerts?',
-            r'updates?',
-            r'info',
-            r'service',
-            r'team',
-            r'security',
-            r'billing',
-            r'invoices?',
-            r'receipts?',
-            r'orders?',
-            r'shipping',
-            r'delivery',
-            r'tracking',
-            r'api',
-            r'bot',
-            r'robot'
-        ]
-        
-        # Bot subject patterns
-        self.bot_subject_patterns = [
-            r'\[automated\]',
-            r'\[system\]',
-            r'\[notification\]',
-            r'unsubscribe',
-            r're:\s*out of office',
-            r'delivery status notification',
-            r'mail delivery failed',
-            r'automatic reply',
-            r'auto-?reply',
-            r'newsletter',
-            r'digest',
-            r'weekly\s+report',
-            r'monthly\s+report',
-            r'daily\s+summary',
-            r'password\s+reset',
-            r'account\s+verification',
-            r'confirm\s+your',
-            r'your\s+order',
-            r'receipt\s+for',
-            r'invoice\s+#',
-            r'payment\s+confirmation',
-            r'shipping\s+notification'
-        ]
-        
-        # Bot body patterns
-        self.bot_body_patterns = [
-            r'this\s+is\s+an\s+automated\s+message',
-            r'do\s+not\s+reply\s+to\s+this\s+email',
-            r'automatically\s+generated',
-            r'unsubscribe\s+link',
-            r'click\s+here\s+to\s+unsubscribe',
-            r'if\s+you\s+no\s+longer\s+wish\s+to\s+receive',
-            r'this\s+email\s+was\s+sent\s+automatically',
-            r'please\s+do\s+not\s+respond\s+to\s+this\s+email',
-            r'system\s+notification',
-            r'automated\s+notification',
-            r'tracking\s+number',
-            r'order\s+confirmation',
-            r'payment\s+received',
-            r'account\s+created',
-            r'password\s+has\s+been\s+reset',
-            r'this\s+is\s+an\s+automated\s+message',
-            r'do\s+not\s+reply\s+to\s+this\s+email',
-            r'this\s+email\s+was\s+sent\s+automatically',
-            r'please\s+do\s+not\s+respond\s+to\s+this\s+email',
-            r'automatically\s+generated',
-            r'unsubscribe\s+(here|link|below)',
-            r'click\s+here\s+to\s+unsubscribe',
-            r'if\s+you\s+no\s+longer\s+wish\s+to\s+receive',
-            r'tracking\s+number',
-            r'your\s+order\s+(has\s+been|is)\s+confirmed',
-            r'order\s+confirmation',
-            r'payment\s+(received|confirmed)',
-            r'your\s+receipt',
-            r'password\s+(reset|change)\s+requested',
-            r'password\s+has\s+been\s+(reset|changed)',
-            r'confirm\s+your\s+email\s+address',
-            r'account\s+(verification|activated|created)',
-            r'please\s+verify\s+your\s+email',
-            r'security\s+alert',
-            r'unusual\s+login\s+attempt',
-            r'your\s+subscription\s+has\s+been\s+(renewed|cancelled)',
-            r'delivery\s+status',
-            r'failed\s+delivery\s+attempt',
-            r'your\s+package\s+is\s+on\s+its\s+way',
-            r'download\s+your\s+report',
-            r'here\s+is\s+your\s+weekly\s+summary',
-            r'here\s+is\s+your\s+daily\s+report',
-            r'new\s+comment\s+on\s+your\s+post',
-            r'you\s+have\s+a\s+new\s+message',
-            r'don’t\s+miss\s+out\s+on',
-            r'special\s+offer\s+just\s+for\s+you',
-            r'limited\s+time\s+deal',
-            r'thank\s+you\s+for\s+registering',
-            r'your\s+information\s+was\s+successfully\s+submitted',
-            r'we[’\']?ll\s+follow\s+up\s+with\s+you',
-            r'application\s+(received|submitted)',
-            r'explore\s+our\s+open\s+roles',
-            r'nvidia[’\']?s\s+university\s+recruiting\s+team'
-        ]
-        
-        # Headers that indicate automated emails
-        self.bot_headers = [
-            'auto-submitted',
-            'x-auto-response-suppress',
-            'x-autoreply',
-            'x-autorespond',
-            'precedence',
-            'x-mailer-type'
-        ]
-
-    def is_bot_sender(self, sender: str) -> bool:
-        """
-        Check if sender appears to be a bot based on email address patterns and known bot domains.
-        """
-        # Extract only the email address (e.g., 'donotreply@nvidia.com')
-        sender_email = email.utils.parseaddr(sender)[1].lower()
-
-        # Match flexible sender patterns like 'donotreply', 'do.not.reply', 'no-reply', etc.
-        for pattern in self.bot_sender_patterns:
-            if re.search(pattern, sender_email):
-                return True
-
-        # Match against known marketing/automation email domains
-        bot_domains = [
-            'mailgun.org',
-            'sendgrid.net',
-            'amazonses.com',
-            'mailchimp.com',
-            'constantcontact.com',
-            'campaignmonitor.com',
-            'intercom.io',
-            'zendesk.com',
-            'freshdesk.com',
-            'helpscout.net',
-            'nvidia.com'  # add this if you regularly get automated mail from NVIDIA
-        ]
-
-        for domain in bot_domains:
-            if sender_email.endswith(domain):
-                return True
-
-        return False
-
-    
-    def is_bot_subject(self, subject: str) -> bool:
-        """Check if subject line indicates automated email"""
-        subject_lower = subject.lower()
-        
-        for pattern in self.bot_subject_patterns:
-            if re.search(pattern, subject_lower):
-                return True
-        
-        return False
-    
-    def is_bot_body(self, body: str) -> bool:
-        """Check if email body contains automated message indicators"""
-        body_lower = body.lower()
-        
-        for pattern in self.bot_body_patterns:
-            if re.search(pattern, body_lower):
-                return True
-        
-        return False
-    
-    def check_bot_headers(self, headers_list: List[Dict]) -> bool:
-        """Check for headers that indicate automated emails"""
-        header_dict = {h["name"].lower(): h["value"].lower() for h in headers_list}
-        
-        # Check for auto-submitted header
-        if header_dict.get('auto-submitted', '').startswith('auto-'):
-            return True
-        
-        # Check for precedence header
-        precedence = header_dict.get('precedence', '')
-        if precedence in ['bulk', 'list', 'junk']:
-            return True
-        
-        # Check for list headers (mailing lists)
-        list_headers = ['list-id', 'list-unsubscribe', 'list-subscribe']
-        if any(header in header_dict for header in list_headers):
-            return True
-        
-        # Check for marketing automation headers
-        marketing_headers = ['x-campaign', 'x-mailgun', 'x-sg-', 'x-sendgrid']
-        for header_name in header_dict:
-            if any(marker in header_name for marker in marketing_headers):
-                return True
-        
-        return False
-    
-    def analyze_reply_patterns(self, body: str) -> bool:
-        """Analyze if email shows conversational patterns (indicates human)"""
-        human_patterns = [
-            r'thanks?\s+for',
-            r'thank\s+you',
-            r'i\s+think',
-            r'i\s+believe',
-            r'in\s+my\s+opinion',
-            r'what\s+do\s+you\s+think',
-            r'let\s+me\s+know',
-            r'talk\s+soon',
-            r'best\s+regards',
-            r'kind\s+regards',
-            r'sincerely',
-            r'cheers',
-            r'hope\s+this\s+helps',
-            r'looking\s+forward',
-            r'please\s+let\s+me\s+know',
-            r'i\s+hope\s+you',
-            r'how\s+are\s+you'
-        ]
-        
-        body_lower = body.lower()
-        human_score = sum(1 for pattern in human_patterns if re.search(pattern, body_lower))
-        
-        # If we find multiple human patterns, likely not a bot
-        return human_score >= 2
-    
-    def is_bot_email(self, sender: str, subject: str, body: str, headers_list: List[Dict]) -> bool:
-        """
-        Comprehensive bot detection combining multiple signals
-        Returns True if email is likely from a bot
-        """
-        bot_signals = 0
-        
-        # Check sender
-        if self.is_bot_sender(sender):
-            bot_signals += 3  # Strong signal
-        
-        # Check subject
-        if self.is_bot_subject(subject):
-            bot_signals += 2
-        
-        # Check body
-        if self.is_bot_body(body):
-            bot_signals += 2
-        
-        # Check headers
-        if self.check_bot_headers(headers_list):
-            bot_signals += 2
-        
-        # Check for human conversational patterns (negative signal)
-        if self.analyze_reply_patterns(body):
-            bot_signals -= 2
-        
-        # Check email length (very short emails are often automated)
-        if len(body.strip()) < 50:
-            bot_signals += 1
-        
-        # Check for excessive links (common in marketing emails)
-        link_count = len(re.findall(r'https?://', body))
-        if link_count > 3:
-            bot_signals += 1
-        
-        return bot_signals >= 3
-class CustomerDetector:
-    def __init__(self):
-        self.customer_indicators = [
-            r'my\s+order',
-            r'order\s+#?\d+',
-            r'tracking\s+number',
-            r'invoice\s+#?\d+',
-            r'receipt',
-            r'purchased',
-            r'bought',
-            r'payment',
-            r'refund',
-            r'return',
-            r'exchange',
-            r'warranty',
-            r'delivery',
-            r'shipping',
-            r'received\s+my',
-            r'got\s+my',
-            r'when\s+will\s+my.*arrive',
-            r'where\s+is\s+my'
-        ]
-        
-        self.existing_relationship = [
-            r'as\s+discussed',
-            r'per\s+our\s+conversation',
-            r'following\s+up',
-            r'as\s+promised',
-            r'like\s+we\s+talked\s+about',
-            r'from\s+our\s+meeting',
-            r'you\s+mentioned',
-            r'when\s+we\s+spoke',
-            r'our\s+previous\s+order',
-            r'usual\s+order',
-            r'same\s+as\s+last\s+time',
-            r'i\s+messaged\s+earlier',
-            r'i\s+am.*mom',
-            r'i\s+was\s+with\s+.*\s+when\s+we',
-            r'returning\s+them',
-            r'picked\s+up\s+the',
-            r'we\s+are.*minutes\s+out',
-            r'coming\s+back',
-            r'drop\s+off',
-            r'pickup\s+.*\s+pedestals',
-            r'returning\s+.*\s+pedestals'
-        ]
-        
-        self.prospect_indicators = [
-            # Existing patterns
-            r'i\s+am\s+interested\s+in',
-            r'can\s+you\s+tell\s+me\s+about',
-            r'what\s+do\s+you\s+charge',
-            r'do\s+you\s+offer',
-            r'i\s+found\s+your',
-            r'saw\s+your\s+website',
-            r'looking\s+for',
-            r'need\s+a\s+quote',
-            r'price\s+list',
-            r'more\s+information',
-            r'first\s+time',
-            r'new\s+to\s+your',
-            r'heard\s+about\s+you',
-            r'wanted\s+to\s+rent',
-            r'would\s+like\s+to\s+rent',
-            r'would\s+like\s+to\s+inquire',
-            r'inquire\s+about',
-            r'can\s+you\s+provide',
-            r'do\s+you\s+have',
-            r'planning\s+.*\s+wedding',
-            r'looking\s+at\s+.*\s+renting',
-            r'rental\s+inquiry',
-            r'quote\s+for',
-            r'pricing\s+for',
-            r'availability\s+for',
-            r'total\s+cost',
-            r'delivery.*fees',
-            r'pickup.*fees',
-            r'rental.*rates',
-            
-            # Common business patterns
-            r'\bbuying\b',
-            r'\bselling\b',
-            r'\bbuy\b',
-            r'\bsell\b',
-            r'\bpurchase\b',
-            r'\bpurchasing\b',
-            r'want\s+to\s+buy',
-            r'want\s+to\s+purchase',
-            r'interested\s+in\s+buying',
-            r'how\s+much',
-            r'what\s+is\s+the\s+price',
-            r'what.*cost',
-            r'how.*much.*cost',
-            r'can\s+i\s+buy',
-            r'can\s+i\s+get',
-            r'where\s+can\s+i',
-            r'need\s+to\s+buy',
-            r'want\s+to\s+order',
-            r'place\s+an\s+order',
-            r'make\s+an\s+order',
-            r'business\s+inquiry',
-            r'product\s+inquiry',
-            r'service\s+inquiry',
-            r'questions?\s+about',
-            r'tell\s+me\s+more',
-            r'learn\s+more',
-            r'get\s+more\s+info',
-            r'contact.*about',
-            r'reach\s+out.*about',
-            r'hello.*interested',
-            r'hi.*interested',
-            r'good\s+morning.*interested',
-            r'good\s+afternoon.*interested'
-        ]
-        
-        # Add patterns that indicate personal/non-business emails
-        self.personal_indicators = [
-            r'how\s+was\s+your\s+weekend',
-            r'happy\s+birthday',
-            r'congratulations',
-            r'how\s+are\s+you\s+doing',
-            r'miss\s+you',
-            r'see\s+you\s+soon',
-            r'call\s+me\s+when',
-            r'what\s+are\s+you\s+up\s+to',
-            r'how.*family',
-            r'vacation',
-            r'holiday'
-        ]
-        
-        # Very short/minimal responses
-        self.minimal_responses = [
-            r'^\s*(okay?|yes|no|thanks?|sure|maybe|alright|got\s+it|sounds?\s+good)\s*$'
-        ]
-    
-    def analyze_customer_status(self, body: str) -> str:
-        """
-        Analyze email body to determine if sender is likely a customer, prospect, or unknown
-        Returns: 'customer', 'prospect', or 'unknown'
-        """
-        if not body or len(body.strip()) < 2:
-            return 'unknown'
-            
-        body_lower = body.lower().strip()
-        
-        customer_score = 0
-        prospect_score = 0
-        personal_score = 0
-        
-        # Check for customer indicators
-        for pattern in self.customer_indicators:
-            if re.search(pattern, body_lower):
-                customer_score += 1
-        
-        # Check for existing relationship indicators
-        for pattern in self.existing_relationship:
-            if re.search(pattern, body_lower):
-                customer_score += 1
-        
-        # Check for prospect indicators
-        for pattern in self.prospect_indicators:
-            if re.search(pattern, body_lower):
-                prospect_score += 1
-        
-        # Check for personal indicators
-        for pattern in self.personal_indicators:
-            if re.search(pattern, body_lower):
-                personal_score += 1
-        
-        # Check for minimal responses
-        for pattern in self.minimal_responses:
-            if re.search(pattern, body_lower):
-                personal_score += 1
-        
-        # Decision logic that can actually return 'unknown'
-        if customer_score > 0 and customer_score >= prospect_score:
-            return 'customer'
-        elif prospect_score > 0 and prospect_score > personal_score:
-            return 'prospect'
-        elif personal_score > 0:
-            return 'unknown'  # Personal/social emails
-        elif len(body_lower) < 10:
-            return 'unknown'  # Very short, ambiguous emails
-        else:
-            return 'unknown'  # No clear business indicators
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import copy
+import asyncio
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from config import supabase
+from functions import clean_email_body, analyze_email_batch, store_tone_profile
+from services.gmail_sync import GMAIL_API_URL
+from services.gmail_rate_limiter import gmail_request
+from services.gmail_batch import batch_get_messages
+from services.http_clients import http_clients
+from services.draft_composer import signature_cache
+from services.mime_body import extract_body
+
+# ─── Onboarding crawl ──────────────────────────────────────────────────
+#
+# Reads the user's recent sent mail to learn their tone and signature.
+#   list SENT ids -> fetch in small batches (CRAWL_FETCH_CONCURRENCY at a time)
+#   -> Talon clean in worker threads (CRAWL_CLEAN_WORKERS at a time)
+#   -> NLTK analysis in a worker thread -> store tone profile and signature
+# Cleaning starts as soon as the first batch lands, so total time is close to the
+# slowest fetch instead of the sum of them, and the event loop stays free.
+#
+# crawl_sent_emails() is an async generator of progress events:
+#   {"event": "started"}
+#   {"event": "listed", "total": n}
+#   {"event": "progress", "total", "fetched", "cleaned", "usable"}   (many)
+#   {"event": "analyzing", "usable": n}
+#   {"event": "analyzed", "analyzed": n, "profile_type": ...}
+#   {"event": "complete", "emails_processed", "signature_extracted", "tone_profile"}
+# GET /crawl-emails/stream sends them as Server-Sent Events; GET /crawl-emails
+# runs the same generator and returns only the final result.
+
+CRAWL_MAX_MESSAGES = int(os.getenv("CRAWL_MAX_MESSAGES", "100"))
+CRAWL_FETCH_CHUNK = int(os.getenv("CRAWL_FETCH_CHUNK", "10"))
+CRAWL_FETCH_CONCURRENCY = int(os.getenv("CRAWL_FETCH_CONCURRENCY", "4"))
+CRAWL_CLEAN_WORKERS = int(os.getenv("CRAWL_CLEAN_WORKERS", "4"))
+# Fewer usable emails than this and we store the generic profile instead
+CRAWL_MIN_EMAILS = 5
+
+BOT_SENDERS = ["no-reply", "noreply", "notifications@", "calendar@", "automated@", "do-not-reply"]
+
+# Used when there isn't enough sent mail to analyze
+FALLBACK_TONE_PROFILE = {
+    "avg_sentences_per_email": 3.5,
+    "top_words": [
+        ["please", 15], ["thank", 12], ["regards", 10], ["best", 10],
+        ["hope", 8], ["you", 8], ["well", 7], ["let", 6], ["know", 6],
+        ["time", 5], ["appreciate", 5], ["looking", 4], ["forward", 4],
+        ["hearing", 4], ["questions", 4]
+    ],
+    "top_nouns": [
+        ["regards", 12], ["time", 8], ["questions", 6], ["information", 5],
+        ["assistance", 5], ["opportunity", 4], ["response", 4],
+        ["consideration", 4], ["support", 3], ["help", 3]
+    ],
+    "top_verbs": [
+        ["please", 15], ["thank", 12], ["hope", 8], ["let", 6],
+        ["know", 6], ["appreciate", 5], ["looking", 4], ["hearing", 4],
+        ["reach", 3], ["contact", 3]
+    ],
+    "top_adjectives": [
+        ["best", 10], ["available", 5], ["additional", 4], ["necessary", 3],
+        ["important", 3], ["specific", 3], ["further", 3], ["relevant", 2],
+        ["appropriate", 2], ["professional", 2]
+    ],
+    "formality_score": 0.65,
+    "politeness_analysis": {
+        "politeness_level": 2.1,
+        "directness_level": 0.4,
+        "communication_style": "polite"
+    },
+    "emotional_tone": {
+        "enthusiasm": 0.6, "concern": 0.1, "gratitude": 1.2,
+        "apologetic": 0.2, "exclamation_frequency": 0.3,
+        "question_frequency": 0.4, "dominant_emotion": "gratitude"
+    },
+    "communication_patterns": {
+        "preferred_opening": "professional_greeting",
+        "avg_paragraphs": 2.5, "avg_sentence_length": 15.8
+    }
+}
+
+
+def parse_sent_message(full_msg: Dict) -> Optional[Tuple[str, str, str]]:
+    """
+    (subject, sender, raw body) of a sent message, or None if it looks automated
+    """
+    headers_list = full_msg["payload"].get("headers", [])
+    subject = next((h["value"] for h in headers_list if h["name"] == "Subject"), "(No Subject)")
+    sender = next((h["value"] for h in headers_list if h["name"] == "From"), "(Unknown Sender)")
+
+    # Skip if sender looks like a bot or system
+    if any(bot_id in sender.lower() for bot_id in BOT_SENDERS):
+        return None
+
+    return subject, sender, extract_body(full_msg)
+
+
+def normalize_signature(sig: str) -> str:
+    return "\n".join([line.strip() for line in sig.strip().splitlines() if line.strip()])
+
+
+async def crawl_sent_emails(user_id: str, headers: dict,
+                            max_messages: int = CRAWL_MAX_MESSAGES) -> AsyncIterator[Dict]:
+    """
+    Crawl the user's sent mail, yielding progress events (see module comment)
+    """
+    yield {"event": "started"}
+
+    async with http_clients.borrow("gmail") as client:
+        r = await gmail_request(
+            client, "GET", f"{GMAIL_API_URL}/messages", user_id, "messages.list",
+            headers=headers,
+            params={"maxResults": max_messages, "labelIds": "SENT"}
+        )
+        message_ids = [msg["id"] for msg in r.json().get("messages", [])]
+        yield {"event": "listed", "total": len(message_ids)}
+
+        progress = {"total": len(message_ids), "fetched": 0, "cleaned": 0, "usable": 0}
+        # Indexed by position so the analysis sees emails in Gmail's order
+        cleaned: Dict[int, Dict] = {}
+        signature_counter = Counter()
+        events: asyncio.Queue = asyncio.Queue()
+        fetch_slots = asyncio.Semaphore(CRAWL_FETCH_CONCURRENCY)
+        clean_slots = asyncio.Semaphore(CRAWL_CLEAN_WORKERS)
+
+        def progress_event() -> Dict:
+            return {"event": "progress", **progress}
+
+        async def clean_message(index: int, msg_id: str, full_msg: Optional[Dict]):
+            parsed = parse_sent_message(full_msg) if full_msg else None
+            if parsed:
+                subject, sender, raw_body = parsed
+                async with clean_slots:
+                    # Talon is CPU-bound; keep it off the event loop
+                    body, sig = await asyncio.to_thread(clean_email_body, raw_body)
+                if sig:
+                    signature_counter[normalize_signature(sig)] += 1
+                # Only add emails with meaningful content
+                if body and body.strip():
+                    cleaned[index] = {"message_id": msg_id, "subject": subject, "from": sender, "body": body}
+                    progress["usable"] += 1
+            progress["cleaned"] += 1
+            events.put_nowait(progress_event())
+
+        async def fetch_chunk(start: int, chunk: List[str]):
+            async with fetch_slots:
+                full_messages = await batch_get_messages(client, headers, user_id, chunk)
+            progress["fetched"] += len(chunk)
+            events.put_nowait(progress_event())
+            await asyncio.gather(*(
+                clean_message(start + offset, msg_id, full_messages.get(msg_id))
+                for offset, msg_id in enumerate(chunk)
+            ))
+
+        async def run_all():
+            try:
+                await asyncio.gather(*(
+                    fetch_chunk(start, message_ids[start:start + CRAWL_FETCH_CHUNK])
+                    for start in range(0, len(message_ids), CRAWL_FETCH_CHUNK)
+                ))
+            finally:
+                events.put_nowait(None)
+
+        runner = asyncio.create_task(run_all())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            # Re-raise anything the fetch/clean tasks failed with
+            await runner
+        finally:
+            # The client went away mid-crawl
+            if not runner.done():
+                runner.cancel()
+
+    email_data = [cleaned[index] for index in sorted(cleaned)]
+    yield {"event": "analyzing", "usable": len(email_data)}
+
+    # Check if we have enough usable emails for analysis
+    if len(email_data) >= CRAWL_MIN_EMAILS:
+        tone_profile = await asyncio.to_thread(analyze_email_batch, email_data)
+        profile_type = "analyzed"
+    else:
+        tone_profile = copy.deepcopy(FALLBACK_TONE_PROFILE)
+        profile_type = "generic_fallback"
+    store_tone_profile(user_id, tone_profile)
+    yield {"event": "analyzed", "analyzed": len(email_data), "profile_type": profile_type}
+
+    if signature_counter:
+        signature, _ = signature_counter.most_common(1)[0]
+        supabase.table("users").update({"signature": signature}).eq("id", user_id).execute()
+        signature_cache.invalidate(user_id)
+        safe_signature = signature.strip()
+    else:
+        safe_signature = None
+
+    yield {
+        "event": "complete",
+        "emails_processed": len(email_data),
+        "signature_extracted": safe_signature,
+        "tone_profile": tone_profile
+    }
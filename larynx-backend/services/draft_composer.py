@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+from config import supabase
+
+# ─── Draft composition helpers ──────────────────────────────────────────────────
+#
+# Creating a Gmail reply draft used to GET the whole original message again (only to
+# read its Message-ID) and read + re-render users.signature for every draft.
+#   - thread_headers() pulls Message-ID, References and threadId out of the message
+#     when it is first fetched; they travel with the email through the pipeline
+#     (and the job payload), so composing the reply needs no Gmail read.
+#   - signature_cache keeps each user's signature pre-rendered as plain text and
+#     HTML. PUT /signature (and anything else that rewrites it) invalidates it;
+#     the TTL covers edits made by another worker.
+
+SIGNATURE_CACHE_TTL_SECONDS = int(os.getenv("SIGNATURE_CACHE_TTL_SECONDS", "600"))
+
+# Headers needed to thread a reply; also what a metadata-only fetch asks for
+THREAD_HEADER_NAMES = ["Message-ID", "References"]
+
+
+def thread_headers(message: Optional[Dict]) -> Dict:
+    """
+    Threading info of a Gmail message (full or metadata format)
+    """
+    if not message:
+        return {"thread_id": None, "rfc_message_id": None, "references": None}
+    headers = {h["name"].lower(): h["value"] for h in message.get("payload", {}).get("headers", [])}
+    return {
+        "thread_id": message.get("threadId"),
+        "rfc_message_id": headers.get("message-id"),
+        "references": headers.get("references"),
+    }
+
+
+def has_thread_headers(email_data: Dict) -> bool:
+    """
+    True when the email already carries what a reply needs (older job payloads don't)
+    """
+    return bool(email_data.get("thread_id") and email_data.get("rfc_message_id"))
+
+
+def clean_html_to_text(html: str) -> str:
+    """
+    Convert HTML to clean plain text (for email clients that don't support HTML)
+    """
+    if not html:
+        return ""
+
+    # Handle lists
+    html = re.sub(r'<ul[^>]*>', '', html)
+    html = re.sub(r'</ul>', '', html)
+    html = re.sub(r'<li[^>]*>', '• ', html)
+    html = re.sub(r'</li>', '\n', html)
+
+    # Handle line breaks
+    html = html.replace('<br>', '\n')
+    html = html.replace('<br/>', '\n')
+    html = html.replace('<br />', '\n')
+    html = html.replace('</p>', '\n')
+    html = html.replace('</div>', '\n')
+
+    # Remove all other HTML tags
+    html = re.sub(r'<[^>]+>', '', html)
+
+    # Clean up whitespace
+    lines = [line.strip() for line in html.split('\n')]
+    lines = [line for line in lines if line]
+
+    return '\n'.join(lines)
+
+
+def render_signature(signature: Optional[str]) -> Tuple[str, str]:
+    """
+    (plain text, HTML) versions of a stored signature, which may be either
+    """
+    if not signature:
+        return "", ""
+    looks_like_html = '<' in signature and '>' in signature
+    # Convert any HTML to plain text if it somehow got saved as HTML
+    plain = clean_html_to_text(signature) if looks_like_html else signature
+    # Convert plain text to HTML if needed
+    html = signature if looks_like_html else signature.replace('\n', '<br>\n')
+    return plain, html
+
+
+class SignatureCache:
+    def __init__(self, ttl: float = SIGNATURE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._rendered: Dict[str, Tuple[float, Tuple[str, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Tuple[str, str]:
+        """
+        The user's (plain, html) signature, read from the database on a miss
+        """
+        cached = self._rendered.get(user_id)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        try:
+            user_row = supabase.table("users").select("signature").eq("id", user_id).execute()
+            signature = user_row.data[0].get("signature", "") if user_row.data else ""
+        except Exception as e:
+            logging.error(f"Error loading signature for user {user_id}: {str(e)}")
+            # Better a stale signature than none
+            return cached[1] if cached else ("", "")
+
+        rendered = render_signature(signature)
+        self._rendered[user_id] = (time.monotonic(), rendered)
+        return rendered
+
+    def invalidate(self, user_id: str):
+        self._rendered.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        return {"cached_users": len(self._rendered), "hits": self.hits, "misses": self.misses}
+
+
+signature_cache = SignatureCache()
@@ -0,0 +1,229 @@
+import os
+import copy
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from config import supabase
+from services.monitor_leases import WORKER_ID
+
+# ─── Durable email-processing jobs ──────────────────────────────────────────────────
+#
+# Every email the monitor decides to answer becomes a job row (an outbox) keyed by
+# user_id:message_id, and each pipeline stage records its result before moving on:
+#
+#   discovered -> drafted -> gmail_drafted -> stored      (or skipped)
+#
+# A crash between stages resumes from the last recorded state on the next cycle or
+# restart, so the LLM isn't paid twice and a created Gmail draft isn't orphaned.
+# Workers claim a job with a lease before working on it.
+#
+# Required table (only with EMAIL_JOBS_ENABLED=true; otherwise jobs live in memory):
+#   create table email_jobs (
+#     id text primary key,                -- user_id:message_id
+#     user_id uuid not null references users(id) on delete cascade,
+#     message_id text not null,
+#     state text not null default 'discovered',
+#     payload jsonb not null,
+#     attempts int not null default 0,
+#     last_error text,
+#     lease_owner text,
+#     lease_expires_at timestamptz,
+#     created_at timestamptz not null default now(),
+#     updated_at timestamptz not null default now()
+#   );
+#   create index email_jobs_unfinished on email_jobs (state) where state not in ('stored', 'skipped');
+
+EMAIL_JOBS_ENABLED = os.getenv("EMAIL_JOBS_ENABLED", "false").lower() in ("1", "true", "yes")
+JOB_LEASE_SECONDS = int(os.getenv("EMAIL_JOB_LEASE_SECONDS", "300"))
+
+DISCOVERED = "discovered"
+DRAFTED = "drafted"
+GMAIL_DRAFTED = "gmail_drafted"
+STORED = "stored"
+SKIPPED = "skipped"
+
+# States in pipeline order; a job never moves backwards
+JOB_STATES = [DISCOVERED, DRAFTED, GMAIL_DRAFTED, STORED]
+FINAL_JOB_STATES = {STORED, SKIPPED}
+
+
+def job_key(user_id: str, message_id: str) -> str:
+    """
+    Idempotency key: one job per message per user
+    """
+    return f"{user_id}:{message_id}"
+
+
+def job_reached(job: Dict, state: str) -> bool:
+    """
+    True if the job has already completed the given state
+    """
+    if job["state"] == SKIPPED:
+        return True
+    return JOB_STATES.index(job["state"]) >= JOB_STATES.index(state)
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class InMemoryJobStore:
+    """
+    Local stand-in with the same interface as SupabaseJobStore.
+    Nothing survives a restart, but the pipeline code path is identical.
+    """
+
+    def __init__(self, owner: str = WORKER_ID, lease_seconds: int = JOB_LEASE_SECONDS):
+        self.owner = owner
+        self.lease = timedelta(seconds=lease_seconds)
+        self.jobs: Dict[str, Dict] = {}
+
+    def discover(self, user_id: str, message_id: str, payload: Dict) -> Dict:
+        """
+        Create the job for a message, or return the existing one untouched
+        """
+        key = job_key(user_id, message_id)
+        if key not in self.jobs:
+            now = _iso(_utc_now())
+            self.jobs[key] = {
+                "id": key, "user_id": user_id, "message_id": message_id, "state": DISCOVERED,
+                "payload": copy.deepcopy(payload), "attempts": 0, "last_error": None,
+                "lease_owner": None, "lease_expires_at": None, "created_at": now, "updated_at": now,
+            }
+        return copy.deepcopy(self.jobs[key])
+
+    def claim(self, job: Dict) -> bool:
+        row = self.jobs.get(job["id"])
+        if row is None or row["state"] in FINAL_JOB_STATES:
+            return False
+        now = _utc_now()
+        if row["lease_owner"] not in (None, self.owner) and row["lease_expires_at"] > _iso(now):
+            return False
+        row["lease_owner"] = self.owner
+        row["lease_expires_at"] = _iso(now + self.lease)
+        return True
+
+    def advance(self, job: Dict, state: str):
+        """
+        Record that the job finished a stage, with its payload so far. Renews the lease.
+        """
+        row = self.jobs[job["id"]]
+        job["state"] = state
+        row["state"] = state
+        row["payload"] = copy.deepcopy(job["payload"])
+        row["updated_at"] = _iso(_utc_now())
+        if state in FINAL_JOB_STATES:
+            row["lease_owner"] = row["lease_expires_at"] = None
+        else:
+            row["lease_expires_at"] = _iso(_utc_now() + self.lease)
+
+    def release(self, job: Dict, error: Optional[str] = None):
+        """
+        Drop our lease so the job can be picked up again (after a failure or cancel)
+        """
+        row = self.jobs.get(job["id"])
+        if row is None or row["lease_owner"] != self.owner:
+            return
+        row["lease_owner"] = row["lease_expires_at"] = None
+        if error:
+            row["attempts"] += 1
+            row["last_error"] = error
+
+    def list_unfinished(self, limit: int = 1000) -> List[Dict]:
+        rows = [row for row in self.jobs.values() if row["state"] not in FINAL_JOB_STATES]
+        rows.sort(key=lambda row: row["created_at"])
+        return copy.deepcopy(rows[:limit])
+
+    def purge_finished(self, older_than: datetime) -> int:
+        cutoff = _iso(older_than)
+        stale = [key for key, row in self.jobs.items()
+                 if row["state"] in FINAL_JOB_STATES and row["updated_at"] < cutoff]
+        for key in stale:
+            del self.jobs[key]
+        return len(stale)
+
+
+class SupabaseJobStore:
+    """
+    Jobs in the email_jobs table - survives restarts and is shared by all workers
+    """
+
+    def __init__(self, owner: str = WORKER_ID, lease_seconds: int = JOB_LEASE_SECONDS):
+        self.owner = owner
+        self.lease = timedelta(seconds=lease_seconds)
+
+    def discover(self, user_id: str, message_id: str, payload: Dict) -> Dict:
+        key = job_key(user_id, message_id)
+        result = supabase.table("email_jobs").upsert({
+            "id": key,
+            "user_id": user_id,
+            "message_id": message_id,
+            "state": DISCOVERED,
+            "payload": payload,
+        }, on_conflict="id", ignore_duplicates=True).execute()
+        if result.data:
+            return result.data[0]
+
+        # Already known (e.g. a crash mid-pipeline) - resume from its recorded state
+        result = supabase.table("email_jobs").select("*").eq("id", key).execute()
+        return result.data[0]
+
+    def claim(self, job: Dict) -> bool:
+        now = _utc_now()
+        try:
+            result = supabase.table("email_jobs").update({
+                "lease_owner": self.owner,
+                "lease_expires_at": _iso(now + self.lease),
+            }).eq("id", job["id"]).not_.in_("state", list(FINAL_JOB_STATES)).or_(
+                f'lease_owner.is.null,lease_owner.eq."{self.owner}",lease_expires_at.lt.{_iso(now)}'
+            ).execute()
+            return bool(result.data)
+        except Exception as e:
+            logging.error(f"Error claiming email job {job['id']}: {str(e)}")
+            return False
+
+    def advance(self, job: Dict, state: str):
+        update = {
+            "state": state,
+            "payload": job["payload"],
+            "updated_at": _iso(_utc_now()),
+            "lease_expires_at": None if state in FINAL_JOB_STATES else _iso(_utc_now() + self.lease),
+        }
+        if state in FINAL_JOB_STATES:
+            update["lease_owner"] = None
+        supabase.table("email_jobs").update(update).eq("id", job["id"]).execute()
+        job["state"] = state
+
+    def release(self, job: Dict, error: Optional[str] = None):
+        update = {"lease_owner": None, "lease_expires_at": None}
+        if error:
+            update["attempts"] = job.get("attempts", 0) + 1
+            update["last_error"] = error
+        try:
+            supabase.table("email_jobs").update(update).eq("id", job["id"]).eq("lease_owner", self.owner).execute()
+        except Exception as e:
+            logging.error(f"Error releasing email job {job['id']}: {str(e)}")
+
+    def list_unfinished(self, limit: int = 1000) -> List[Dict]:
+        result = supabase.table("email_jobs").select("*").not_.in_(
+            "state", list(FINAL_JOB_STATES)
+        ).order("created_at").limit(limit).execute()
+        return result.data or []
+
+    def purge_finished(self, older_than: datetime) -> int:
+        result = supabase.table("email_jobs").delete().in_(
+            "state", list(FINAL_JOB_STATES)
+        ).lt("updated_at", _iso(older_than)).execute()
+        return len(result.data) if result.data else 0
+
+
+def create_job_store():
+    if EMAIL_JOBS_ENABLED:
+        logging.info("📦 Email jobs are stored in Supabase (email_jobs)")
+        return SupabaseJobStore()
+    return InMemoryJobStore()
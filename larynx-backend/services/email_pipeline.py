@@ -0,0 +1,247 @@
+import os
+import asyncio
+import logging
+import itertools
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+# ─── Staged email processing pipeline ──────────────────────────────────────────────────
+#
+# Emails found by a monitor cycle flow through stages (clean -> draft -> Gmail draft
+# -> persist) joined by bounded queues, each stage with its own worker count. Slow
+# stages (the LLM call) work on many emails at once, across all users.
+#
+# Stages marked ordered see a user's emails in the order they were submitted:
+# an email that arrives out of turn is parked (without holding a worker) until the
+# emails before it have left that stage.
+#
+# Cancelling a user abandons emails waiting for an interruptible stage. Stages after
+# a side effect (a Gmail draft exists) are not interruptible, so the draft always
+# gets persisted.
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+
+# Outcomes an item can end with
+DONE = "done"            # went through every stage
+SKIPPED = "skipped"      # a stage decided there is nothing to do (not an error)
+FAILED = "failed"        # a stage raised - the email should be retried
+ABANDONED = "abandoned"  # cancelled or shut down before finishing - retry later
+
+# A stage handler gets the item and returns False to end it early as SKIPPED
+StageHandler = Callable[["PipelineItem"], Awaitable[Optional[bool]]]
+
+
+class PipelineStage:
+    def __init__(self, name: str, handler: StageHandler, concurrency: int = 1,
+                 ordered: bool = False, interruptible: bool = True):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.ordered = ordered
+        self.interruptible = interruptible
+
+
+class PipelineItem:
+    __slots__ = ("user_id", "seq", "data", "future", "stage_index", "abandoned", "error")
+
+    def __init__(self, user_id: str, seq: int, data: Dict, future: asyncio.Future):
+        self.user_id = user_id
+        self.seq = seq
+        self.data = data
+        self.future = future
+        self.stage_index = 0
+        self.abandoned = False
+        self.error: Optional[str] = None
+
+
+class _UserLane:
+    """
+    Per-user sequencing state for the ordered stages
+    """
+    __slots__ = ("seqs", "inflight", "items", "expected", "passed", "parked")
+
+    def __init__(self, ordered_stages: List[int]):
+        self.seqs = itertools.count()
+        self.inflight = 0
+        self.items: Set[PipelineItem] = set()
+        self.expected: Dict[int, int] = {i: 0 for i in ordered_stages}
+        self.passed: Dict[int, Set[int]] = {i: set() for i in ordered_stages}
+        self.parked: Dict[int, Dict[int, PipelineItem]] = {i: {} for i in ordered_stages}
+
+
+class EmailPipeline:
+    def __init__(self, stages: List[PipelineStage], queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self._ordered = [i for i, stage in enumerate(stages) if stage.ordered]
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._lanes: Dict[str, _UserLane] = {}
+        self._counts = {stage.name: 0 for stage in stages}
+        self._outcomes = {DONE: 0, SKIPPED: 0, FAILED: 0, ABANDONED: 0}
+
+    # ─── Lifecycle ──────────────────────────────────────────────────
+
+    def start(self):
+        """
+        Start every stage's workers (idempotent)
+        """
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.concurrency):
+                self._workers.append(asyncio.create_task(self._work(index), name=f"pipeline-{stage.name}-{n}"))
+        logging.info("🧵 Email pipeline started: " + ", ".join(f"{s.name}x{s.concurrency}" for s in self.stages))
+
+    async def stop(self):
+        """
+        Cancel the workers; anything still queued is abandoned
+        """
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for lane in list(self._lanes.values()):
+            for item in list(lane.items):
+                self._finish(item, ABANDONED)
+        self._lanes.clear()
+
+    # ─── Submitting work ──────────────────────────────────────────────────
+
+    async def submit(self, user_id: str, data: Dict) -> asyncio.Future:
+        """
+        Queue an email for processing. The returned future resolves to the outcome
+        (DONE, SKIPPED, FAILED or ABANDONED). Waits if the first stage is full.
+        """
+        self.start()
+        lane = self._lanes.get(user_id)
+        if lane is None:
+            lane = self._lanes[user_id] = _UserLane(self._ordered)
+
+        item = PipelineItem(user_id, next(lane.seqs), data, asyncio.get_running_loop().create_future())
+        lane.inflight += 1
+        lane.items.add(item)
+        await self._enter(item, 0)
+        return item.future
+
+    def cancel_user(self, user_id: str) -> int:
+        """
+        Abandon a user's emails that haven't got past the interruptible stages.
+        Work already inside a stage finishes that stage.
+        """
+        lane = self._lanes.get(user_id)
+        if lane is None:
+            return 0
+        for item in lane.items:
+            item.abandoned = True
+        # Parked items wait for no worker, finish the interruptible ones now
+        parked = [
+            item for index, stage_parked in lane.parked.items() if self.stages[index].interruptible
+            for item in stage_parked.values()
+        ]
+        for item in parked:
+            self._finish(item, ABANDONED)
+        return len(lane.items)
+
+    # ─── Stage plumbing ──────────────────────────────────────────────────
+
+    async def _enter(self, item: PipelineItem, index: int):
+        item.stage_index = index
+        if item.abandoned and self.stages[index].interruptible:
+            self._finish(item, ABANDONED)
+            return
+        lane = self._lanes[item.user_id]
+        if index in lane.expected and item.seq != lane.expected[index]:
+            # Out of turn for an ordered stage - park without holding a worker
+            lane.parked[index][item.seq] = item
+            return
+        await self._queues[index].put(item)
+
+    def _leave_ordered(self, lane: _UserLane, index: int, seq: int):
+        """
+        Mark seq as done with ordered stage index and release whoever is next in line
+        """
+        lane.passed[index].add(seq)
+        while lane.expected[index] in lane.passed[index]:
+            lane.passed[index].discard(lane.expected[index])
+            lane.expected[index] += 1
+        next_item = lane.parked[index].pop(lane.expected[index], None)
+        if next_item is not None:
+            # Not awaited: the caller may be the worker that would drain this queue
+            asyncio.create_task(self._queues[index].put(next_item))
+
+    def _finish(self, item: PipelineItem, outcome: str):
+        lane = self._lanes.get(item.user_id)
+        if lane is None or item not in lane.items:
+            return
+        lane.items.discard(item)
+
+        # An item that ends early counts as passed for the ordered stages it never reached
+        for index in self._ordered:
+            if index >= item.stage_index:
+                lane.parked[index].pop(item.seq, None)
+                self._leave_ordered(lane, index, item.seq)
+
+        lane.inflight -= 1
+        if lane.inflight == 0:
+            del self._lanes[item.user_id]
+
+        self._outcomes[outcome] += 1
+        if not item.future.done():
+            item.future.set_result(outcome)
+
+    async def _work(self, index: int):
+        stage = self.stages[index]
+        queue = self._queues[index]
+        while True:
+            item = await queue.get()
+            try:
+                if item.abandoned and stage.interruptible:
+                    self._finish(item, ABANDONED)
+                    continue
+
+                try:
+                    keep_going = await stage.handler(item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    item.error = str(e)
+                    logging.error(f"❌ Pipeline stage {stage.name} failed for user {item.user_id}: {str(e)}")
+                    self._finish(item, FAILED)
+                    continue
+
+                self._counts[stage.name] += 1
+                if keep_going is False:
+                    self._finish(item, SKIPPED)
+                elif index + 1 == len(self.stages):
+                    self._finish(item, DONE)
+                else:
+                    if stage.ordered:
+                        self._leave_ordered(self._lanes[item.user_id], index, item.seq)
+                    await self._enter(item, index + 1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Pipeline worker error in stage {stage.name}: {str(e)}")
+                self._finish(item, FAILED)
+            finally:
+                queue.task_done()
+
+    # ─── Introspection ──────────────────────────────────────────────────
+
+    def stats(self) -> Dict:
+        return {
+            "started": bool(self._workers),
+            "stages": [
+                {
+                    "name": stage.name,
+                    "concurrency": stage.concurrency,
+                    "ordered": stage.ordered,
+                    "queued": self._queues[i].qsize() if self._queues else 0,
+                    "processed": self._counts[stage.name],
+                }
+                for i, stage in enumerate(self.stages)
+            ],
+            "users_in_flight": len(self._lanes),
+            "outcomes": dict(self._outcomes),
+        }
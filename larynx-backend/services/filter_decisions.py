@@ -0,0 +1,81 @@
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+# ─── Filter decision log ──────────────────────────────────────────────────
+#
+# The last FILTER_DECISION_LOG_SIZE bot-detector decisions per monitored user,
+# with the signals that fired and what each cost (bot_detector.evaluate()), plus
+# running totals per signal across all users - how often it runs, fires and how
+# long it takes - to tune the signals and their order with real mail.
+# In memory only; shown by /debug/filtered-emails and /monitoring/scheduler.
+
+FILTER_DECISION_LOG_SIZE = int(os.getenv("FILTER_DECISION_LOG_SIZE", "200"))
+
+
+class FilterDecisionLog:
+    def __init__(self, size: int = FILTER_DECISION_LOG_SIZE):
+        self.size = size
+        self._recent: Dict[str, Deque[Dict]] = {}
+        # signal name -> {"evaluated", "fired", "total_ms"}
+        self._signals: Dict[str, Dict] = {}
+        self.decisions = 0
+        self.early_exits = 0
+
+    def record(self, user_id: str, message_id: str, stage: str, verdict: Dict):
+        """
+        Keep a bot detector verdict (stage is "headers" for the metadata screen or "full")
+        """
+        self.decisions += 1
+        if verdict["skipped"]:
+            self.early_exits += 1
+        for name, ms in verdict["timings_ms"].items():
+            totals = self._signals.setdefault(name, {"evaluated": 0, "fired": 0, "total_ms": 0.0})
+            totals["evaluated"] += 1
+            totals["total_ms"] += ms
+            if name in verdict["fired"]:
+                totals["fired"] += 1
+
+        recent = self._recent.get(user_id)
+        if recent is None:
+            recent = self._recent[user_id] = deque(maxlen=self.size)
+        recent.append({
+            "message_id": message_id,
+            "stage": stage,
+            "decided_at": datetime.now(timezone.utc).isoformat(),
+            **verdict,
+        })
+
+    def recent(self, user_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        The user's latest decisions, newest first
+        """
+        decisions = list(reversed(self._recent.get(user_id, ())))
+        return decisions if limit is None else decisions[:limit]
+
+    def for_message(self, user_id: str, message_id: str) -> Optional[Dict]:
+        """
+        The latest decision about one message, if still kept
+        """
+        return next((d for d in reversed(self._recent.get(user_id, ())) if d["message_id"] == message_id), None)
+
+    def forget(self, user_id: str):
+        self._recent.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        return {
+            "decisions": self.decisions,
+            "early_exits": self.early_exits,
+            "signals": {
+                name: {
+                    "evaluated": totals["evaluated"],
+                    "fired": totals["fired"],
+                    "avg_ms": round(totals["total_ms"] / totals["evaluated"], 4) if totals["evaluated"] else 0,
+                }
+                for name, totals in self._signals.items()
+            },
+        }
+
+
+filter_decisions = FilterDecisionLog()
@@ -0,0 +1,168 @@
+import os
+import json
+import uuid
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from services.gmail_sync import GMAIL_API_URL, GMAIL_API_BASE_URL
+from services.gmail_rate_limiter import gmail_request, rate_limit_reason, GMAIL_QUOTA_UNITS
+
+# ─── Gmail batch requests ──────────────────────────────────────────────────
+#
+# Packs many messages.get calls into one multipart/mixed POST to /batch/gmail/v1
+# instead of one round-trip per message. Each part still costs its normal quota.
+# Parts that come back rate limited or failing with 5xx are retried one by one
+# through gmail_request (which backs off); a failed batch call falls back to
+# individual requests entirely.
+#
+# https://developers.google.com/gmail/api/guides/batch
+
+GMAIL_BATCH_URL = os.getenv("GMAIL_BATCH_URL", f"{GMAIL_API_BASE_URL}/batch/gmail/v1")
+# Gmail allows 100 parts, but larger batches are more likely to be rate limited
+GMAIL_BATCH_SIZE = min(100, int(os.getenv("GMAIL_BATCH_SIZE", "50")))
+
+# Path of the Gmail API inside a batch part (GMAIL_API_URL without the host)
+GMAIL_API_PATH = "/gmail/v1/users/me"
+
+
+def build_batch_body(requests: List[Tuple[str, str]], boundary: str) -> str:
+    """
+    requests is a list of (method, path-with-query). Part i gets Content-ID <item-i>.
+    """
+    lines = []
+    for i, (method, path) in enumerate(requests):
+        lines += [
+            f"--{boundary}",
+            "Content-Type: application/http",
+            f"Content-ID: <item-{i}>",
+            "",
+            f"{method} {path}",
+            "",
+        ]
+    lines.append(f"--{boundary}--")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _boundary_from_content_type(content_type: str) -> Optional[str]:
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            return value.strip('"')
+    return None
+
+
+def parse_batch_response(content_type: str, body: bytes) -> Dict[int, Tuple[int, Optional[Dict]]]:
+    """
+    Parse a multipart/mixed batch response into {part index: (status, json body)}
+    """
+    boundary = _boundary_from_content_type(content_type)
+    if not boundary:
+        raise ValueError(f"Batch response without a boundary: {content_type}")
+
+    results: Dict[int, Tuple[int, Optional[Dict]]] = {}
+    text = body.decode("utf-8", errors="replace")
+    for part in text.split(f"--{boundary}"):
+        part = part.strip("\r\n")
+        if not part or part == "--":
+            continue
+
+        # Part headers, then the embedded HTTP response (status line, headers, body)
+        part_headers, _, http_response = part.replace("\r\n", "\n").partition("\n\n")
+        content_id = None
+        for line in part_headers.split("\n"):
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-id":
+                content_id = value.strip().strip("<>")
+        if not content_id or "item-" not in content_id:
+            continue
+        index = int(content_id.rsplit("item-", 1)[1])
+
+        status_and_headers, _, response_body = http_response.partition("\n\n")
+        status_line = status_and_headers.split("\n", 1)[0]
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            status = 0
+
+        try:
+            payload = json.loads(response_body) if response_body.strip() else None
+        except ValueError:
+            payload = None
+        results[index] = (status, payload)
+
+    return results
+
+
+async def _get_individually(client: httpx.AsyncClient, headers: dict, user_id: str,
+                            message_ids: List[str], params: Dict) -> Dict[str, Optional[Dict]]:
+    results = {}
+    for msg_id in message_ids:
+        r = await gmail_request(
+            client, "GET", f"{GMAIL_API_URL}/messages/{msg_id}", user_id, "messages.get",
+            headers=headers, params=params
+        )
+        results[msg_id] = r.json() if r.status_code == 200 else None
+        if r.status_code != 200:
+            logging.error(f"Gmail messages.get failed for {msg_id}: {r.status_code}")
+    return results
+
+
+async def batch_get_messages(client: httpx.AsyncClient, headers: dict, user_id: str,
+                             message_ids: List[str], params: Optional[Dict] = None,
+                             batch_size: int = GMAIL_BATCH_SIZE) -> Dict[str, Optional[Dict]]:
+    """
+    Fetch many messages with batch requests.
+    Returns {message_id: message JSON, or None if it couldn't be fetched}.
+    """
+    params = params or {}
+    query = str(httpx.QueryParams(params))
+    results: Dict[str, Optional[Dict]] = {}
+
+    for start in range(0, len(message_ids), batch_size):
+        chunk = message_ids[start:start + batch_size]
+        if len(chunk) == 1:
+            results.update(await _get_individually(client, headers, user_id, chunk, params))
+            continue
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        requests = [("GET", f"{GMAIL_API_PATH}/messages/{msg_id}" + (f"?{query}" if query else "")) for msg_id in chunk]
+        r = await gmail_request(
+            client, "POST", GMAIL_BATCH_URL, user_id, "batch:messages.get",
+            units=GMAIL_QUOTA_UNITS["messages.get"] * len(chunk),
+            headers={**headers, "Content-Type": f"multipart/mixed; boundary={boundary}"},
+            content=build_batch_body(requests, boundary)
+        )
+
+        parts = None
+        if r.status_code == 200:
+            try:
+                parts = parse_batch_response(r.headers.get("Content-Type", ""), r.content)
+            except Exception as e:
+                logging.error(f"Could not parse Gmail batch response: {str(e)}")
+        else:
+            logging.error(f"Gmail batch request failed ({r.status_code}), fetching {len(chunk)} messages one by one")
+
+        if parts is None:
+            results.update(await _get_individually(client, headers, user_id, chunk, params))
+            continue
+
+        retry = []
+        for i, msg_id in enumerate(chunk):
+            status, payload = parts.get(i, (0, None))
+            if status == 200:
+                results[msg_id] = payload
+            elif status == 404:
+                results[msg_id] = None
+            elif status >= 500 or status == 0 or rate_limit_reason(httpx.Response(status, json=payload)):
+                retry.append(msg_id)
+            else:
+                logging.error(f"Gmail batch part for {msg_id} failed: {status}")
+                results[msg_id] = None
+
+        if retry:
+            logging.info(f"⏳ Retrying {len(retry)} of {len(chunk)} batched messages individually")
+            results.update(await _get_individually(client, headers, user_id, retry, params))
+
+    return results
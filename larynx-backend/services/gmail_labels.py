@@ -0,0 +1,177 @@
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from services.gmail_sync import GMAIL_API_URL
+from services.gmail_rate_limiter import gmail_request
+
+# ─── Gmail "handled" labels ──────────────────────────────────────────────────
+#
+# Optional (GMAIL_LABELS_ENABLED=true): every message we draft a reply for gets a
+# Larynx/Processed label in the user's mailbox, every message we filter out gets
+# Larynx/Filtered. Labels are applied in bulk with messages.batchModify after each
+# monitoring cycle, and the full-sync list query excludes both, so Gmail only
+# returns mail we haven't handled yet - less to list, fetch and look up.
+# The labels are created in the mailbox on first use (needs the gmail.modify scope).
+#
+# https://developers.google.com/gmail/api/reference/rest/v1/users.messages/batchModify
+
+GMAIL_LABELS_ENABLED = os.getenv("GMAIL_LABELS_ENABLED", "false").lower() in ("1", "true", "yes")
+PROCESSED_LABEL = os.getenv("GMAIL_PROCESSED_LABEL", "Larynx/Processed")
+FILTERED_LABEL = os.getenv("GMAIL_FILTERED_LABEL", "Larynx/Filtered")
+
+PROCESSED = "processed"
+FILTERED = "filtered"
+LABEL_NAMES = {PROCESSED: PROCESSED_LABEL, FILTERED: FILTERED_LABEL}
+
+# batchModify takes at most 1000 ids per call
+BATCH_MODIFY_MAX_IDS = 1000
+# Queued ids kept per user and label while Gmail keeps refusing them
+MAX_PENDING_PER_LABEL = 5000
+
+
+def search_label_name(name: str) -> str:
+    """
+    How a label is written in a Gmail search (lowercase, "/" and spaces as "-")
+    """
+    return name.lower().replace("/", "-").replace(" ", "-")
+
+
+class GmailLabelManager:
+    def __init__(self, enabled: bool = GMAIL_LABELS_ENABLED):
+        self.enabled = enabled
+        # user_id -> {processed/filtered: Gmail label id}
+        self._label_ids: Dict[str, Dict[str, str]] = {}
+        # user_id -> {processed/filtered: [message ids]} waiting for the end of the cycle
+        self._pending: Dict[str, Dict[str, List[str]]] = {}
+        self.labeled = 0
+        self.calls = 0
+
+    def query_exclusion(self) -> str:
+        """
+        Gmail search terms that skip messages we've already handled ("" when disabled)
+        """
+        if not self.enabled:
+            return ""
+        return " ".join(f"-label:{search_label_name(name)}" for name in LABEL_NAMES.values())
+
+    def mark(self, user_id: str, message_id: str, kind: str):
+        """
+        Queue a message for labelling (kind is PROCESSED or FILTERED)
+        """
+        if not self.enabled:
+            return
+        pending = self._pending.setdefault(user_id, {})
+        pending.setdefault(kind, []).append(message_id)
+
+    def has_pending(self, user_id: str) -> bool:
+        return bool(self._pending.get(user_id))
+
+    def forget(self, user_id: str):
+        self._label_ids.pop(user_id, None)
+        self._pending.pop(user_id, None)
+
+    async def ensure_labels(self, client: httpx.AsyncClient, headers: dict, user_id: str) -> Optional[Dict[str, str]]:
+        """
+        Our label ids in the user's mailbox, creating the labels if needed
+        """
+        label_ids = self._label_ids.get(user_id)
+        if label_ids:
+            return label_ids
+
+        r = await gmail_request(client, "GET", f"{GMAIL_API_URL}/labels", user_id, "labels.list", headers=headers)
+        self.calls += 1
+        if r.status_code != 200:
+            logging.error(f"Failed to list Gmail labels for user {user_id}: {r.text}")
+            return None
+        existing = {label["name"]: label["id"] for label in r.json().get("labels", [])}
+
+        label_ids = {}
+        for kind, name in LABEL_NAMES.items():
+            if name in existing:
+                label_ids[kind] = existing[name]
+                continue
+            r = await gmail_request(
+                client, "POST", f"{GMAIL_API_URL}/labels", user_id, "labels.create",
+                headers=headers,
+                json={"name": name, "labelListVisibility": "labelShow", "messageListVisibility": "show"}
+            )
+            self.calls += 1
+            if r.status_code != 200:
+                logging.error(f"Failed to create Gmail label {name} for user {user_id}: {r.text}")
+                return None
+            label_ids[kind] = r.json()["id"]
+            logging.info(f"🏷️ Created Gmail label {name} for user {user_id}")
+
+        self._label_ids[user_id] = label_ids
+        return label_ids
+
+    async def apply(self, client: httpx.AsyncClient, headers: dict, user_id: str) -> int:
+        """
+        Label every queued message of a user with batchModify. Returns messages labelled.
+        Messages that couldn't be labelled stay queued for the next cycle.
+        """
+        pending = self._pending.pop(user_id, None)
+        if not pending:
+            return 0
+
+        try:
+            labeled, failed = await self._apply(client, headers, user_id, pending)
+        except Exception:
+            # Adding a label twice is harmless, so just retry all of them next cycle
+            self._requeue(user_id, pending)
+            raise
+        if failed:
+            self._requeue(user_id, failed)
+        self.labeled += labeled
+        return labeled
+
+    def _requeue(self, user_id: str, batches: Dict[str, List[str]]):
+        pending = self._pending.setdefault(user_id, {})
+        for kind, message_ids in batches.items():
+            queued = message_ids + pending.get(kind, [])
+            if len(queued) > MAX_PENDING_PER_LABEL:
+                logging.warning(f"Dropping {len(queued) - MAX_PENDING_PER_LABEL} unlabelled messages for user {user_id}")
+                queued = queued[-MAX_PENDING_PER_LABEL:]
+            pending[kind] = queued
+
+    async def _apply(self, client: httpx.AsyncClient, headers: dict, user_id: str,
+                     pending: Dict[str, List[str]]) -> Tuple[int, Dict[str, List[str]]]:
+        labeled = 0
+        failed: Dict[str, List[str]] = {}
+        label_ids = await self.ensure_labels(client, headers, user_id)
+        for kind, message_ids in pending.items():
+            message_ids = list(dict.fromkeys(message_ids))
+            if label_ids is None:
+                failed[kind] = message_ids
+                continue
+            for start in range(0, len(message_ids), BATCH_MODIFY_MAX_IDS):
+                chunk = message_ids[start:start + BATCH_MODIFY_MAX_IDS]
+                r = await gmail_request(
+                    client, "POST", f"{GMAIL_API_URL}/messages/batchModify", user_id, "messages.batchModify",
+                    headers=headers, json={"ids": chunk, "addLabelIds": [label_ids[kind]]}
+                )
+                self.calls += 1
+                if r.status_code in (200, 204):
+                    labeled += len(chunk)
+                    continue
+                logging.error(f"Failed to label {len(chunk)} messages for user {user_id}: {r.status_code} {r.text}")
+                failed.setdefault(kind, []).extend(chunk)
+                if r.status_code in (400, 404):
+                    # The user may have deleted our label - look it up again next time
+                    self._label_ids.pop(user_id, None)
+        return labeled, failed
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "users_with_labels": len(self._label_ids),
+            "pending_messages": sum(len(ids) for kinds in self._pending.values() for ids in kinds.values()),
+            "labeled": self.labeled,
+            "api_calls": self.calls,
+        }
+
+
+gmail_labels = GmailLabelManager()
@@ -0,0 +1,112 @@
+import os
+import json
+import base64
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import httpx
+
+from services.gmail_sync import GMAIL_API_URL
+from services.gmail_rate_limiter import gmail_request
+from services.http_clients import http_clients
+
+# ─── Gmail push notifications ──────────────────────────────────────────────────
+#
+# Gmail "watch" publishes a Pub/Sub message ({"emailAddress", "historyId"}) every
+# time a watched mailbox changes. Pub/Sub pushes it to POST /gmail/push, which
+# triggers only that user's next monitor cycle. Polling stays on as a slow safety net.
+
+# Full Pub/Sub topic name, e.g. projects/my-project/topics/gmail-inbox
+GMAIL_PUSH_TOPIC = os.getenv("GMAIL_PUSH_TOPIC")
+# Shared secret added to the push subscription URL as ?token=... (required - without
+# it /gmail/push rejects everything)
+GMAIL_PUSH_VERIFICATION_TOKEN = os.getenv("GMAIL_PUSH_VERIFICATION_TOKEN")
+
+# A watch lasts 7 days, renew well before that
+WATCH_RENEW_INTERVAL = timedelta(days=1)
+
+watch_renewed_at: Dict[str, datetime] = {}
+
+
+def is_push_enabled() -> bool:
+    return bool(GMAIL_PUSH_TOPIC)
+
+
+def check_push_config() -> bool:
+    """
+    Log a push setup that can't work. /gmail/push refuses every notification
+    without a verification token, so polling stays the only trigger.
+    """
+    if is_push_enabled() and not GMAIL_PUSH_VERIFICATION_TOKEN:
+        logging.error("❌ GMAIL_PUSH_TOPIC is set but GMAIL_PUSH_VERIFICATION_TOKEN is not - /gmail/push will reject all notifications")
+        return False
+    return True
+
+
+def decode_push_notification(envelope: dict) -> Optional[Dict]:
+    """
+    Decode a Pub/Sub push envelope into {"email_address", "history_id"}.
+    Returns None if the envelope isn't a Gmail notification.
+    """
+    try:
+        data = envelope["message"]["data"]
+        # Pub/Sub uses standard base64, pad defensively
+        payload = json.loads(base64.b64decode(data + "=" * (-len(data) % 4)).decode("utf-8"))
+        email_address = payload.get("emailAddress")
+        if not email_address:
+            return None
+        return {
+            "email_address": email_address.lower(),
+            "history_id": str(payload.get("historyId")) if payload.get("historyId") else None
+        }
+    except Exception as e:
+        logging.warning(f"Could not decode push notification: {str(e)}")
+        return None
+
+
+def forget_user(user_id: str):
+    """
+    Drop push bookkeeping for a user whose monitor stopped
+    """
+    watch_renewed_at.pop(user_id, None)
+
+
+async def register_gmail_watch(client: httpx.AsyncClient, headers: dict, user_id: str) -> Optional[Dict]:
+    """
+    Ask Gmail to publish inbox changes for this mailbox to GMAIL_PUSH_TOPIC
+    """
+    r = await gmail_request(
+        client, "POST", f"{GMAIL_API_URL}/watch", user_id, "watch",
+        headers={**headers, "Content-Type": "application/json"},
+        json={
+            "topicName": GMAIL_PUSH_TOPIC,
+            "labelIds": ["INBOX"],
+            "labelFilterBehavior": "INCLUDE"
+        }
+    )
+    if r.status_code != 200:
+        logging.error(f"Gmail watch error: {r.text}")
+        return None
+    return r.json()
+
+
+async def ensure_gmail_watch(user_id: str, headers: dict):
+    """
+    Register (or renew) the Gmail watch for a user if push mode is enabled
+    """
+    if not is_push_enabled():
+        return
+
+    renewed_at = watch_renewed_at.get(user_id)
+    if renewed_at and datetime.utcnow() - renewed_at < WATCH_RENEW_INTERVAL:
+        return
+
+    try:
+        async with http_clients.borrow("gmail") as client:
+            watch = await register_gmail_watch(client, headers, user_id)
+        if watch:
+            watch_renewed_at[user_id] = datetime.utcnow()
+            logging.info(f"📬 Gmail watch active for user {user_id} (expires {watch.get('expiration')})")
+    except Exception as e:
+        logging.error(f"Error registering Gmail watch for user {user_id}: {str(e)}")
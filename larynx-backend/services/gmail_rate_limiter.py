@@ -0,0 +1,253 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+
+# ─── Gmail quota-aware rate limiting ──────────────────────────────────────────────────
+#
+# Every Gmail call in the process goes through gmail_request(), which takes quota
+# units from a per-user and a global token bucket before sending, and retries 429,
+# 5xx and rate-limit 403s with jittered exponential backoff (or Retry-After).
+# A rate-limited user or project pauses its bucket, so all callers slow down together
+# instead of each one failing independently.
+# Calls that create something (NON_IDEMPOTENT_METHODS) are only retried when Gmail
+# surely didn't act on them: rate limits, and errors before the request was sent.
+# A 5xx or a timeout mid-request could mean it went through, and a retry would
+# create a second draft, so those go back to the caller.
+#
+# https://developers.google.com/gmail/api/reference/quota
+
+GMAIL_USER_UNITS_PER_SECOND = float(os.getenv("GMAIL_USER_UNITS_PER_SECOND", "250"))
+GMAIL_GLOBAL_UNITS_PER_SECOND = float(os.getenv("GMAIL_GLOBAL_UNITS_PER_SECOND", "20000"))
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "5"))
+GMAIL_BACKOFF_BASE_SECONDS = float(os.getenv("GMAIL_BACKOFF_BASE_SECONDS", "1"))
+GMAIL_BACKOFF_MAX_SECONDS = float(os.getenv("GMAIL_BACKOFF_MAX_SECONDS", "64"))
+
+# Quota units per Gmail API method
+GMAIL_QUOTA_UNITS = {
+    "getProfile": 1,
+    "history.list": 2,
+    "labels.list": 1,
+    "labels.create": 5,
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.batchModify": 50,
+    "drafts.create": 10,
+    "watch": 100,
+}
+DEFAULT_QUOTA_UNITS = 5
+
+# Methods that must not be repeated if Gmail may already have run them
+NON_IDEMPOTENT_METHODS = {"drafts.create", "labels.create"}
+# Transport errors raised before any of the request was sent
+UNSENT_REQUEST_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# 403 reasons Gmail uses for rate limits (other 403s are real permission errors)
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "dailyLimitExceeded"}
+# Reasons that mean the whole project is over quota, not just one mailbox
+PROJECT_LIMIT_REASONS = {"rateLimitExceeded", "quotaExceeded", "dailyLimitExceeded"}
+
+
+class GmailRateLimitError(Exception):
+    """
+    Gmail kept rate limiting after all retries. Callers should back off and
+    retry later rather than treat it as a failure.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "paused_until", "lock")
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        # Waiters are served in order so big requests aren't starved by small ones
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, units: float) -> float:
+        """
+        Wait until units are available and take them. Returns seconds waited.
+        A request bigger than the bucket (a batch) waits for a full bucket and
+        leaves it in debt, so the callers after it wait for the difference.
+        """
+        needed = min(units, self.capacity)
+        started = time.monotonic()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= needed:
+                    self.tokens -= units
+                    return time.monotonic() - started
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After is either a number of seconds or an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def rate_limit_reason(response: httpx.Response) -> Optional[str]:
+    """
+    The Gmail error reason of a rate-limit response, or None if it isn't one
+    """
+    if response.status_code not in (403, 429):
+        return None
+    try:
+        errors = response.json().get("error", {}).get("errors", [])
+        reason = errors[0].get("reason") if errors else None
+    except Exception:
+        reason = None
+    if response.status_code == 429:
+        return reason or "userRateLimitExceeded"
+    return reason if reason in RATE_LIMIT_REASONS else None
+
+
+class GmailRateLimiter:
+    def __init__(self, user_rate: float = GMAIL_USER_UNITS_PER_SECOND,
+                 global_rate: float = GMAIL_GLOBAL_UNITS_PER_SECOND,
+                 max_retries: int = GMAIL_MAX_RETRIES,
+                 backoff_base: float = GMAIL_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = GMAIL_BACKOFF_MAX_SECONDS):
+        self.user_rate = user_rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.global_bucket = TokenBucket(global_rate)
+        self.user_buckets: Dict[str, TokenBucket] = {}
+        self.units_used = Counter()
+        self.responses = Counter()
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = self.user_buckets[user_id] = TokenBucket(self.user_rate)
+        return bucket
+
+    def forget_user(self, user_id: str):
+        self.user_buckets.pop(user_id, None)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Full-jitter exponential backoff
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, user_id: str,
+                      quota_method: str, units: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        Send one Gmail API request within the quota, retrying rate limits and 5xx
+        (only rate limits and connect errors for NON_IDEMPOTENT_METHODS).
+        Non-retryable responses are returned as-is for the caller to handle.
+        units overrides the method's quota cost (batch requests pass the sum of their parts).
+        """
+        if units is None:
+            units = GMAIL_QUOTA_UNITS.get(quota_method, DEFAULT_QUOTA_UNITS)
+        user_bucket = self._user_bucket(user_id)
+        idempotent = quota_method not in NON_IDEMPOTENT_METHODS
+
+        for attempt in range(self.max_retries + 1):
+            waited = await self.global_bucket.acquire(units)
+            waited += await user_bucket.acquire(units)
+            self.throttled_seconds += waited
+            self.units_used[quota_method] += units
+
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, UNSENT_REQUEST_ERRORS)):
+                    raise
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"⏳ Gmail {quota_method} transport error for user {user_id} ({str(e)}), retrying in {delay:.1f}s")
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.responses[response.status_code] += 1
+            reason = rate_limit_reason(response)
+            if reason is None and (response.status_code < 500 or not idempotent):
+                return response
+
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = self.backoff_delay(attempt)
+
+            if reason is not None:
+                # Slow down every caller sharing the quota, not just this request
+                bucket = self.global_bucket if reason in PROJECT_LIMIT_REASONS else user_bucket
+                bucket.pause(delay)
+
+            if attempt >= self.max_retries:
+                if reason is not None:
+                    raise GmailRateLimitError(
+                        f"Gmail {quota_method} still rate limited ({reason}) after {attempt + 1} attempts",
+                        retry_after=max(delay, self.backoff_base)
+                    )
+                return response
+
+            logging.warning(
+                f"⏳ Gmail {quota_method} returned {response.status_code}"
+                f"{f' ({reason})' if reason else ''} for user {user_id}, retrying in {delay:.1f}s"
+            )
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "units_used": dict(self.units_used),
+            "responses": {str(code): count for code, count in self.responses.items()},
+            "retries": self.retries,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "tracked_users": len(self.user_buckets),
+            "paused_users": sum(1 for bucket in self.user_buckets.values() if bucket.paused_until > now),
+            "global_paused": self.global_bucket.paused_until > now,
+        }
+
+
+gmail_rate_limiter = GmailRateLimiter()
+
+
+async def gmail_request(client: httpx.AsyncClient, method: str, url: str, user_id: str,
+                        quota_method: str, units: Optional[float] = None, **kwargs) -> httpx.Response:
+    """
+    Shortcut for gmail_rate_limiter.request - use it for every Gmail API call
+    """
+    return await gmail_rate_limiter.request(client, method, url, user_id, quota_method, units=units, **kwargs)
@@ -0,0 +1,174 @@
+import os
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+
+from config import supabase
+from services.gmail_rate_limiter import gmail_request
+
+# ─── Incremental Gmail sync ──────────────────────────────────────────────────
+#
+# Every monitored user keeps a Gmail historyId cursor in users.gmail_history_id.
+# A sync cycle asks history.list for the messages added since that cursor, which
+# is one request when the inbox is quiet. With no cursor yet, or when Gmail says
+# the cursor is too old (404), we fall back to a full messages.list and start a
+# fresh cursor from the mailbox profile.
+#
+# Required column:
+#   alter table users add column if not exists gmail_history_id text;
+
+# Point at devtools/fake_gmail.py (e.g. http://localhost:8025) for local load tests
+GMAIL_API_BASE_URL = os.getenv("GMAIL_API_BASE_URL", "https://gmail.googleapis.com").rstrip("/")
+GMAIL_API_URL = f"{GMAIL_API_BASE_URL}/gmail/v1/users/me"
+
+# Labels that mean the message is not something we should reply to
+SKIPPED_LABELS = {"SENT", "DRAFT", "SPAM", "TRASH"}
+
+# Gmail tab labels outside of "Primary" (category:primary in the list query)
+NON_PRIMARY_CATEGORIES = {
+    "CATEGORY_SOCIAL",
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_UPDATES",
+    "CATEGORY_FORUMS",
+}
+
+
+def get_history_cursor(user_id: str) -> Optional[str]:
+    """
+    Get the stored Gmail historyId cursor for a user
+    """
+    try:
+        result = supabase.table("users").select("gmail_history_id").eq("id", user_id).execute()
+        if result.data:
+            return result.data[0].get("gmail_history_id")
+        return None
+    except Exception as e:
+        logging.error(f"Error fetching history cursor for user {user_id}: {str(e)}")
+        return None
+
+
+def save_history_cursor(user_id: str, history_id: str):
+    """
+    Persist the Gmail historyId cursor for a user
+    """
+    try:
+        supabase.table("users").update({
+            "gmail_history_id": str(history_id)
+        }).eq("id", user_id).execute()
+    except Exception as e:
+        logging.error(f"Error saving history cursor for user {user_id}: {str(e)}")
+
+
+def is_primary_inbox_message(label_ids: List[str]) -> bool:
+    """
+    Mirror the "category:primary" inbox filter for messages coming from history.list
+    """
+    labels = set(label_ids or [])
+    if "INBOX" not in labels:
+        return False
+    if labels & SKIPPED_LABELS:
+        return False
+    return not (labels & NON_PRIMARY_CATEGORIES)
+
+
+async def fetch_mailbox_history_id(client: httpx.AsyncClient, headers: dict, user_id: str) -> Optional[str]:
+    """
+    Get the mailbox's current historyId (used to start a fresh cursor)
+    """
+    r = await gmail_request(client, "GET", f"{GMAIL_API_URL}/profile", user_id, "getProfile", headers=headers)
+    if r.status_code != 200:
+        logging.error(f"Gmail profile error: {r.text}")
+        return None
+    return r.json().get("historyId")
+
+
+async def list_history_additions(client: httpx.AsyncClient, headers: dict, user_id: str,
+                                 start_history_id: str) -> Optional[Dict]:
+    """
+    List message ids added to the inbox since start_history_id.
+    Returns None when the cursor has expired and a full sync is needed.
+    """
+    message_ids: List[str] = []
+    latest_history_id = start_history_id
+    page_token = None
+
+    while True:
+        params = {
+            "startHistoryId": start_history_id,
+            "historyTypes": "messageAdded",
+            "labelId": "INBOX",
+            "maxResults": 500,
+        }
+        if page_token:
+            params["pageToken"] = page_token
+
+        r = await gmail_request(client, "GET", f"{GMAIL_API_URL}/history", user_id, "history.list",
+                                headers=headers, params=params)
+
+        if r.status_code == 404:
+            # historyId is older than Gmail keeps (roughly a week) - cursor expired
+            return None
+        if r.status_code != 200:
+            raise Exception(f"Gmail history error: {r.text}")
+
+        data = r.json()
+        latest_history_id = data.get("historyId", latest_history_id)
+
+        for record in data.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message = added.get("message", {})
+                msg_id = message.get("id")
+                if msg_id and msg_id not in message_ids and is_primary_inbox_message(message.get("labelIds", [])):
+                    message_ids.append(msg_id)
+
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            break
+
+    return {"message_ids": message_ids, "history_id": latest_history_id}
+
+
+async def list_inbox_message_ids(client: httpx.AsyncClient, headers: dict, user_id: str, query_params: dict) -> List[str]:
+    """
+    Full listing of the latest inbox messages (the pre-cursor behaviour)
+    """
+    r = await gmail_request(client, "GET", f"{GMAIL_API_URL}/messages", user_id, "messages.list",
+                            headers=headers, params=query_params)
+    if r.status_code != 200:
+        raise Exception(f"Gmail API error: {r.text}")
+    return [msg["id"] for msg in r.json().get("messages", [])]
+
+
+async def sync_new_message_ids(client: httpx.AsyncClient, headers: dict, user_id: str, query_params: dict) -> Dict:
+    """
+    Get the message ids that may be new for a user since the last sync.
+
+    Uses the stored historyId cursor when possible and falls back to a full
+    listing (query_params is passed to messages.list) when there is no cursor
+    or it has expired. The returned history_id should be saved with
+    save_history_cursor once the messages have been evaluated.
+    """
+    cursor = get_history_cursor(user_id)
+
+    if cursor:
+        additions = await list_history_additions(client, headers, user_id, cursor)
+        if additions is not None:
+            return {
+                "mode": "incremental",
+                "message_ids": additions["message_ids"],
+                "history_id": additions["history_id"],
+                "previous_history_id": cursor,
+            }
+        logging.info(f"History cursor expired for user {user_id}, falling back to full sync")
+
+    # Take the cursor before listing so nothing that arrives mid-listing is missed
+    history_id = await fetch_mailbox_history_id(client, headers, user_id)
+    message_ids = await list_inbox_message_ids(client, headers, user_id, query_params)
+
+    return {
+        "mode": "full",
+        "message_ids": message_ids,
+        "history_id": history_id,
+        "previous_history_id": cursor,
+    }
@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+# ─── Shared outbound HTTP clients ──────────────────────────────────────────────────
+#
+# One long-lived, pooled client per destination instead of a new AsyncClient (and a
+# new TCP+TLS handshake) per call. Google APIs use HTTP/2, so concurrent requests
+# share a single connection. Each profile has its own pool, which gives per-host
+# connection limits. Clients are created on first use and closed on app shutdown.
+#
+#   async with http_clients.borrow("gmail") as client:
+#       r = await client.get(...)
+#
+# borrow() never closes the client; it only tracks how many callers are using it.
+# A shared client also shares its cookie jar, so the "web" client, which fetches
+# sites on behalf of different users, doesn't keep cookies at all.
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+
+# Per-destination settings
+CLIENT_PROFILES = {
+    # gmail.googleapis.com - API calls and /batch
+    "gmail": {
+        "http2": True,
+        "limits": httpx.Limits(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                               max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                               keepalive_expiry=HTTP_KEEPALIVE_SECONDS),
+        "timeout": httpx.Timeout(30.0, connect=5.0, pool=10.0),
+    },
+    # oauth2.googleapis.com - token refresh and revoke
+    "oauth": {
+        "http2": True,
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=5,
+                               keepalive_expiry=HTTP_KEEPALIVE_SECONDS),
+        "timeout": httpx.Timeout(15.0, connect=5.0, pool=10.0),
+    },
+    # Arbitrary websites (brand scraping)
+    "web": {
+        "http2": False,
+        "follow_redirects": True,
+        # A policy that accepts no domain, so Set-Cookie is never stored
+        "cookies": CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=5, keepalive_expiry=15.0),
+        "timeout": httpx.Timeout(20.0),
+    },
+}
+
+
+class HttpClientRegistry:
+    def __init__(self, profiles: Optional[Dict[str, Dict]] = None):
+        self.profiles = profiles or CLIENT_PROFILES
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._borrowed = Counter()
+        self._requests = Counter()
+        self._errors = Counter()
+        self._created_at: Dict[str, float] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        The shared client for a profile (created on first use)
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            settings = dict(self.profiles[name])
+            transport = httpx.AsyncHTTPTransport(
+                http2=settings.pop("http2", False),
+                limits=settings.pop("limits", httpx.Limits()),
+                retries=0
+            )
+
+            async def count_request(request: httpx.Request, profile: str = name):
+                self._requests[profile] += 1
+
+            client = httpx.AsyncClient(transport=transport, event_hooks={"request": [count_request]}, **settings)
+            self._clients[name] = client
+            self._created_at[name] = time.time()
+        return client
+
+    @asynccontextmanager
+    async def borrow(self, name: str) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        Use the shared client in an async with block (it stays open afterwards)
+        """
+        client = self.get(name)
+        self._borrowed[name] += 1
+        try:
+            yield client
+        except httpx.TransportError:
+            self._errors[name] += 1
+            raise
+        finally:
+            self._borrowed[name] -= 1
+
+    async def aclose(self):
+        """
+        Close every client (app shutdown)
+        """
+        clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logging.error(f"Error closing HTTP client {name}: {str(e)}")
+
+    def _pool_stats(self, client: httpx.AsyncClient) -> Dict:
+        # httpx doesn't expose the pool; read it from httpcore defensively
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        http2 = sum(1 for conn in connections if "HTTP/2" in conn.info())
+        return {
+            "connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "http2_connections": http2,
+        }
+
+    def stats(self) -> Dict:
+        result = {}
+        for name in self.profiles:
+            client = self._clients.get(name)
+            entry = {
+                "open": client is not None and not client.is_closed,
+                "requests": self._requests[name],
+                "transport_errors": self._errors[name],
+                "borrowed_now": self._borrowed[name],
+            }
+            if entry["open"]:
+                entry["age_seconds"] = round(time.time() - self._created_at[name], 1)
+                try:
+                    entry.update(self._pool_stats(client))
+                except Exception as e:
+                    entry["pool_error"] = str(e)
+            result[name] = entry
+        return result
+
+
+http_clients = HttpClientRegistry()
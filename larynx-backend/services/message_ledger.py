@@ -0,0 +1,188 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+from config import supabase
+from services.write_behind import WriteBehindBuffer
+
+# ─── Message ledger ──────────────────────────────────────────────────
+#
+# One row per message we've evaluated for a user: drafted or filtered (and why).
+# Replaces asking drafts and filtered_emails separately, row by row:
+#   - lookup() checks a whole listing with one IN query
+#   - filter decisions go through a write-behind buffer and are written with one
+#     bulk upsert (for every user at once) at the end of a cycle, when
+#     WRITE_BEHIND_MAX_ROWS are waiting, every WRITE_BEHIND_FLUSH_SECONDS and on
+#     shutdown; until then (or while the database is down) lookups see them in memory
+# With MESSAGE_LEDGER_ENABLED=false the same calls go to the legacy tables
+# (drafts + filtered_emails), still one query/write per table per cycle.
+#
+# Required table (only with MESSAGE_LEDGER_ENABLED=true):
+#   create table email_message_ledger (
+#     user_id uuid not null references users(id) on delete cascade,
+#     message_id text not null,
+#     outcome text not null,              -- 'drafted' | 'filtered'
+#     reason text,                        -- filter reason
+#     sender text,
+#     subject text,
+#     first_seen_at timestamptz not null default now(),
+#     updated_at timestamptz not null default now(),
+#     primary key (user_id, message_id)   -- the composite index lookups use
+#   );
+#   create index email_message_ledger_outcome on email_message_ledger (user_id, outcome, updated_at desc);
+#
+# Backfill from the legacy tables:
+#   insert into email_message_ledger (user_id, message_id, outcome, first_seen_at, updated_at)
+#     select user_id, message_id, 'drafted', created_at, created_at from drafts
+#     where message_id is not null on conflict do nothing;
+#   insert into email_message_ledger (user_id, message_id, outcome, reason, sender, subject, first_seen_at, updated_at)
+#     select user_id, message_id, 'filtered', filter_reason, sender, subject, created_at, created_at
+#     from filtered_emails on conflict do nothing;
+
+MESSAGE_LEDGER_ENABLED = os.getenv("MESSAGE_LEDGER_ENABLED", "false").lower() in ("1", "true", "yes")
+MESSAGE_LEDGER_RETENTION_DAYS = int(os.getenv("MESSAGE_LEDGER_RETENTION_DAYS", "90"))
+
+LEDGER_TABLE = "email_message_ledger"
+LEGACY_TABLES = ("drafts", "filtered_emails")
+
+DRAFTED = "drafted"
+FILTERED = "filtered"
+
+PAGE_SIZE = 1000
+# Keep IN lists well inside PostgREST's URL length limit
+LOOKUP_CHUNK = 200
+
+
+class MessageLedger:
+    def __init__(self, enabled: bool = MESSAGE_LEDGER_ENABLED):
+        self.enabled = enabled
+        # Filter decisions waiting to be written, keyed by (user_id, message_id)
+        self.pending = WriteBehindBuffer("filtered email", self._write_filtered)
+        self.queries = 0
+        self.writes = 0
+        self.rows_written = 0
+
+    def _tables(self) -> tuple:
+        return (LEDGER_TABLE,) if self.enabled else LEGACY_TABLES
+
+    def lookup(self, user_id: str, message_ids: List[str]) -> Set[str]:
+        """
+        The subset of message_ids already evaluated (one IN query per table)
+        """
+        found: Set[str] = set()
+        for start in range(0, len(message_ids), LOOKUP_CHUNK):
+            remaining = message_ids[start:start + LOOKUP_CHUNK]
+            for table in self._tables():
+                if not remaining:
+                    break
+                result = supabase.table(table).select("message_id").eq("user_id", user_id) \
+                    .in_("message_id", remaining).execute()
+                self.queries += 1
+                found.update(row["message_id"] for row in result.data)
+                remaining = [message_id for message_id in remaining if message_id not in found]
+        # Decided but not written yet
+        if len(self.pending):
+            found.update(message_id for message_id in message_ids if (user_id, message_id) in self.pending)
+        return found
+
+    def load_user_ids(self, user_id: str) -> List[str]:
+        """
+        Every evaluated message id of a user, oldest first (paged)
+        """
+        order_column = "first_seen_at" if self.enabled else "created_at"
+        ids: List[str] = []
+        for table in self._tables():
+            start = 0
+            while True:
+                result = supabase.table(table).select("message_id").eq("user_id", user_id) \
+                    .order(order_column).range(start, start + PAGE_SIZE - 1).execute()
+                self.queries += 1
+                ids.extend(row["message_id"] for row in result.data if row.get("message_id"))
+                if len(result.data) < PAGE_SIZE:
+                    break
+                start += PAGE_SIZE
+        return ids
+
+    def record_filtered(self, user_id: str, message_id: str, reason: str, sender: str = "", subject: str = ""):
+        """
+        Queue a filter decision for the next bulk write
+        """
+        sender = sender[:255] if sender else ""  # Limit length
+        subject = subject[:255] if subject else ""  # Limit length
+        now = datetime.now(timezone.utc).isoformat()
+        if self.enabled:
+            row = {"user_id": user_id, "message_id": message_id, "outcome": FILTERED,
+                   "reason": reason, "sender": sender, "subject": subject, "updated_at": now}
+        else:
+            row = {"user_id": user_id, "message_id": message_id, "filter_reason": reason,
+                   "sender": sender, "subject": subject, "created_at": now}
+        self.pending.add((user_id, message_id), row)
+
+    def _write_filtered(self, rows: List[Dict]):
+        table = LEDGER_TABLE if self.enabled else "filtered_emails"
+        supabase.table(table).upsert(rows, on_conflict="user_id,message_id").execute()
+        self.writes += 1
+        self.rows_written += len(rows)
+        logging.info(f"Recorded {len(rows)} filtered emails")
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Write every queued filter decision as one bulk upsert
+        """
+        return self.pending.flush(force)
+
+    async def flush_loop(self):
+        await self.pending.flush_loop()
+
+    def record_drafted(self, user_id: str, message_id: str):
+        """
+        Mark a message as drafted (the drafts row itself is the record when the ledger is off)
+        """
+        if not self.enabled:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        supabase.table(LEDGER_TABLE).upsert({
+            "user_id": user_id, "message_id": message_id, "outcome": DRAFTED,
+            "reason": None, "updated_at": now
+        }, on_conflict="user_id,message_id").execute()
+        self.writes += 1
+        self.rows_written += 1
+        self.pending.discard((user_id, message_id))
+
+    def recent_filtered(self, user_id: str, limit: int = 20) -> List[Dict]:
+        """
+        Latest filter decisions, shaped like filtered_emails rows
+        """
+        if not self.enabled:
+            return supabase.table("filtered_emails").select("*").eq("user_id", user_id) \
+                .order("created_at", desc=True).limit(limit).execute().data
+        rows = supabase.table(LEDGER_TABLE).select("*").eq("user_id", user_id).eq("outcome", FILTERED) \
+            .order("updated_at", desc=True).limit(limit).execute().data
+        return [
+            {"user_id": row["user_id"], "message_id": row["message_id"], "filter_reason": row["reason"],
+             "sender": row.get("sender"), "subject": row.get("subject"), "created_at": row["updated_at"]}
+            for row in rows
+        ]
+
+    def purge(self, older_than: Optional[datetime] = None) -> int:
+        """
+        Drop ledger rows not touched in MESSAGE_LEDGER_RETENTION_DAYS
+        """
+        if not self.enabled:
+            return 0
+        older_than = older_than or datetime.now(timezone.utc) - timedelta(days=MESSAGE_LEDGER_RETENTION_DAYS)
+        result = supabase.table(LEDGER_TABLE).delete().lt("updated_at", older_than.isoformat()).execute()
+        return len(result.data or [])
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            **self.pending.stats(),
+            "queries": self.queries,
+            "writes": self.writes,
+            "rows_written": self.rows_written,
+        }
+
+
+message_ledger = MessageLedger()
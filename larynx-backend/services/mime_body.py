@@ -0,0 +1,136 @@
+import os
+import re
+import base64
+import logging
+from typing import Dict, Iterator, Optional, Tuple
+
+import lxml.html
+
+# ─── Email body extraction ──────────────────────────────────────────────────
+#
+# Gmail's format=full response already carries the parsed MIME tree (attachments
+# come back as attachmentIds, not data), so we walk that tree instead of fetching
+# format=raw and parsing the RFC 822 message ourselves.
+#   - the walk is depth-first and lazy: it stops at the first text/plain part, at
+#     any nesting depth (multipart/mixed > multipart/related > multipart/alternative)
+#   - only the selected part is base64-decoded, and only up to MIME_BODY_MAX_BYTES
+#   - attachments and forwarded messages (message/rfc822) are never decoded
+#   - HTML-only mail falls back to an lxml HTML-to-text conversion
+# Used by the inbox monitor and the onboarding crawl.
+
+MIME_BODY_MAX_BYTES = int(os.getenv("MIME_BODY_MAX_BYTES", "65536"))
+
+# Elements whose end should become a line break in the text version
+BLOCK_TAGS = {"p", "div", "br", "li", "tr", "table", "ul", "ol", "blockquote",
+              "h1", "h2", "h3", "h4", "h5", "h6", "pre", "hr"}
+
+CHARSET_RE = re.compile(r'charset\s*=\s*"?([\w.:-]+)"?', re.IGNORECASE)
+
+
+def _header(part: Dict, name: str) -> str:
+    name = name.lower()
+    return next((h["value"] for h in part.get("headers", []) if h["name"].lower() == name), "")
+
+
+def is_attachment(part: Dict) -> bool:
+    body = part.get("body", {})
+    return bool(
+        part.get("filename")
+        or body.get("attachmentId")
+        or _header(part, "Content-Disposition").lower().startswith("attachment")
+    )
+
+
+def iter_text_parts(part: Dict) -> Iterator[Dict]:
+    """
+    Inline text/plain and text/html leaves of a MIME tree, depth-first in order
+    """
+    mime_type = part.get("mimeType", "").lower()
+    if mime_type.startswith("multipart/"):
+        for child in part.get("parts", []) or []:
+            yield from iter_text_parts(child)
+    elif mime_type in ("text/plain", "text/html") and not is_attachment(part):
+        yield part
+
+
+def select_body_part(payload: Dict) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    (first text/plain part, first text/html part); stops walking at the first plain part
+    """
+    html_part = None
+    for part in iter_text_parts(payload):
+        if not part.get("body", {}).get("data"):
+            continue
+        if part["mimeType"].lower() == "text/plain":
+            return part, html_part
+        if html_part is None:
+            html_part = part
+    return None, html_part
+
+
+def decode_part(part: Dict, max_bytes: int = MIME_BODY_MAX_BYTES) -> str:
+    """
+    Decode a part's base64url data, at most max_bytes of it, in the part's charset
+    """
+    data = part.get("body", {}).get("data", "")
+    # 4 base64 characters hold 3 bytes; cut before decoding so big bodies aren't decoded in full
+    max_chars = -(-max_bytes // 3) * 4
+    if len(data) > max_chars:
+        data = data[:max_chars]
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))[:max_bytes]
+
+    match = CHARSET_RE.search(_header(part, "Content-Type"))
+    charset = match.group(1) if match else "utf-8"
+    try:
+        return raw.decode(charset, errors="ignore")
+    except LookupError:
+        return raw.decode("utf-8", errors="ignore")
+
+
+def html_to_text(html: str) -> str:
+    """
+    Readable plain text from an HTML body
+    """
+    if not html or not html.strip():
+        return ""
+    try:
+        doc = lxml.html.fromstring(html)
+    except Exception:
+        # Not parseable (or only a fragment lxml rejects) - strip tags crudely
+        return re.sub(r"<[^>]+>", " ", html)
+
+    for element in doc.xpath("//script | //style | //head | //title"):
+        element.drop_tree()
+    for element in doc.iter():
+        if isinstance(element.tag, str) and element.tag.lower() in BLOCK_TAGS:
+            element.tail = "\n" + (element.tail or "")
+
+    lines = [re.sub(r"[ \t ]+", " ", line).strip() for line in doc.text_content().splitlines()]
+    # Collapse runs of blank lines into one
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+    return text.strip()
+
+
+def extract_body_and_html(message: Dict, max_bytes: int = MIME_BODY_MAX_BYTES) -> Tuple[str, Optional[str]]:
+    """
+    (plain-text body, the HTML it was converted from or None when there was a text/plain part).
+    The bot detector counts links in the HTML - its hrefs are gone from the text.
+    """
+    payload = message.get("payload") or {}
+    try:
+        plain_part, html_part = select_body_part(payload)
+        if plain_part is not None:
+            return decode_part(plain_part, max_bytes), None
+        if html_part is not None:
+            html = decode_part(html_part, max_bytes)
+            return html_to_text(html), html
+    except Exception as e:
+        logging.error(f"Error extracting body of message {message.get('id')}: {str(e)}")
+    return "", None
+
+
+def extract_body(message: Dict, max_bytes: int = MIME_BODY_MAX_BYTES) -> str:
+    """
+    Plain-text body of a Gmail message (format=full), preferring text/plain over HTML
+    """
+    return extract_body_and_html(message, max_bytes)[0]
@@ -0,0 +1,196 @@
+import os
+import uuid
+import socket
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from config import supabase
+
+# ─── Monitoring ownership leases ──────────────────────────────────────────────────
+#
+# With several uvicorn workers or pods, each monitored user must be polled by
+# exactly one process. Every process registers itself in monitor_workers and
+# heartbeats. Users are spread over the live workers with rendezvous hashing,
+# and a user is only monitored by the process holding its lease row. Leases
+# expire when a process dies, so its users are picked up by the survivors on
+# their next heartbeat.
+#
+# Required tables:
+#   create table monitor_workers (
+#     worker_id text primary key,
+#     heartbeat_at timestamptz not null
+#   );
+#   create table monitor_leases (
+#     user_id uuid primary key references users(id) on delete cascade,
+#     owner_id text not null,
+#     expires_at timestamptz not null
+#   );
+
+MONITOR_LEASES_ENABLED = os.getenv("MONITOR_LEASES_ENABLED", "false").lower() in ("1", "true", "yes")
+LEASE_TTL_SECONDS = int(os.getenv("MONITOR_LEASE_TTL_SECONDS", "90"))
+LEASE_HEARTBEAT_SECONDS = int(os.getenv("MONITOR_LEASE_HEARTBEAT_SECONDS", "30"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    # "Z" suffix keeps the value safe inside PostgREST or=() filters
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def rendezvous_owner(user_id: str, workers: Iterable[str]) -> str:
+    """
+    Pick the worker that should own a user (highest random weight hashing).
+    Only users of a departed worker move when the worker set changes.
+    """
+    return max(
+        workers,
+        key=lambda worker_id: hashlib.sha1(f"{worker_id}:{user_id}".encode()).digest()
+    )
+
+
+class MonitorLeaseManager:
+    def __init__(self, worker_id: str = WORKER_ID, ttl_seconds: int = LEASE_TTL_SECONDS):
+        self.worker_id = worker_id
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.owned: Set[str] = set()
+        self.live_workers: List[str] = [worker_id]
+        self.renewed_at: Optional[datetime] = None
+
+    def owns(self, user_id: str) -> bool:
+        """
+        True if we hold the user's lease and our heartbeat is recent enough that
+        it can't have expired (a stalled heartbeat must stop monitoring)
+        """
+        if user_id not in self.owned or self.renewed_at is None:
+            return False
+        return _utc_now() - self.renewed_at < self.ttl
+
+    def _expiry(self) -> str:
+        return _iso(_utc_now() + self.ttl)
+
+    def register_worker(self) -> List[str]:
+        """
+        Heartbeat this worker and return the ids of all live workers
+        """
+        now = _utc_now()
+        supabase.table("monitor_workers").upsert({
+            "worker_id": self.worker_id,
+            "heartbeat_at": _iso(now)
+        }, on_conflict="worker_id").execute()
+
+        result = supabase.table("monitor_workers").select("worker_id").gt(
+            "heartbeat_at", _iso(now - self.ttl)
+        ).execute()
+        workers = sorted({row["worker_id"] for row in result.data} | {self.worker_id})
+        self.live_workers = workers
+        return workers
+
+    def try_claim(self, user_id: str) -> bool:
+        """
+        Claim a user's lease if it is free, expired, or already ours
+        """
+        now = _utc_now()
+        try:
+            # Take over an expired (or our own) lease - a single conditional UPDATE
+            result = supabase.table("monitor_leases").update({
+                "owner_id": self.worker_id,
+                "expires_at": self._expiry()
+            }).eq("user_id", user_id).or_(
+                f'owner_id.eq."{self.worker_id}",expires_at.lt.{_iso(now)}'
+            ).execute()
+
+            if not result.data:
+                # No lease row yet - insert one unless another worker just did
+                result = supabase.table("monitor_leases").upsert({
+                    "user_id": user_id,
+                    "owner_id": self.worker_id,
+                    "expires_at": self._expiry()
+                }, on_conflict="user_id", ignore_duplicates=True).execute()
+
+            if result.data:
+                self.owned.add(user_id)
+                if self.renewed_at is None:
+                    self.renewed_at = now
+                return True
+            return False
+        except Exception as e:
+            logging.error(f"Error claiming monitoring lease for user {user_id}: {str(e)}")
+            return False
+
+    def renew(self) -> Set[str]:
+        """
+        Extend every lease we hold in one write. Returns the users whose lease was lost.
+        """
+        renew_started = _utc_now()
+        if not self.owned:
+            self.renewed_at = renew_started
+            return set()
+        result = supabase.table("monitor_leases").update({
+            "expires_at": self._expiry()
+        }).eq("owner_id", self.worker_id).execute()
+
+        still_owned = {row["user_id"] for row in result.data}
+        lost = self.owned - still_owned
+        self.owned &= still_owned
+        self.renewed_at = renew_started
+        return lost
+
+    def release(self, user_id: str):
+        """
+        Give up a user's lease so another worker can take it immediately
+        """
+        self.owned.discard(user_id)
+        try:
+            supabase.table("monitor_leases").delete().eq("user_id", user_id).eq("owner_id", self.worker_id).execute()
+        except Exception as e:
+            logging.error(f"Error releasing monitoring lease for user {user_id}: {str(e)}")
+
+    def release_all(self):
+        """
+        Drop all our leases and our worker row (graceful shutdown)
+        """
+        self.owned.clear()
+        try:
+            supabase.table("monitor_leases").delete().eq("owner_id", self.worker_id).execute()
+            supabase.table("monitor_workers").delete().eq("worker_id", self.worker_id).execute()
+        except Exception as e:
+            logging.error(f"Error releasing monitoring leases: {str(e)}")
+
+    def rebalance(self, monitoring_user_ids: Iterable[str]) -> Dict[str, Set[str]]:
+        """
+        One heartbeat: renew our leases, hand off users that now hash to another
+        worker, and claim the users that hash to us (including orphans of dead workers).
+        Returns {"acquired": ..., "released": ...} so the caller can update its scheduler.
+        """
+        workers = self.register_worker()
+        released = self.renew()
+
+        monitoring = set(monitoring_user_ids)
+        desired = {user_id for user_id in monitoring if rendezvous_owner(user_id, workers) == self.worker_id}
+
+        # Users no longer monitored, or now belonging to another live worker
+        for user_id in list(self.owned - desired):
+            self.release(user_id)
+            released.add(user_id)
+
+        acquired = set()
+        for user_id in desired - self.owned:
+            if self.try_claim(user_id):
+                acquired.add(user_id)
+
+        return {"acquired": acquired, "released": released}
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": MONITOR_LEASES_ENABLED,
+            "worker_id": self.worker_id,
+            "live_workers": len(self.live_workers),
+            "owned_users": len(self.owned),
+        }
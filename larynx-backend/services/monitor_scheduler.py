@@ -0,0 +1,365 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.task_registry import MonitorTaskRegistry, MONITOR_DRAIN_SECONDS
+
+# ─── Central monitoring scheduler ──────────────────────────────────────────────────
+#
+# One dispatcher task keeps a heap of (due time, user) entries and hands due users
+# to a bounded pool of worker tasks that run one sync cycle each. Thousands of
+# monitored users cost a heap entry each instead of a never-ending coroutine.
+# Each cycle runs as its own task, tracked in a MonitorTaskRegistry so it can be
+# cancelled or drained.
+
+MONITOR_WORKERS = int(os.getenv("MONITOR_WORKERS", "10"))
+MONITOR_START_JITTER_SECONDS = float(os.getenv("MONITOR_START_JITTER_SECONDS", "30"))
+MONITOR_ERROR_RETRY_SECONDS = float(os.getenv("MONITOR_ERROR_RETRY_SECONDS", "60"))
+MONITOR_MAX_CONSECUTIVE_ERRORS = int(os.getenv("MONITOR_MAX_CONSECUTIVE_ERRORS", "3"))
+
+# Retry delay when a user comes due while its previous cycle is still running
+BUSY_RETRY_SECONDS = 5.0
+
+# run_cycle(user_id) returns seconds until the next cycle, or None to stop monitoring.
+# Exceptions of a transient_errors type (e.g. Gmail rate limiting) retry after their
+# retry_after attribute and never count towards giving up on a user.
+RunCycle = Callable[[str], Awaitable[Optional[float]]]
+GiveUp = Callable[[str], Awaitable[None]]
+
+
+class ScheduledUser:
+    __slots__ = ("user_id", "seq", "due_at", "queued", "consecutive_errors", "pending_trigger", "last_error",
+                 "last_started_at", "last_finished_at", "cycles")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.seq = 0
+        self.due_at = 0.0
+        # In the heap or the ready queue, waiting for a worker to take it
+        self.queued = False
+        self.consecutive_errors = 0
+        self.pending_trigger = False
+        self.last_error: Optional[str] = None
+        # Wall-clock liveness, reported by the watchdog
+        self.last_started_at: Optional[float] = None
+        self.last_finished_at: Optional[float] = None
+        self.cycles = 0
+
+
+class MonitorScheduler:
+    def __init__(self, run_cycle: RunCycle, on_give_up: Optional[GiveUp] = None,
+                 workers: int = MONITOR_WORKERS, start_jitter: float = MONITOR_START_JITTER_SECONDS,
+                 error_retry: float = MONITOR_ERROR_RETRY_SECONDS,
+                 max_consecutive_errors: int = MONITOR_MAX_CONSECUTIVE_ERRORS,
+                 tasks: Optional[MonitorTaskRegistry] = None,
+                 transient_errors: Tuple[type, ...] = ()):
+        self.run_cycle = run_cycle
+        self.on_give_up = on_give_up
+        self.workers = workers
+        self.start_jitter = start_jitter
+        self.error_retry = error_retry
+        self.max_consecutive_errors = max_consecutive_errors
+        self.transient_errors = transient_errors
+
+        self._seq = itertools.count(1)
+        self._heap: List[Tuple[float, int, str]] = []
+        self._entries: Dict[str, ScheduledUser] = {}
+        self.tasks = tasks or MonitorTaskRegistry()
+        self._ready: Optional[asyncio.Queue] = None
+        # Taken off the heap, waiting for room in the ready queue
+        self._handing_off: Optional[ScheduledUser] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._recent_lags = deque(maxlen=200)
+        self._cycles_run = 0
+
+    # ─── Lifecycle ──────────────────────────────────────────────────
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """
+        Start the dispatcher and worker pool (idempotent)
+        """
+        if self._tasks:
+            return
+        self.tasks.draining = False
+        # Bounded hand-off queue: when every worker is busy the dispatcher waits
+        self._ready = asyncio.Queue(maxsize=self.workers)
+        self._wakeup = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._dispatch(), name="monitor-dispatcher"))
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work(), name=f"monitor-worker-{i}"))
+        logging.info(f"🗓️ Monitor scheduler started with {self.workers} workers")
+
+    async def drain(self, timeout: float = MONITOR_DRAIN_SECONDS) -> Dict:
+        """
+        Stop starting new cycles and give running ones up to timeout seconds
+        to finish the email they are on. Leftovers are cancelled.
+        """
+        self.tasks.draining = True
+        for task in self._tasks:
+            if task.get_name() == "monitor-dispatcher":
+                task.cancel()
+        result = await self.tasks.drain(timeout)
+        logging.info(f"🗓️ Monitor drain finished: {result['drained']} cycles completed, {result['cancelled']} cancelled")
+        return result
+
+    async def stop(self):
+        """
+        Cancel the dispatcher, workers and any running cycle, and forget every scheduled user
+        """
+        self.tasks.draining = True
+        self.tasks.cancel_all()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._heap.clear()
+        self._entries.clear()
+        self._handing_off = None
+        logging.info("🗓️ Monitor scheduler stopped")
+
+    # ─── Scheduling API ──────────────────────────────────────────────────
+
+    def add_user(self, user_id: str, delay: Optional[float] = None) -> bool:
+        """
+        Start monitoring a user. With no delay the first cycle is jittered over
+        start_jitter seconds so restored users don't all hit Gmail at once.
+        Returns False if the user is already scheduled.
+        """
+        if user_id in self._entries:
+            return False
+        self.start()
+        entry = ScheduledUser(user_id)
+        self._entries[user_id] = entry
+        if delay is None:
+            delay = random.uniform(0, self.start_jitter)
+        self._schedule(entry, delay)
+        return True
+
+    def remove_user(self, user_id: str, cancel: bool = False) -> bool:
+        """
+        Stop scheduling a user. A cycle already running is allowed to finish
+        unless cancel is True.
+        """
+        removed = self._entries.pop(user_id, None) is not None
+        if cancel:
+            self.tasks.cancel(user_id)
+        return removed
+
+    def trigger(self, user_id: str) -> bool:
+        """
+        Run a user's next cycle as soon as possible (e.g. on a push notification).
+        Returns False if the user isn't scheduled in this process.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+        if self.tasks.is_running(user_id):
+            entry.pending_trigger = True
+        else:
+            self._schedule(entry, 0)
+        return True
+
+    def scheduled_users(self) -> List[str]:
+        return list(self._entries)
+
+    def _schedule(self, entry: ScheduledUser, delay: float):
+        loop = asyncio.get_running_loop()
+        entry.seq = next(self._seq)
+        entry.due_at = loop.time() + max(0.0, delay)
+        entry.pending_trigger = False
+        entry.queued = True
+        heapq.heappush(self._heap, (entry.due_at, entry.seq, entry.user_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def entries(self) -> List[ScheduledUser]:
+        return list(self._entries.values())
+
+    def _is_current(self, user_id: str, seq: int) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and entry.seq == seq
+
+    # ─── Dispatcher and workers ──────────────────────────────────────────────────
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+
+            while self._heap and self._heap[0][0] <= loop.time():
+                due_at, seq, user_id = heapq.heappop(self._heap)
+                if not self._is_current(user_id, seq):
+                    continue  # rescheduled or removed since it was pushed
+                self._handing_off = self._entries[user_id]
+                await self._ready.put((user_id, seq, due_at))
+                self._handing_off = None
+
+            timeout = self._heap[0][0] - loop.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            user_id, seq, due_at = await self._ready.get()
+            try:
+                if not self._is_current(user_id, seq) or self.tasks.draining:
+                    continue
+                entry = self._entries[user_id]
+                entry.queued = False
+
+                if self.tasks.is_running(user_id):
+                    # Re-added while the old cycle still runs - never run two at once
+                    self._schedule(entry, BUSY_RETRY_SECONDS)
+                    continue
+
+                self._recent_lags.append(loop.time() - due_at)
+                entry.last_started_at = time.time()
+                cycle = asyncio.create_task(self.run_cycle(user_id), name=f"monitor-cycle-{user_id}")
+                self.tasks.begin(user_id, cycle)
+                try:
+                    # asyncio.wait doesn't raise when the cycle itself gets cancelled
+                    await asyncio.wait({cycle})
+                except asyncio.CancelledError:
+                    cycle.cancel()
+                    raise
+                finally:
+                    self.tasks.end(user_id, cycle)
+                    self._cycles_run += 1
+                    entry.last_finished_at = time.time()
+                    entry.cycles += 1
+
+                if cycle.cancelled():
+                    if self._entries.get(user_id) is not entry or self.tasks.draining:
+                        continue  # stopped on purpose (/stop-monitoring or shutdown)
+                    # Cancelled while still scheduled (e.g. hung cycle killed by the watchdog)
+                    error = asyncio.TimeoutError("monitor cycle was cancelled while still scheduled")
+                else:
+                    error = cycle.exception()
+
+                if error is None:
+                    delay = cycle.result()
+                    entry.consecutive_errors = 0
+                    entry.last_error = None
+                elif isinstance(error, self.transient_errors):
+                    # Back-pressure, not a broken user - retry later without counting it
+                    entry.last_error = str(error)
+                    delay = getattr(error, "retry_after", self.error_retry) + random.uniform(0, self.start_jitter)
+                    logging.warning(f"⏳ Monitoring cycle for user {user_id} deferred {delay:.0f}s: {str(error)}")
+                else:
+                    entry.consecutive_errors += 1
+                    entry.last_error = str(error)
+                    logging.error(f"❌ Error in email monitoring for user {user_id} (attempt {entry.consecutive_errors}): {str(error)}")
+                    delay = self.error_retry
+                    if entry.consecutive_errors >= self.max_consecutive_errors:
+                        logging.error(f"🛑 Too many consecutive errors for user {user_id}, stopping monitoring")
+                        delay = None
+                        if self.on_give_up:
+                            await self.on_give_up(user_id)
+
+                if self._entries.get(user_id) is not entry:
+                    continue  # removed (or re-added) while running
+                if delay is None:
+                    self.remove_user(user_id)
+                    logging.info(f"🔴 STOPPED email monitoring for user {user_id}")
+                    continue
+                self._schedule(entry, 0 if entry.pending_trigger else delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Monitor worker error for user {user_id}: {str(e)}")
+            finally:
+                self._ready.task_done()
+
+    # ─── Self-healing (used by the watchdog) ──────────────────────────────────────
+
+    def heal(self) -> List[str]:
+        """
+        Restart the dispatcher or any worker task that died. Returns their names.
+        """
+        if not self._tasks or self.tasks.draining:
+            return []
+        restarted = []
+        for i, task in enumerate(self._tasks):
+            if not task.done():
+                continue
+            name = task.get_name()
+            error = None if task.cancelled() else task.exception()
+            logging.error(f"🩺 Monitor {name} died ({error!r}), restarting it")
+            if name == "monitor-dispatcher" and self._handing_off is not None:
+                # The user it was handing to the workers went down with it
+                self._handing_off.queued = False
+                self._handing_off = None
+            coro = self._dispatch() if name == "monitor-dispatcher" else self._work()
+            self._tasks[i] = asyncio.create_task(coro, name=name)
+            restarted.append(name)
+        if restarted and self._wakeup is not None:
+            self._wakeup.set()
+        return restarted
+
+    def reschedule_overdue(self, grace: float) -> List[str]:
+        """
+        Re-queue users that are more than grace seconds past due with neither a
+        running cycle nor a place in the heap or ready queue (lost with a dead
+        dispatcher or worker). Users just waiting behind busy workers keep their
+        place, and a user whose cycle is still running is never touched.
+        """
+        if not self._tasks or self.tasks.draining:
+            return []
+        now = asyncio.get_running_loop().time()
+        stuck = [
+            entry for entry in self._entries.values()
+            if not entry.queued and not self.tasks.is_running(entry.user_id) and now - entry.due_at > grace
+        ]
+        for entry in stuck:
+            self._schedule(entry, 0)
+        return [entry.user_id for entry in stuck]
+
+    def internal_tasks_alive(self) -> Dict[str, int]:
+        dispatcher = [t for t in self._tasks if t.get_name() == "monitor-dispatcher"]
+        workers = [t for t in self._tasks if t.get_name() != "monitor-dispatcher"]
+        return {
+            "dispatcher_alive": int(any(not t.done() for t in dispatcher)),
+            "workers_alive": sum(1 for t in workers if not t.done()),
+        }
+
+    # ─── Introspection ──────────────────────────────────────────────────
+
+    def stats(self) -> Dict:
+        """
+        Queue depth, lag and worker usage for the introspection endpoint
+        """
+        now = asyncio.get_running_loop().time() if self._tasks else 0.0
+        overdue = [
+            now - entry.due_at for entry in self._entries.values()
+            if not self.tasks.is_running(entry.user_id) and entry.due_at <= now
+        ]
+        lags = list(self._recent_lags)
+        return {
+            "started": self.started,
+            "workers": self.workers,
+            "scheduled_users": len(self._entries),
+            "running_cycles": self.tasks.running_count(),
+            "draining": self.tasks.draining,
+            "ready_queue_depth": self._ready.qsize() if self._ready else 0,
+            "heap_size": len(self._heap),
+            "overdue_users": len(overdue),
+            "max_overdue_seconds": round(max(overdue), 3) if overdue else 0.0,
+            "avg_start_lag_seconds": round(sum(lags) / len(lags), 3) if lags else 0.0,
+            "max_start_lag_seconds": round(max(lags), 3) if lags else 0.0,
+            "cycles_run": self._cycles_run,
+            "users_with_errors": sum(1 for entry in self._entries.values() if entry.consecutive_errors),
+        }
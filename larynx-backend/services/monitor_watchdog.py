@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional
+
+from services.monitor_scheduler import MonitorScheduler
+
+# ─── Monitoring watchdog ──────────────────────────────────────────────────
+#
+# Checks the scheduler's own tasks every few seconds instead of scanning the users
+# table for stale last_email_check values:
+#   - restarts a dispatcher or worker task that died
+#   - cancels cycles running longer than MONITOR_CYCLE_TIMEOUT_SECONDS (the scheduler
+#     retries them and counts it as an error)
+#   - re-queues users long past due with no running cycle
+#   - schedules users that should be monitored here but aren't
+# A user with a live cycle is never started twice.
+
+WATCHDOG_INTERVAL_SECONDS = float(os.getenv("MONITOR_WATCHDOG_INTERVAL_SECONDS", "10"))
+MONITOR_CYCLE_TIMEOUT_SECONDS = float(os.getenv("MONITOR_CYCLE_TIMEOUT_SECONDS", "900"))
+WATCHDOG_OVERDUE_GRACE_SECONDS = float(os.getenv("MONITOR_WATCHDOG_OVERDUE_SECONDS", "300"))
+
+
+class MonitorWatchdog:
+    def __init__(self, scheduler: MonitorScheduler,
+                 expected_users: Optional[Callable[[], Iterable[str]]] = None,
+                 interval: float = WATCHDOG_INTERVAL_SECONDS,
+                 cycle_timeout: float = MONITOR_CYCLE_TIMEOUT_SECONDS,
+                 overdue_grace: float = WATCHDOG_OVERDUE_GRACE_SECONDS):
+        self.scheduler = scheduler
+        # Users this process should be monitoring right now (from in-memory state)
+        self.expected_users = expected_users
+        self.interval = interval
+        self.cycle_timeout = cycle_timeout
+        self.overdue_grace = overdue_grace
+        self.last_run_at: Optional[float] = None
+        self.counters = {"restarted_tasks": 0, "hung_cycles_cancelled": 0,
+                         "overdue_rescheduled": 0, "missing_users_added": 0}
+
+    def check(self) -> Dict:
+        """
+        One watchdog pass. Returns what it fixed.
+        """
+        scheduler = self.scheduler
+        actions = {"restarted": [], "hung": [], "overdue": [], "added": []}
+        if not scheduler.started or scheduler.tasks.draining:
+            self.last_run_at = time.time()
+            return actions
+
+        actions["restarted"] = scheduler.heal()
+
+        now = time.time()
+        for state in list(scheduler.tasks.snapshot()):
+            if state["running_for_seconds"] > self.cycle_timeout and not state["cancel_requested"]:
+                logging.error(f"🩺 Monitor cycle for user {state['user_id']} running for {state['running_for_seconds']:.0f}s, cancelling it")
+                scheduler.tasks.cancel(state["user_id"])
+                actions["hung"].append(state["user_id"])
+
+        actions["overdue"] = scheduler.reschedule_overdue(self.overdue_grace)
+        for user_id in actions["overdue"]:
+            logging.warning(f"🩺 User {user_id} was overdue with no running cycle, re-queued")
+
+        if self.expected_users is not None:
+            for user_id in self.expected_users():
+                if scheduler.add_user(user_id, delay=0):
+                    logging.warning(f"🩺 User {user_id} should be monitored but wasn't scheduled, added")
+                    actions["added"].append(user_id)
+
+        self.counters["restarted_tasks"] += len(actions["restarted"])
+        self.counters["hung_cycles_cancelled"] += len(actions["hung"])
+        self.counters["overdue_rescheduled"] += len(actions["overdue"])
+        self.counters["missing_users_added"] += len(actions["added"])
+        self.last_run_at = now
+        return actions
+
+    async def run(self):
+        """
+        Watchdog loop
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Error in monitor watchdog: {str(e)}")
+
+    def liveness(self, include_users: bool = False) -> Dict:
+        """
+        Health summary; healthy means the scheduler loop is alive, nothing hung and
+        the watchdog itself ran recently
+        """
+        scheduler = self.scheduler
+        now = time.time()
+        alive = scheduler.internal_tasks_alive()
+        running = scheduler.tasks.snapshot()
+        entries = scheduler.entries()
+        stats = scheduler.stats()
+
+        oldest_running = max((state["running_for_seconds"] for state in running), default=0.0)
+        never_finished = sum(1 for entry in entries if entry.last_finished_at is None)
+        watchdog_age = now - self.last_run_at if self.last_run_at else None
+
+        healthy = (
+            not scheduler.started
+            or scheduler.tasks.draining
+            or (
+                alive["dispatcher_alive"] == 1
+                and alive["workers_alive"] == scheduler.workers
+                and oldest_running <= self.cycle_timeout
+                and watchdog_age is not None
+                and watchdog_age <= self.interval * 3
+            )
+        )
+
+        result = {
+            "healthy": healthy,
+            "scheduler_started": scheduler.started,
+            "draining": scheduler.tasks.draining,
+            **alive,
+            "workers": scheduler.workers,
+            "scheduled_users": len(entries),
+            "running_cycles": len(running),
+            "oldest_running_cycle_seconds": oldest_running,
+            "overdue_users": stats["overdue_users"],
+            "max_overdue_seconds": stats["max_overdue_seconds"],
+            "users_never_finished_a_cycle": never_finished,
+            "users_with_errors": stats["users_with_errors"],
+            "watchdog_last_run_seconds_ago": round(watchdog_age, 1) if watchdog_age is not None else None,
+            **self.counters,
+        }
+        if include_users:
+            result["users"] = [
+                {
+                    "user_id": entry.user_id,
+                    "running": scheduler.tasks.is_running(entry.user_id),
+                    "cycles": entry.cycles,
+                    "last_started_seconds_ago": round(now - entry.last_started_at, 1) if entry.last_started_at else None,
+                    "last_finished_seconds_ago": round(now - entry.last_finished_at, 1) if entry.last_finished_at else None,
+                    "consecutive_errors": entry.consecutive_errors,
+                    "last_error": entry.last_error,
+                }
+                for entry in entries
+            ]
+        return result
@@ -0,0 +1,56 @@
+import os
+import time
+from collections import deque
+from typing import Optional
+
+# ─── Adaptive per-user poll interval ──────────────────────────────────────────────────
+#
+# Busy inboxes are polled often, quiet ones back off exponentially, so Gmail and
+# Supabase load follows real traffic instead of the number of monitored users.
+
+MONITOR_MIN_INTERVAL_SECONDS = float(os.getenv("MONITOR_MIN_INTERVAL_SECONDS", "60"))
+MONITOR_MAX_INTERVAL_SECONDS = float(os.getenv("MONITOR_MAX_INTERVAL_SECONDS", "1800"))
+MONITOR_BACKOFF_FACTOR = float(os.getenv("MONITOR_BACKOFF_FACTOR", "2.0"))
+
+# How many recent arrivals are used to estimate a user's mail rate
+ARRIVAL_HISTORY_SIZE = 20
+
+
+class AdaptivePollInterval:
+    __slots__ = ("interval", "floor", "ceiling", "backoff", "arrivals")
+
+    def __init__(self, initial: float, floor: float = MONITOR_MIN_INTERVAL_SECONDS,
+                 ceiling: float = MONITOR_MAX_INTERVAL_SECONDS, backoff: float = MONITOR_BACKOFF_FACTOR):
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.backoff = backoff
+        self.interval = self._clamp(initial)
+        self.arrivals = deque(maxlen=ARRIVAL_HISTORY_SIZE)
+
+    def _clamp(self, seconds: float) -> float:
+        return min(self.ceiling, max(self.floor, seconds))
+
+    def typical_gap(self) -> Optional[float]:
+        """
+        Average seconds between recent cycles that found new mail
+        """
+        if len(self.arrivals) < 2:
+            return None
+        return (self.arrivals[-1] - self.arrivals[0]) / (len(self.arrivals) - 1)
+
+    def record_cycle(self, new_emails: int, now: Optional[float] = None) -> float:
+        """
+        Update the interval after a cycle and return it.
+        New mail shortens the interval to half the typical gap between arrivals
+        (the floor until there is enough history); a quiet cycle backs off.
+        """
+        now = time.time() if now is None else now
+
+        if new_emails > 0:
+            self.arrivals.append(now)
+            gap = self.typical_gap()
+            self.interval = self._clamp(gap / 2 if gap is not None else self.floor)
+        else:
+            self.interval = self._clamp(self.interval * self.backoff)
+
+        return self.interval
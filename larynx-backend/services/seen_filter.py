@@ -0,0 +1,115 @@
+import os
+import logging
+from typing import Dict, Iterable, List, Union
+
+from services.message_ledger import message_ledger
+
+# ─── Seen-message filter ──────────────────────────────────────────────────
+#
+# Every cycle lists up to 50 message ids and used to ask both drafts and
+# filtered_emails about each one. The filter keeps each monitored user's seen ids
+# in memory:
+#   - warmed once per user from the message ledger (paged reads of message_id only)
+#   - updated whenever we store a draft or mark an email as filtered
+#   - a hit is answered from memory; only misses are checked in the ledger (one
+#     IN query), so mail recorded by another worker is still caught
+# Sets are capped at SEEN_FILTER_MAX_PER_USER ids (oldest dropped first) - Gmail
+# only ever lists the newest mail, so old ids are never asked about again.
+
+SEEN_FILTER_MAX_PER_USER = int(os.getenv("SEEN_FILTER_MAX_PER_USER", "20000"))
+
+SeenKey = Union[int, str]
+
+
+def seen_key(message_id: str) -> SeenKey:
+    """
+    Gmail ids are 16 hex digits - keep them as ints, which take half the memory of str
+    """
+    try:
+        return int(message_id, 16)
+    except ValueError:
+        return message_id
+
+
+class SeenMessageFilter:
+    def __init__(self, max_per_user: int = SEEN_FILTER_MAX_PER_USER):
+        self.max_per_user = max_per_user
+        # Dicts as insertion-ordered sets so the oldest ids are dropped first
+        self._seen: Dict[str, Dict[SeenKey, None]] = {}
+        self.hits = 0
+        self.db_checks = 0
+        self.db_hits = 0
+        self.warm_reads = 0
+
+    def _remember(self, user_id: str, message_ids: Iterable[str]):
+        seen = self._seen.get(user_id)
+        if seen is None:
+            return
+        for message_id in message_ids:
+            seen[seen_key(message_id)] = None
+        while len(seen) > self.max_per_user:
+            del seen[next(iter(seen))]
+
+    def warm(self, user_id: str) -> bool:
+        """
+        Load every message id we've already drafted or filtered for a user
+        """
+        try:
+            ids = message_ledger.load_user_ids(user_id)
+            self.warm_reads += 1
+        except Exception as e:
+            logging.error(f"Error warming seen-message filter for user {user_id}: {str(e)}")
+            return False
+
+        self._seen[user_id] = {}
+        self._remember(user_id, ids)
+        logging.info(f"Seen-message filter for user {user_id} warmed with {len(self._seen[user_id])} ids")
+        return True
+
+    def filter_unseen(self, user_id: str, message_ids: List[str]) -> List[str]:
+        """
+        The ids we haven't evaluated yet (processed OR filtered), in their original order
+        """
+        if user_id not in self._seen and not self.warm(user_id):
+            seen = None
+        else:
+            seen = self._seen[user_id]
+
+        misses = message_ids if seen is None else [m for m in message_ids if seen_key(m) not in seen]
+        self.hits += len(message_ids) - len(misses)
+        if not misses:
+            return []
+
+        try:
+            found = message_ledger.lookup(user_id, misses)
+            self.db_checks += 1
+        except Exception as e:
+            logging.error(f"Error checking if emails already seen: {str(e)}")
+            return misses
+
+        if found:
+            self.db_hits += len(found)
+            self._remember(user_id, found)
+        return [message_id for message_id in misses if message_id not in found]
+
+    def mark_seen(self, user_id: str, message_id: str):
+        """
+        Record a message we just drafted or filtered
+        """
+        self._remember(user_id, [message_id])
+
+    def forget(self, user_id: str):
+        self._seen.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._seen),
+            "ids": sum(len(seen) for seen in self._seen.values()),
+            "hits": self.hits,
+            "db_checks": self.db_checks,
+            "db_hits": self.db_hits,
+            "warm_reads": self.warm_reads,
+        }
+
+
+seen_filter = SeenMessageFilter()
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+# ─── Monitoring task registry ──────────────────────────────────────────────────
+#
+# Holds the asyncio task of every running monitor cycle together with what it is
+# doing, so a user's cycle can be cancelled on /stop-monitoring and shutdown can
+# let in-flight emails finish instead of dropping them half-processed.
+
+MONITOR_DRAIN_SECONDS = float(os.getenv("MONITOR_DRAIN_SECONDS", "25"))
+
+
+class MonitorTaskState:
+    __slots__ = ("user_id", "task", "started_at", "current_message_id", "emails_total",
+                 "emails_done", "cancel_requested")
+
+    def __init__(self, user_id: str, task: asyncio.Task):
+        self.user_id = user_id
+        self.task = task
+        self.started_at = time.time()
+        self.current_message_id: Optional[str] = None
+        self.emails_total = 0
+        self.emails_done = 0
+        self.cancel_requested = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "running_for_seconds": round(time.time() - self.started_at, 1),
+            "current_message_id": self.current_message_id,
+            "emails_done": self.emails_done,
+            "emails_total": self.emails_total,
+            "cancel_requested": self.cancel_requested,
+        }
+
+
+class MonitorTaskRegistry:
+    def __init__(self):
+        self._states: Dict[str, MonitorTaskState] = {}
+        self.draining = False
+
+    # ─── Bookkeeping used by the scheduler ──────────────────────────────────────
+
+    def begin(self, user_id: str, task: asyncio.Task) -> MonitorTaskState:
+        state = MonitorTaskState(user_id, task)
+        self._states[user_id] = state
+        return state
+
+    def end(self, user_id: str, task: asyncio.Task):
+        state = self._states.get(user_id)
+        if state is not None and state.task is task:
+            del self._states[user_id]
+
+    def is_running(self, user_id: str) -> bool:
+        return user_id in self._states
+
+    def get(self, user_id: str) -> Optional[MonitorTaskState]:
+        return self._states.get(user_id)
+
+    def running_count(self) -> int:
+        return len(self._states)
+
+    # ─── Progress reporting used by the monitor cycle ──────────────────────────────
+
+    def start_batch(self, user_id: str, total: int):
+        state = self._states.get(user_id)
+        if state:
+            state.emails_total = total
+
+    def set_current_email(self, user_id: str, message_id: str):
+        state = self._states.get(user_id)
+        if state:
+            state.current_message_id = message_id
+
+    def finish_email(self, user_id: str):
+        state = self._states.get(user_id)
+        if state:
+            state.current_message_id = None
+            state.emails_done += 1
+
+    def should_continue(self, user_id: str) -> bool:
+        """
+        False once the cycle should stop picking up new emails (shutdown drain or cancel)
+        """
+        if self.draining:
+            return False
+        state = self._states.get(user_id)
+        return not (state and state.cancel_requested)
+
+    # ─── Cancellation and drain ──────────────────────────────────────────────────
+
+    def cancel(self, user_id: str) -> bool:
+        """
+        Cancel a user's running cycle right away
+        """
+        state = self._states.get(user_id)
+        if state is None or state.task.done():
+            return False
+        state.cancel_requested = True
+        state.task.cancel()
+        logging.info(f"🛑 Cancelled running monitor cycle for user {user_id}")
+        return True
+
+    def cancel_all(self) -> int:
+        return sum(1 for user_id in list(self._states) if self.cancel(user_id))
+
+    async def drain(self, timeout: float = MONITOR_DRAIN_SECONDS) -> Dict:
+        """
+        Let running cycles finish the email they are on, up to timeout seconds,
+        then cancel whatever is left. Cycles stop picking up new emails meanwhile.
+        """
+        self.draining = True
+        tasks = [state.task for state in self._states.values() if not state.task.done()]
+        if not tasks:
+            return {"drained": 0, "cancelled": 0}
+
+        logging.info(f"⏳ Draining {len(tasks)} in-flight monitor cycles (up to {timeout:.0f}s)...")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending, timeout=5)
+
+        return {"drained": len(done), "cancelled": len(pending)}
+
+    def snapshot(self) -> List[Dict]:
+        return [state.to_dict() for state in self._states.values()]
@@ -0,0 +1,152 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from config import supabase
+
+# ─── In-process monitoring state ──────────────────────────────────────────────────
+#
+# Monitor cycles used to read users.is_monitoring, write users.last_email_check and
+# read users.created_at on every pass. The registry keeps that per-user bookkeeping
+# in memory: rows are loaded once (in bulk at startup), dropped when monitoring is
+# started or stopped, and last-check heartbeats are written for all users at once
+# every USER_STATE_FLUSH_SECONDS.
+# A stop handled by another worker only changes the database, so the monitoring
+# flags are reloaded periodically too: by the lease heartbeat when leases are on,
+# otherwise by heartbeat_loop() along with each flush.
+
+USER_STATE_FLUSH_SECONDS = int(os.getenv("USER_STATE_FLUSH_SECONDS", "60"))
+
+STATE_COLUMNS = "id, is_monitoring, created_at, monitoring_started_at, last_email_check"
+
+
+def parse_db_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Supabase timestamps may come without timezone info - they are UTC
+    """
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+class UserState:
+    __slots__ = ("user_id", "is_monitoring", "created_at", "monitoring_started_at", "last_check")
+
+    def __init__(self, row: Dict):
+        self.user_id = row["id"]
+        self.is_monitoring = bool(row.get("is_monitoring"))
+        self.created_at = parse_db_timestamp(row.get("created_at"))
+        self.monitoring_started_at = row.get("monitoring_started_at")
+        self.last_check = parse_db_timestamp(row.get("last_email_check"))
+
+
+class UserStateRegistry:
+    def __init__(self):
+        self._states: Dict[str, UserState] = {}
+        self._dirty: Set[str] = set()
+        self.reads = 0
+        self.flushes = 0
+
+    def load_monitoring_users(self) -> List[UserState]:
+        """
+        Load every monitored user in one query (startup / lease or state heartbeat)
+        """
+        result = supabase.table("users").select(STATE_COLUMNS).eq("is_monitoring", True).execute()
+        self.reads += 1
+        states = [UserState(row) for row in result.data]
+        for state in states:
+            # Keep a newer in-memory heartbeat over the last flushed one
+            cached = self._states.get(state.user_id)
+            if cached and cached.last_check and (not state.last_check or cached.last_check > state.last_check):
+                state.last_check = cached.last_check
+            self._states[state.user_id] = state
+
+        # Users not in the result were stopped elsewhere (another worker or pod)
+        monitoring = {state.user_id for state in states}
+        for user_id, state in self._states.items():
+            if user_id not in monitoring:
+                state.is_monitoring = False
+        return states
+
+    def get(self, user_id: str) -> Optional[UserState]:
+        """
+        Cached state for a user, loaded from the database on a miss
+        """
+        state = self._states.get(user_id)
+        if state is not None:
+            return state
+
+        result = supabase.table("users").select(STATE_COLUMNS).eq("id", user_id).execute()
+        self.reads += 1
+        if not result.data:
+            return None
+        state = self._states[user_id] = UserState(result.data[0])
+        return state
+
+    def invalidate(self, user_id: str):
+        """
+        Forget a user's cached row (after /start-monitoring or /stop-monitoring wrote it)
+        """
+        self._states.pop(user_id, None)
+        self._dirty.discard(user_id)
+
+    def monitoring_user_ids(self) -> List[str]:
+        """
+        Users the cache says are being monitored
+        """
+        return [user_id for user_id, state in self._states.items() if state.is_monitoring]
+
+    def touch(self, user_id: str):
+        """
+        Record a monitoring heartbeat; written to the database on the next flush
+        """
+        state = self._states.get(user_id)
+        if state is not None:
+            state.last_check = datetime.now(timezone.utc)
+        self._dirty.add(user_id)
+
+    def flush(self) -> int:
+        """
+        Write all pending heartbeats as a single UPDATE ... WHERE id IN (...)
+        """
+        if not self._dirty:
+            return 0
+        user_ids, self._dirty = list(self._dirty), set()
+        try:
+            supabase.table("users").update({
+                "last_email_check": datetime.utcnow().isoformat()
+            }).in_("id", user_ids).execute()
+            self.flushes += 1
+            return len(user_ids)
+        except Exception as e:
+            # Put them back for the next flush
+            self._dirty.update(user_ids)
+            logging.error(f"Error flushing monitoring heartbeats for {len(user_ids)} users: {str(e)}")
+            return 0
+
+    async def heartbeat_loop(self, interval: float = USER_STATE_FLUSH_SECONDS, refresh: bool = False):
+        """
+        Flush heartbeats every interval seconds, and reload the monitoring flags
+        too when refresh is set (nothing else picks up stops made on other workers)
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+            if refresh:
+                try:
+                    self.load_monitoring_users()
+                except Exception as e:
+                    logging.error(f"Error refreshing monitoring flags: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {
+            "cached_users": len(self._states),
+            "pending_heartbeats": len(self._dirty),
+            "reads": self.reads,
+            "flushes": self.flushes,
+        }
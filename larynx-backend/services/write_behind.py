@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Hashable, List, Optional
+
+# ─── Write-behind buffer ──────────────────────────────────────────────────
+#
+# Collects rows in memory and writes them with one bulk call instead of one call
+# per row. A flush happens when the caller asks (end of a monitoring cycle), when
+# WRITE_BEHIND_MAX_ROWS rows are waiting, every WRITE_BEHIND_FLUSH_SECONDS from
+# flush_loop(), and on shutdown. Rows are keyed, so a newer row for the same key
+# replaces the older one. A failed write keeps its rows for the next flush (and
+# they stay visible through get()/__contains__ meanwhile), so nothing is lost
+# while the database is unreachable; after a failure only the timer and shutdown
+# try again, so a database outage doesn't turn into a write per cycle.
+
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "500"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "10"))
+# Past this many waiting rows (the database has been down a while) we start warning
+WRITE_BEHIND_WARN_ROWS = int(os.getenv("WRITE_BEHIND_WARN_ROWS", "20000"))
+
+
+class WriteBehindBuffer:
+    def __init__(self, name: str, write_rows: Callable[[List[Dict]], None],
+                 max_rows: int = WRITE_BEHIND_MAX_ROWS,
+                 flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS):
+        self.name = name
+        # Writes a list of rows in one call; raises on failure
+        self.write_rows = write_rows
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        self._rows: Dict[Hashable, Dict] = {}
+        self.last_flush_at = time.monotonic()
+        self._retry_at = 0.0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        return self._rows.get(key)
+
+    def add(self, key: Hashable, row: Dict):
+        """
+        Queue a row; flushes right away once max_rows are waiting
+        """
+        self._rows.pop(key, None)
+        self._rows[key] = row
+        if len(self._rows) >= self.max_rows:
+            self.flush()
+
+    def discard(self, key: Hashable):
+        self._rows.pop(key, None)
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Write everything waiting as one bulk call. Returns rows written.
+        Skipped for flush_seconds after a failed write unless forced.
+        """
+        if not self._rows or (not force and time.monotonic() < self._retry_at):
+            return 0
+        rows, self._rows = self._rows, {}
+        try:
+            self.write_rows(list(rows.values()))
+        except Exception as e:
+            # Put them back under anything queued since (which is newer)
+            rows.update(self._rows)
+            self._rows = rows
+            self.failed_flushes += 1
+            self._retry_at = time.monotonic() + self.flush_seconds
+            logging.error(f"Error writing {len(rows)} buffered {self.name} rows, keeping them for the next flush: {str(e)}")
+            if len(rows) >= WRITE_BEHIND_WARN_ROWS:
+                logging.warning(f"⚠️ {len(rows)} {self.name} rows waiting in memory")
+            return 0
+        self.last_flush_at = time.monotonic()
+        self._retry_at = 0.0
+        self.flushes += 1
+        self.rows_written += len(rows)
+        return len(rows)
+
+    async def flush_loop(self):
+        """
+        Flush at least every flush_seconds
+        """
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            if self._rows and time.monotonic() - self.last_flush_at >= self.flush_seconds:
+                self.flush(force=True)
+
+    def stats(self) -> Dict:
+        return {
+            "pending_rows": len(self._rows),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rows_written": self.rows_written,
+            "seconds_since_flush": round(time.monotonic() - self.last_flush_at, 1),
+        }